@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+""" Compares the CPU time of walking the boards of long games by calling
+    node.board() for every move versus pushing moves onto a single board
+"""
+
+import argparse
+import random
+import time
+
+import chess
+import chess.pgn
+
+
+def random_game(n_plies, seed) -> chess.pgn.Game:
+    """ A game of up to n_plies random legal moves
+    """
+    rng = random.Random(seed)
+    game = chess.pgn.Game()
+    node = game
+    board = chess.Board()
+    while board.ply() < n_plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        board.push(move)
+        node = node.add_variation(move)
+    return game
+
+
+def walk_with_node_boards(game) -> int:
+    """ How find_puzzle_candidates used to walk a game
+    """
+    n = 0
+    node = game
+    while not node.is_end():
+        next_node = node.variation(0)
+        next_board = next_node.board()
+        board = node.board()
+        n += len(next_board.move_stack) - len(board.move_stack)
+        node = next_node
+    return n
+
+
+def walk_with_one_board(game) -> int:
+    """ How find_puzzle_candidates walks a game now
+    """
+    n = 0
+    board = game.board()
+    for node in game.mainline():
+        board.push(node.move)
+        board.pop()
+        n += 1
+        board.push(node.move)
+    return n
+
+
+def bench(walk, games) -> float:
+    start = time.process_time()
+    for game in games:
+        walk(game)
+    return time.process_time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=20,
+                        help="number of games to walk")
+    parser.add_argument("--plies", type=int, default=300,
+                        help="maximum length of each game in plies")
+    settings = parser.parse_args()
+
+    games = [random_game(settings.plies, seed) for seed in range(settings.games)]
+    n_plies = sum(game.end().ply() for game in games)
+    print("%d games, %d plies" % (len(games), n_plies))
+    for walk in [walk_with_node_boards, walk_with_one_board]:
+        seconds = bench(walk, games)
+        print("%-24s %8.3fs  %8.1f us/ply" % (
+            walk.__name__, seconds, 1e6 * seconds / n_plies
+        ))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+""" Compares the CPU time of the per-ply logging in find_puzzle_candidates
+    and PuzzlePosition with debug messages disabled (as with --quiet),
+    formatting messages eagerly versus lazily
+
+    PYTHONPATH=. python benchmarks/bench_logging.py
+"""
+
+import argparse
+import logging
+import random
+import re
+import time
+
+import chess
+from chess.engine import Cp
+
+from puzzlemaker.colors import Color
+from puzzlemaker.logger import configure_logging, log, log_board, log_move, log_enabled
+from puzzlemaker.utils import fullmove_string, material_difference
+
+
+def random_boards(n_plies, seed):
+    """ (board, move) for each ply of a game of random legal moves
+    """
+    rng = random.Random(seed)
+    board = chess.Board()
+    plies = []
+    while board.ply() < n_plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        plies.append((board.copy(), move))
+        board.push(move)
+    return plies
+
+
+def eager_log(color, message):
+    logging.debug(color + message + Color.ENDC)
+
+
+def eager_log_board(board):
+    """ How log_board used to build its message
+    """
+    eager_log(Color.VIOLET, board.fen())
+    board_str = "\n  " + str(board).replace("\n", "\n  ")
+    board_str = re.sub("[a-z]", lambda p: Color.DARK_GREY + p[0] + Color.BLACK, board_str)
+    board_str = re.sub("[A-Z]", lambda p: Color.WHITE + p[0] + Color.BLACK, board_str)
+    for p, code in {"k": "♔", "q": "♕", "r": "♖",
+                    "b": "♗", "n": "♘", "p": "♙"}.items():
+        board_str = board_str.replace(p, code).replace(p.capitalize(), code)
+    eager_log(Color.BLACK, board_str + "\n")
+
+
+def eager_log_move(board, move, score):
+    """ How log_move used to build its message
+    """
+    log_str = ("  %s%s" % (fullmove_string(board), board.san(move))).ljust(15)
+    log_str += Color.ENDC + Color.BLUE + "  CP: %d" % score.score()
+    eager_log(Color.GREEN, log_str)
+
+
+def log_eagerly(plies):
+    for board, move in plies:
+        eager_log(Color.DIM, "Evaluating best move (depth %d)..." % 12)
+        eager_log_move(board, move, Cp(10))
+        eager_log_board(board)
+        eager_log(Color.DARK_BLUE, "Material difference:  %d" % material_difference(board))
+        eager_log(Color.DARK_BLUE, "# legal moves:        %d" % board.legal_moves.count())
+
+
+def log_lazily(plies):
+    for board, move in plies:
+        log(Color.DIM, "Evaluating best move (depth %d)...", 12)
+        log_move(board, move, Cp(10))
+        if log_enabled():
+            # as in PuzzlePosition._log_position
+            log_board(board)
+            log(Color.DARK_BLUE, "Material difference:  %d", material_difference(board))
+            log(Color.DARK_BLUE, "# legal moves:        %d", board.legal_moves.count())
+
+
+def bench(log_plies, plies) -> float:
+    start = time.process_time()
+    log_plies(plies)
+    return time.process_time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=20,
+                        help="number of games to log")
+    parser.add_argument("--plies", type=int, default=200,
+                        help="maximum length of each game in plies")
+    settings = parser.parse_args()
+
+    configure_logging(level=logging.INFO)
+    plies = []
+    for seed in range(settings.games):
+        plies += random_boards(settings.plies, seed)
+    print("%d plies" % len(plies))
+    for log_plies in [log_eagerly, log_lazily]:
+        seconds = bench(log_plies, plies)
+        print("%-12s %8.3fs  %8.1f us/ply" % (
+            log_plies.__name__, seconds, 1e6 * seconds / len(plies)
+        ))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+""" Runs a fixed corpus of PGN games and FEN positions through the scan,
+    generate and export stages of the puzzle pipeline at fixed search limits
+    (depths, nodes or movetimes), and reports throughput, engine calls and
+    Python-side overhead
+
+    Results are saved as JSON so runs from different commits can be compared.
+    With --replay, analyses recorded with make_puzzles.py --record are
+    replayed instead of running an engine, which leaves only Python overhead
+
+    PYTHONPATH=. python benchmarks/bench_pipeline.py --output before.json
+    PYTHONPATH=. python benchmarks/bench_pipeline.py --compare before.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import time
+
+import chess
+import chess.pgn
+
+from puzzlemaker.analysis import AnalysisEngine, format_limit
+from puzzlemaker.engine_replay import engine_factory
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from puzzlemaker.puzzle_finder import find_puzzle_candidates
+from puzzlemaker.puzzle_sinks import export_puzzle, OUTPUT_FORMATS
+from puzzlemaker.workers import puzzle_search_limit, scan_limit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "fixtures")
+
+# positions from the puzzle generation tests
+FENS = [
+    "6k1/R4p2/1r3npp/2N5/P1b2P2/6P1/3r2BP/4R1K1 w - - 0 34",
+    "r1b3kr/ppp1Bp1p/1b6/n2P4/2p3q1/2Q2N2/P4PPP/RN2R1K1 w - - 1 0",
+    "r2n1rk1/1ppb2pp/1p1p4/3Ppq1n/2B3P1/2P4P/PP1N1P1K/R2Q1RN1 b - - 0 1",
+    "3q1r1k/2p4p/1p1pBrp1/p2Pp3/2PnP3/5PP1/PP1Q2K1/5R1R w - - 1 0",
+    "6rr/1k3p2/1pb1p1np/p1p1P2R/2P3R1/2P1B3/P1BK1PP1/8 b - - 5 26",
+]
+
+
+def corpus_games():
+    games = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.pgn"))):
+        with open(path) as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                games.append(game)
+    return games
+
+
+def stage_result(phase: str, seconds: float, **counts) -> dict:
+    engine = Metrics.analysis_totals(phase)
+    return dict(
+        counts,
+        seconds=seconds,
+        engine_calls=engine["calls"],
+        engine_seconds=engine["seconds"],
+        nodes=engine["nodes"],
+        python_seconds=max(seconds - engine["seconds"], 0),
+    )
+
+
+def run(settings) -> dict:
+    Metrics.reset()
+    games = corpus_games()
+
+    start = time.perf_counter()
+    puzzles = []
+    n_positions = 0
+    for game in games:
+        candidates = find_puzzle_candidates(game, scan_depth=scan_limit(settings))
+        puzzles += [(candidate, game.headers) for candidate in candidates]
+        n_positions += sum(1 for _ in game.mainline_moves())
+    scan = stage_result(
+        "scan", time.perf_counter() - start,
+        games=len(games), positions=n_positions, candidates=len(puzzles),
+    )
+    scan["games_per_second"] = len(games) / scan["seconds"]
+    scan["positions_per_second"] = n_positions / scan["seconds"]
+
+    puzzles += [(Puzzle(chess.Board(fen)), None) for fen in FENS]
+    start = time.perf_counter()
+    for puzzle, _ in puzzles:
+        puzzle.generate(puzzle_search_limit(settings))
+    complete = [(puzzle, headers) for puzzle, headers in puzzles if puzzle.is_complete()]
+    generate = stage_result(
+        "generate", time.perf_counter() - start,
+        candidates=len(puzzles), puzzles=len(complete),
+    )
+    generate["candidates_per_second"] = len(puzzles) / generate["seconds"]
+    generate["engine_calls_per_puzzle"] = (
+        generate["engine_calls"] / len(complete) if complete else None
+    )
+
+    start = time.perf_counter()
+    for _ in range(settings.export_repeat):
+        for output_format in OUTPUT_FORMATS:
+            for puzzle, headers in complete:
+                export_puzzle(puzzle, output_format, headers)
+    n_exports = settings.export_repeat * len(OUTPUT_FORMATS) * len(complete)
+    seconds = time.perf_counter() - start
+    export = {
+        "exports": n_exports,
+        "seconds": seconds,
+        "exports_per_second": n_exports / seconds if seconds else None,
+    }
+
+    return {
+        "commit": _git_commit(),
+        "time": time.time(),
+        "engine": AnalysisEngine.name(),
+        "settings": {
+            "scan_depth": settings.scan_depth,
+            "scan_nodes": settings.scan_nodes,
+            "scan_movetime": settings.scan_movetime,
+            "search_depth": settings.search_depth,
+            "search_nodes": settings.search_nodes,
+            "search_movetime": settings.search_movetime,
+            "replay": settings.replay,
+        },
+        "stages": {"scan": scan, "generate": generate, "export": export},
+    }
+
+
+def print_results(results: dict, baseline=None):
+    settings = argparse.Namespace(**results["settings"])
+    print("%s  %s  scan %s, search %s" % (
+        results["commit"], results["engine"],
+        format_limit(scan_limit(settings)), format_limit(puzzle_search_limit(settings)),
+    ))
+    for stage, values in results["stages"].items():
+        for name, value in values.items():
+            if not isinstance(value, (int, float)):
+                continue
+            if isinstance(value, int):
+                line = "  %-8s %-24s %12d" % (stage, name, value)
+            else:
+                line = "  %-8s %-24s %12.3f" % (stage, name, value)
+            old = baseline and baseline["stages"].get(stage, {}).get(name)
+            if isinstance(old, (int, float)) and old:
+                line += "  %+7.1f%%" % (100.0 * (value - old) / old)
+            print(line)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scan-depth", type=int, default=10,
+                        help="depth for scanning games. "
+                             "0 for no depth limit with --scan-nodes or --scan-movetime")
+    parser.add_argument("--scan-nodes", metavar="NODES", type=int, default=None,
+                        help="also stop scanning a move after searching NODES nodes")
+    parser.add_argument("--scan-movetime", metavar="SECONDS", type=float, default=None,
+                        help="also stop scanning a move after SECONDS seconds")
+    parser.add_argument("--search-depth", type=int, default=12,
+                        help="depth for generating puzzles. "
+                             "0 for no depth limit with --search-nodes or --search-movetime")
+    parser.add_argument("--search-nodes", metavar="NODES", type=int, default=None,
+                        help="also stop searching a position after NODES nodes")
+    parser.add_argument("--search-movetime", metavar="SECONDS", type=float, default=None,
+                        help="also stop searching a position after SECONDS seconds")
+    parser.add_argument("--export-repeat", type=int, default=20,
+                        help="number of times to export each puzzle in each format")
+    parser.add_argument("--replay", metavar="FILE", type=str, default=None,
+                        help="replay analyses recorded with --record")
+    parser.add_argument("--record", metavar="FILE", type=str, default=None,
+                        help="record the engine's analyses to FILE for --replay")
+    parser.add_argument("--output", metavar="FILE", type=str, default=None,
+                        help="save the results as JSON to FILE")
+    parser.add_argument("--compare", metavar="FILE", type=str, default=None,
+                        help="compare with results saved by an earlier run")
+    settings = parser.parse_args()
+    for stage in ("scan", "search"):
+        if not (getattr(settings, stage + "_depth") or getattr(settings, stage + "_nodes")
+                or getattr(settings, stage + "_movetime")):
+            parser.error("--%s-depth 0 needs --%s-nodes or --%s-movetime" % (stage, stage, stage))
+
+    AnalysisEngine.configure(
+        threads=1, engine_factory=engine_factory(settings.record, settings.replay)
+    )
+    try:
+        results = run(settings)
+    finally:
+        AnalysisEngine.quit()
+    baseline = None
+    if settings.compare:
+        with open(settings.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if settings.output:
+        with open(settings.output, "w") as f:
+            json.dump(results, f, indent=2)
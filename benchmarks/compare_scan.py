@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+""" Scans games with a full scan and with a coarse scan, and compares the
+    candidate puzzles they find and the engine time they spend
+
+    The coarse scan should find the same candidates (recall of 100%) with
+    fewer engine nodes. Uses the benchmark corpus unless --pgn is given
+
+    PYTHONPATH=. python benchmarks/compare_scan.py --coarse-depth 8
+    PYTHONPATH=. python benchmarks/compare_scan.py --pgn games.pgn --margin 30
+"""
+
+import argparse
+import time
+
+import chess.pgn
+
+from bench_pipeline import corpus_games
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.constants import SCAN_DEPTH, COARSE_SCAN_MARGIN
+from puzzlemaker.engine_replay import engine_factory
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle_finder import find_puzzle_candidates
+
+
+def read_games(pgn_path: str, max_games=None):
+    games = []
+    with open(pgn_path) as f:
+        while max_games is None or len(games) < max_games:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            games.append(game)
+    return games
+
+
+def scan(games, **kwargs) -> dict:
+    """ The candidates found in the games, and the engine time spent
+    """
+    Metrics.reset()
+    candidates = set()
+    start = time.perf_counter()
+    for i, game in enumerate(games):
+        for puzzle in find_puzzle_candidates(game, **kwargs):
+            candidates.add((i, puzzle.initial_board.fen(), puzzle.initial_move.uci()))
+    engine = Metrics.analysis_totals("scan")
+    return {
+        "candidates": candidates,
+        "seconds": time.perf_counter() - start,
+        "engine_calls": engine["calls"],
+        "engine_seconds": engine["seconds"],
+        "nodes": engine["nodes"],
+    }
+
+
+def print_comparison(full: dict, coarse: dict):
+    found = full["candidates"] & coarse["candidates"]
+    missed = full["candidates"] - coarse["candidates"]
+    extra = coarse["candidates"] - full["candidates"]
+    recall = len(found) / len(full["candidates"]) if full["candidates"] else 1.0
+    print("  %-16s %12s %12s" % ("", "full", "coarse"))
+    print("  %-16s %12d %12d" % ("candidates", len(full["candidates"]), len(coarse["candidates"])))
+    for name in ("engine_calls", "nodes"):
+        print("  %-16s %12d %12d" % (name, full[name], coarse[name]))
+    for name in ("engine_seconds", "seconds"):
+        print("  %-16s %12.3f %12.3f" % (name, full[name], coarse[name]))
+    if coarse["seconds"]:
+        print("  speedup          %11.2fx" % (full["seconds"] / coarse["seconds"]))
+    print("  recall           %11.1f%%" % (100.0 * recall))
+    for game_id, fen, move in sorted(missed):
+        print("  missed: game %d  %s  %s" % (game_id, fen, move))
+    for game_id, fen, move in sorted(extra):
+        print("  extra:  game %d  %s  %s" % (game_id, fen, move))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--pgn", metavar="PGN", type=str, default=None,
+                        help="PGN file with games to scan")
+    parser.add_argument("--max-games", type=int, default=None,
+                        help="only scan the first N games of the PGN")
+    parser.add_argument("--scan-depth", type=int, default=SCAN_DEPTH,
+                        help="depth of the full scan")
+    parser.add_argument("--coarse-depth", type=int, default=8,
+                        help="depth of the coarse scan")
+    parser.add_argument("--margin", type=int, default=COARSE_SCAN_MARGIN,
+                        help="margin in cp of the coarse scan")
+    parser.add_argument("--replay", metavar="FILE", type=str, default=None,
+                        help="replay analyses recorded with --record")
+    parser.add_argument("--record", metavar="FILE", type=str, default=None,
+                        help="record the engine's analyses to FILE for --replay")
+    settings = parser.parse_args()
+
+    AnalysisEngine.configure(
+        threads=1, engine_factory=engine_factory(settings.record, settings.replay)
+    )
+    try:
+        games = read_games(settings.pgn, settings.max_games) if settings.pgn else corpus_games()
+        print("%s  %d games  scan depth %d, coarse depth %d, margin %d" % (
+            AnalysisEngine.name(), len(games),
+            settings.scan_depth, settings.coarse_depth, settings.margin,
+        ))
+        full = scan(games, scan_depth=settings.scan_depth)
+        coarse = scan(
+            games, scan_depth=settings.scan_depth,
+            coarse_depth=settings.coarse_depth, margin=settings.margin,
+        )
+    finally:
+        AnalysisEngine.quit()
+    print_comparison(full, coarse)
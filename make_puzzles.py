@@ -5,17 +5,30 @@
 
 import argparse
 import logging
+import os
 import sys
+import time
 
 from chess import Board
-import chess.pgn
 
 from puzzlemaker.colors import Color
 from puzzlemaker.puzzle import Puzzle
 from puzzlemaker.logger import configure_logging, log
-from puzzlemaker.puzzle_finder import find_puzzle_candidates
+from puzzlemaker.workers import (
+    configure_analysis_engine, process_games, process_games_in_parallel,
+    process_games_pipelined, puzzle_search_limit,
+)
 from puzzlemaker.analysis import AnalysisEngine
-from puzzlemaker.constants import SCAN_DEPTH, SEARCH_DEPTH
+from puzzlemaker.pgn_reader import (
+    PgnIndex, read_games, read_game_texts, game_offsets, can_filter_with_index, is_seekable
+)
+from puzzlemaker.game_filter import GameFilter
+from puzzlemaker.puzzle_sinks import PuzzleSink, OUTPUT_FORMATS, export_puzzle
+from puzzlemaker.checkpoint import Checkpoint
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.constants import (
+    SCAN_DEPTH, SEARCH_DEPTH, EVAL_CACHE_SIZE, METRICS_INTERVAL, MIN_STABLE_DEPTH
+)
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -27,28 +40,103 @@ group = parser.add_mutually_exclusive_group(required=True)
 group.add_argument("--fen", metavar="FEN", type=str,
                     help="A FEN position from which to generate a puzzle")
 group.add_argument("--pgn", metavar="PGN", type=str,
-                    help="A PGN file with games to scan for puzzles")
+                    help="A PGN file with games to scan for puzzles. Can be "
+                         "compressed with gzip, bz2, xz or zstd, or - for stdin")
 
 # Chess engine settings
 group = parser.add_argument_group('chess engine settings')
+group.add_argument("--engines", metavar="ENGINES", nargs="?",
+                    type=int, default=1,
+                    help="number of engine processes to run analyses on. "
+                         "The candidate puzzles of a game are generated in parallel")
+group.add_argument("--scan-engines", metavar="ENGINES", type=int, default=1,
+                    help="with --pipeline, number of engine processes scanning "
+                         "games, besides the --engines generating puzzles")
 group.add_argument("--threads", metavar="THREADS", nargs="?",
                     type=int, default=2,
-                    help="number of engine threads")
+                    help="number of threads per engine process")
 group.add_argument("--memory", metavar="MEMORY", nargs="?",
                     type=int, default=2048,
-                    help="memory in MB to use for engine hashtables")
+                    help="memory in MB per engine process to use for hashtables")
 group.add_argument("--scan-depth", metavar="DEPTH", nargs="?",
                     type=int, default=SCAN_DEPTH,
-                    help="depth for scanning a game for candidate puzzles")
+                    help="depth for scanning a game for candidate puzzles. "
+                         "0 for no depth limit with --scan-nodes or --scan-movetime")
+group.add_argument("--scan-nodes", metavar="NODES", type=int, default=None,
+                    help="also stop scanning a move after searching NODES nodes")
+group.add_argument("--scan-movetime", metavar="SECONDS", type=float, default=None,
+                    help="also stop scanning a move after SECONDS seconds")
+group.add_argument("--coarse-scan-depth", metavar="DEPTH", type=int, default=None,
+                    help="scan each move at DEPTH first, and only scan it at the "
+                         "scan depth if the position might be worth investigating")
 group.add_argument("--search-depth", metavar="DEPTH", nargs="?",
                     type=int, default=SEARCH_DEPTH,
-                    help="depth for searching a position for candidate moves")
+                    help="depth for searching a position for candidate moves. "
+                         "0 for no depth limit with --search-nodes or --search-movetime")
+group.add_argument("--search-nodes", metavar="NODES", type=int, default=None,
+                    help="also stop searching a position after NODES nodes")
+group.add_argument("--search-movetime", metavar="SECONDS", type=float, default=None,
+                    help="also stop searching a position after SECONDS seconds")
+group.add_argument("--stable-depths", metavar="DEPTHS", type=int, default=None,
+                    help="stop searching a position for candidate moves once the "
+                         "best move and whether it's ambiguous haven't changed "
+                         "for DEPTHS depths (from depth %d)" % MIN_STABLE_DEPTH)
+group.add_argument("--speculate", default=False, action="store_true",
+                    help="while a puzzle position is searched, search the expected "
+                         "next position on another engine (needs --engines 2 or more)")
+group.add_argument("--cache", metavar="FILE", type=str, default=None,
+                    help="SQLite file for caching engine analyses across runs")
+group.add_argument("--cache-size", metavar="ENTRIES", type=int,
+                    default=EVAL_CACHE_SIZE,
+                    help="maximum number of analyses to keep in the cache")
+group.add_argument("--record", metavar="FILE", type=str, default=None,
+                    help="Record every engine analysis to FILE for --replay")
+group.add_argument("--replay", metavar="FILE", type=str, default=None,
+                    help="Replay analyses recorded with --record instead of "
+                         "running an engine")
+group.add_argument("--verify-multipv", default=False, action="store_true",
+                    help="also search puzzle positions with multipv 1 and report "
+                         "when the best move differs from the multipv search")
 
 # Misc settings
 parser.add_argument("--start-index", metavar="INDEX", type=int, default=0,
                     help="Start at the n-th game in a PGN (starting at 0)")
+parser.add_argument("--end-index", metavar="INDEX", type=int, default=None,
+                    help="Stop before the n-th game in a PGN")
+parser.add_argument("--index", default=False, action="store_true",
+                    help="Build or reuse a sidecar index of game offsets "
+                         "(PGN.idx) to seek to games without parsing them")
+parser.add_argument("--shard", metavar="K/N", type=str, default=None,
+                    help="Only process the K-th of N equal parts of the PGN "
+                         "(starting at 0). Uses the sidecar index")
+parser.add_argument("--filter", metavar="EXPR", type=str, default=None,
+                    help="Only process games whose PGN headers match EXPR, e.g. "
+                         "'MinElo >= 2000 and Base >= 600'. Other games are "
+                         "skipped without parsing their moves")
+parser.add_argument("--workers", metavar="WORKERS", type=int, default=1,
+                    help="number of worker processes scanning games in parallel")
+parser.add_argument("--pipeline", default=False, action="store_true",
+                    help="scan the next games while puzzles from earlier games "
+                         "are generated, on separate engine pools")
+parser.add_argument("--unordered", default=False, action="store_true",
+                    help="with --workers, output puzzles as soon as each game finishes")
+parser.add_argument("--output", metavar="FILE", type=str, default=None,
+                    help="Write puzzles to FILE instead of standard output")
+parser.add_argument("--format", choices=OUTPUT_FORMATS, default="pgn",
+                    help="Format of the output puzzles: PGN, one JSON object "
+                         "per line or CSV")
+parser.add_argument("--checkpoint", metavar="FILE", type=str, default=None,
+                    help="Periodically save the progress of a PGN run to FILE")
+parser.add_argument("--resume", default=False, action="store_true",
+                    help="Continue the run saved in the --checkpoint file")
+parser.add_argument("--metrics", metavar="FILE", type=str, default=None,
+                    help="Periodically write the time spent, depths and engine "
+                         "nodes of each phase to FILE as JSON")
 parser.add_argument("--quiet", default=False, action="store_true",
                     help="substantially reduce the number of logged messages")
+parser.add_argument("--pgn-evals", default=False, action="store_true",
+                    help="Scan games using [%%eval ...] annotations in the PGN. "
+                         "Moves without them are scanned by the engine")
 parser.add_argument("--scan-only", default=False, action="store_true",
                     help="Only scan for possible puzzles. Don't analyze positions")
 
@@ -57,6 +145,37 @@ if len(sys.argv) < 2:
     sys.exit(0)
 
 settings = parser.parse_args()
+game_filter = None
+if settings.filter:
+    try:
+        game_filter = GameFilter(settings.filter)
+    except ValueError as e:
+        parser.error(str(e))
+for stage in ("scan", "search"):
+    if not (getattr(settings, stage + "_depth") or getattr(settings, stage + "_nodes")
+            or getattr(settings, stage + "_movetime")):
+        parser.error("--%s-depth 0 needs --%s-nodes or --%s-movetime" % (stage, stage, stage))
+if settings.pipeline and settings.workers > 1:
+    parser.error("--pipeline and --workers can't be used together")
+if settings.scan_engines < 1:
+    parser.error("--scan-engines must be at least 1")
+if settings.record and settings.replay:
+    parser.error("--record and --replay can't be used together")
+if settings.resume and not settings.checkpoint:
+    parser.error("--resume needs a --checkpoint file")
+if settings.checkpoint and not settings.pgn:
+    parser.error("--checkpoint can only be used with --pgn")
+
+checkpoint = None
+output_offset = None
+if settings.resume and os.path.exists(settings.checkpoint):
+    checkpoint = Checkpoint.load(settings.checkpoint)
+    if checkpoint.pgn_path != settings.pgn:
+        parser.error("%s is a checkpoint for %s" % (settings.checkpoint, checkpoint.pgn_path))
+    output_offset = checkpoint.output_offset
+    if settings.output and output_offset is None:
+        parser.error("%s wasn't saved with --output" % settings.checkpoint)
+
 try:
     # Optionally fix colors on Windows and in journals if the colorama module
     # is available.
@@ -67,71 +186,134 @@ try:
 except ImportError:
     pass
 
-engine = AnalysisEngine.instance()
-engine.configure({
-  'Threads': settings.threads,
-  'Hash': settings.memory,
-})
+configure_analysis_engine(settings, engines=settings.engines)
 
 if settings.quiet:
     configure_logging(level=logging.INFO)
 else:
     configure_logging(level=logging.DEBUG)
 
-def print_puzzle_pgn(puzzle, pgn_headers=None):
-    puzzle_pgn = puzzle.to_pgn(pgn_headers=pgn_headers)
-    log(Color.MAGENTA, "NEW PUZZLE GENERATED\n")
+sink = None
+if settings.output or settings.format != "pgn":
+    sink = PuzzleSink(settings.format, settings.output, output_offset)
+
+def print_puzzle_pgn(puzzle_pgn):
     print(Color.CYAN + puzzle_pgn + "\n\n" + Color.ENDC)
 
+def output_puzzle(puzzle_record):
+    log(Color.MAGENTA, "NEW PUZZLE GENERATED\n")
+    if sink:
+        sink.write(puzzle_record)
+    else:
+        print_puzzle_pgn(puzzle_record)
+
+def output_metrics(**totals):
+    if settings.metrics:
+        Metrics.write(settings.metrics, **totals)
+
+def log_metrics_summary():
+    # logged at INFO level, so it's shown with --quiet too
+    logging.info("%s\n%s%s", Color.DIM, Metrics.summary(), Color.ENDC)
+
 
 # load a FEN and try to create a puzzle from it
 
 if settings.fen:
     log(Color.DIM, AnalysisEngine.name())
     puzzle = Puzzle(Board(settings.fen))
-    puzzle.generate(depth=settings.search_depth)
+    puzzle.generate(puzzle_search_limit(settings), settings.verify_multipv, settings.speculate)
     if puzzle.is_complete():
-        print_puzzle_pgn(puzzle)
-    engine.quit()
+        output_puzzle(export_puzzle(puzzle, settings.format))
+    log_metrics_summary()
+    output_metrics()
+    if sink:
+        sink.close()
+    AnalysisEngine.quit()
     exit(0)
 
 
 # load games from a PGN and scan them for puzzles
 
+start_index = settings.start_index
+end_index = settings.end_index
+index = None
+if (settings.index or settings.shard) and not is_seekable(settings.pgn):
+    parser.error("--index and --shard need an uncompressed PGN file")
+if settings.index or settings.shard:
+    log(Color.DIM, "Loading PGN index...")
+    index = PgnIndex.load_or_build(settings.pgn)
+    log(Color.DIM, "%d games in PGN index", len(index))
+if settings.shard:
+    shard, n_shards = [int(n) for n in settings.shard.split("/")]
+    start_index, end_index = index.shard(shard, n_shards)
+    log(Color.DIM, "Shard %d/%d: games %d to %d", shard, n_shards, start_index, end_index - 1)
+
 n_positions = 0   # number of positions considered
 n_puzzles = 0     # number of puzzles generated
-game_id = 0
-pgn = open(settings.pgn, "r")
-
-while game_id < settings.start_index:
-    game = chess.pgn.read_game(pgn)
-    if game == None:
-        exit(0)
-    game_id += 1
-
-log(Color.DIM, AnalysisEngine.name())
-while True:
-    game = chess.pgn.read_game(pgn)
-    if game == None:
-        break
-    log(Color.MAGENTA, "\nGame index: %d" % game_id)
-    log(Color.DARK_BLUE, str(game))
-    puzzles = find_puzzle_candidates(game, scan_depth=settings.scan_depth)
-    n = len(puzzles)
-    log(Color.YELLOW, "# positions to consider: %d" % n)
-    if settings.scan_only:
-        continue
-    for i, puzzle in enumerate(puzzles):
-        log(Color.MAGENTA, "\nConsidering position %d of %d..." % (i+1, n))
-        puzzle.generate(settings.search_depth)
-        if puzzle.is_complete():
-            print_puzzle_pgn(puzzle, pgn_headers=game.headers)
+n_games = start_index
+if checkpoint:
+    log(Color.DIM, "Resuming at game %d", checkpoint.next_game)
+    if not settings.output:
+        log(Color.RED, "Puzzles output after the last checkpoint will be output again")
+    start_index = max(start_index, checkpoint.next_game)
+    n_positions = checkpoint.totals["n_positions"]
+    n_puzzles = checkpoint.totals["n_puzzles"]
+    n_games = checkpoint.totals["n_games"]
+elif settings.checkpoint:
+    checkpoint = Checkpoint(settings.checkpoint, settings.pgn, start_index)
+if index and settings.workers > 1 and \
+        (game_filter is None or can_filter_with_index(game_filter)):
+    # workers read their own games, so this process doesn't parse them
+    games = game_offsets(index, start_index, end_index, game_filter)
+elif settings.workers > 1:
+    # workers parse the games, so this process only splits the PGN into games
+    games = read_game_texts(settings.pgn, start_index, end_index, index, game_filter)
+else:
+    games = read_games(settings.pgn, start_index, end_index, index, game_filter)
+if checkpoint:
+    games = checkpoint.track(games)
+
+if settings.workers > 1:
+    results = process_games_in_parallel(
+        games, settings, ordered=not settings.unordered
+    )
+elif settings.pipeline:
+    log(Color.DIM, AnalysisEngine.name())
+    results = process_games_pipelined(games, settings)
+else:
+    log(Color.DIM, AnalysisEngine.name())
+    results = process_games(games, settings)
+
+def save_checkpoint():
+    checkpoint.save(
+        sink.flush() if sink else None,
+        dict(n_games=n_games, n_positions=n_positions, n_puzzles=n_puzzles),
+    )
+
+metrics_time = time.monotonic()
+for result in results:
+    if not result.skipped:
+        for puzzle_record in result.puzzles:
+            output_puzzle(puzzle_record)
             n_puzzles += 1
-    game_id += 1
-    n_positions += n
+        n_positions += result.n_positions
+        n_games += 1
+    if checkpoint:
+        checkpoint.complete(result.game_id)
+        if checkpoint.is_due():
+            save_checkpoint()
+    if settings.metrics and time.monotonic() - metrics_time >= METRICS_INTERVAL:
+        output_metrics(n_games=n_games, n_positions=n_positions, n_puzzles=n_puzzles)
+        metrics_time = time.monotonic()
+if checkpoint:
+    save_checkpoint()
 
 log(
     Color.MAGENTA,
-    "\nGenerated %d puzzles from %d positions in %d games" % (n_puzzles, n_positions, game_id)
+    "\nGenerated %d puzzles from %d positions in %d games", n_puzzles, n_positions, n_games
 )
+log_metrics_summary()
+output_metrics(n_games=n_games, n_positions=n_positions, n_puzzles=n_puzzles)
+if sink:
+    sink.close()
 AnalysisEngine.quit()
@@ -1,84 +1,406 @@
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple, TypeVar, Union
 from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 import glob
 import shutil
+import threading
+import time
 
+from chess import Move
 from chess.engine import SimpleEngine, Limit, Score, EngineTerminatedError, InfoDict
 
 from puzzlemaker.fishnet import stockfish_command
+from puzzlemaker.engine_pool import EnginePool
+from puzzlemaker.eval_cache import EvalCache
 from puzzlemaker.logger import log
+from puzzlemaker.metrics import Metrics
 from puzzlemaker.colors import Color
 from puzzlemaker.utils import sign
+from puzzlemaker.constants import MIN_STABLE_DEPTH
 
-AnalyzedMove = namedtuple("AnalyzedMove", ["move", "move_san", "score"])
+# depth - the depth reached by the engine
+# pv - the principal variation, starting with the move
+AnalyzedMove = namedtuple(
+    "AnalyzedMove", ["move", "move_san", "score", "depth", "pv"],
+    defaults=(None, None)
+)
+
+# how far to search: a depth, or a Limit by depth, nodes and/or movetime
+SearchLimit = Union[int, Limit]
+
+# an analysis requested by a step of scanning a game or generating a
+# puzzle, so the steps can run with AnalysisEngine or AsyncAnalysisEngine
+# method - the name of the analysis method, e.g. "best_move", or
+#   "speculate" to start the AnalysisRequest in args early, in case it's
+#   requested later
+# args - its arguments
+AnalysisRequest = namedtuple("AnalysisRequest", ["method", "args"])
+
+T = TypeVar("T")
 
 
 class AnalysisEngine(object):
     """ Light wrapper around chess.engine
+
+        Analysis requests are routed through a pool of engine processes,
+        so independent analyses from different threads can run at once.
+        Analyses made within scanning() can run on a separate pool, so
+        scanning games doesn't wait for deep puzzle searches
     """
-    engine: SimpleEngine = None
+    pool: Optional[EnginePool] = None
+    scan_pool: Optional[EnginePool] = None
+    cache: Optional[EvalCache] = None
+    engine_factory: Optional[Callable[[], SimpleEngine]] = None
+    n_engines = 1
+    n_scan_engines: Optional[int] = None
+    stable_depths: Optional[int] = None
+    options: dict = {}
+    _quitting = False
+    _lock = threading.Lock()
+    _scanning: ContextVar[bool] = ContextVar("scanning", default=False)
+
+    @staticmethod
+    def configure(engines=1, threads=None, memory=None, cache=None, engine_factory=None,
+                  stable_depths=None, scan_engines=None):
+        """ engines - number of engine processes in the pool
+            threads - number of threads used by each engine process
+            memory - hashtable size in MB used by each engine process
+            cache - EvalCache consulted before running an analysis
+            engine_factory - starts an engine, instead of starting Stockfish
+              (e.g. to record or replay analyses)
+            stable_depths - stop multipv analyses once it's been clear for
+              this many depths whether there's a single best move
+            scan_engines - number of engine processes in a separate pool
+              for analyses made within scanning(), instead of sharing the pool
+        """
+        AnalysisEngine.quit()
+        AnalysisEngine._quitting = False
+        AnalysisEngine.cache = cache
+        AnalysisEngine.engine_factory = engine_factory
+        AnalysisEngine.n_engines = engines
+        AnalysisEngine.n_scan_engines = scan_engines
+        AnalysisEngine.stable_depths = stable_depths
+        AnalysisEngine.options = {}
+        if threads:
+            AnalysisEngine.options["Threads"] = threads
+        if memory:
+            AnalysisEngine.options["Hash"] = memory
+
+    @staticmethod
+    def instance() -> EnginePool:
+        # threads scanning or generating puzzles at once start one pool
+        with AnalysisEngine._lock:
+            if AnalysisEngine._quitting:
+                # analyses still running on other threads don't start new engines
+                raise EngineTerminatedError("analysis engines have quit")
+            if AnalysisEngine._scanning.get() and AnalysisEngine.n_scan_engines:
+                if AnalysisEngine.scan_pool is None:
+                    AnalysisEngine.scan_pool = AnalysisEngine._new_pool(
+                        AnalysisEngine.n_scan_engines
+                    )
+                return AnalysisEngine.scan_pool
+            if AnalysisEngine.pool is None:
+                AnalysisEngine.pool = AnalysisEngine._new_pool(AnalysisEngine.n_engines)
+            return AnalysisEngine.pool
+
+    @staticmethod
+    def _new_pool(size: int) -> EnginePool:
+        return EnginePool(
+            AnalysisEngine.engine_factory or stockfish_engine,
+            size=size,
+            options=AnalysisEngine.options,
+        )
 
     @staticmethod
-    def instance() -> SimpleEngine:
-        if not AnalysisEngine.engine:
-            AnalysisEngine.engine = SimpleEngine.popen_uci(_stockfish_command())
-        return AnalysisEngine.engine
+    @contextmanager
+    def scanning() -> Iterator[None]:
+        """ Runs the analyses of the current thread within the block on the
+            scan pool, if it's configured with scan_engines
+        """
+        token = AnalysisEngine._scanning.set(True)
+        try:
+            yield
+        finally:
+            AnalysisEngine._scanning.reset(token)
 
     @staticmethod
     def name() -> str:
-        return AnalysisEngine.instance().id["name"]
+        return AnalysisEngine.instance().name()
+
+    @staticmethod
+    def health_check() -> int:
+        n_restarted = 0
+        for pool in (AnalysisEngine.pool, AnalysisEngine.scan_pool):
+            if pool:
+                n_restarted += pool.health_check()
+        return n_restarted
 
     @staticmethod
     def quit():
-        if not AnalysisEngine.engine:
-            return
-        try:
-            AnalysisEngine.engine.quit()
-        except:
-            pass
-        AnalysisEngine.engine = None
+        """ Stops the engines. Analyses can't run again until configure()
+        """
+        if AnalysisEngine.cache is not None:
+            AnalysisEngine.cache.close()
+        with AnalysisEngine._lock:
+            AnalysisEngine._quitting = True
+            pools = (AnalysisEngine.pool, AnalysisEngine.scan_pool)
+            AnalysisEngine.pool = None
+            AnalysisEngine.scan_pool = None
+        for pool in pools:
+            if pool:
+                pool.quit()
 
     @staticmethod
-    def best_move(board, depth) -> AnalyzedMove:
+    def best_move(board, depth: SearchLimit) -> AnalyzedMove:
         info = AnalysisEngine._analyze(board, depth)
-        score = info["score"].white()
-        if not info.get("pv"):
-            return AnalyzedMove(None, None, score)
-        best_move = info["pv"][0]
-        return AnalyzedMove(best_move, board.san(best_move), score)
+        assert not isinstance(info, list)
+        return analyzed_move(board, info, depth)
 
     @staticmethod
-    def best_moves(board, depth, multipv=3) -> List[AnalyzedMove]:
-        best_moves = []
-        infos = AnalysisEngine._analyze(board, depth, multipv=multipv)
-        for info in infos:
-            move = info["pv"][0]
-            score = info["score"].white()
-            best_moves.append(AnalyzedMove(move, board.san(move), score))
-        return best_moves
+    def best_moves(board, depth: SearchLimit, multipv=3) -> List[AnalyzedMove]:
+        infos = AnalysisEngine._analyze(
+            board, depth, stable_depths=AnalysisEngine.stable_depths, multipv=multipv
+        )
+        assert isinstance(infos, list)
+        return [analyzed_move(board, info, depth) for info in infos]
 
     @staticmethod
-    def evaluate_move(board, move, depth) -> AnalyzedMove:
+    def evaluate_move(board, move, depth: SearchLimit) -> AnalyzedMove:
         info = AnalysisEngine._analyze(board, depth, root_moves=[move])
-        assert move == info["pv"][0]
-        score = info["score"].white()
-        return AnalyzedMove(move, board.san(move), score)
+        assert not isinstance(info, list) and move == info["pv"][0]
+        return analyzed_move(board, info, depth)
 
     @staticmethod
-    def score(board, depth) -> Score:
+    def score(board, depth: SearchLimit) -> Score:
         return AnalysisEngine.best_move(board, depth).score
 
     @staticmethod
-    def _analyze(board, depth, **kwargs) -> Union[List[InfoDict], InfoDict]:
+    def _analyze(board, depth: SearchLimit, stable_depths=None,
+                 **kwargs) -> Union[List[InfoDict], InfoDict]:
+        start = time.perf_counter()
+        info = cached_analysis(
+            AnalysisEngine.cache, board, depth, start, stable_depths, **kwargs
+        )
+        if info is not None:
+            return info
         try:
-            info = AnalysisEngine.instance().analyse(board, Limit(depth=depth), **kwargs)
+            with AnalysisEngine.instance().engine() as engine:
+                if stable_depths:
+                    info = analyse_until_stable(
+                        engine, board, as_limit(depth), stable_depths, **kwargs
+                    )
+                else:
+                    info = engine.analyse(board, as_limit(depth), **kwargs)
         except EngineTerminatedError:
+            if AnalysisEngine._quitting:
+                raise
             log(Color.RED, "Analysis engine crashed... restarting")
-            AnalysisEngine.quit()
-            info = AnalysisEngine._analyze(board, depth, **kwargs)
+            return AnalysisEngine._analyze(board, depth, stable_depths, **kwargs)
+        record_analysis(AnalysisEngine.cache, board, depth, info, start, stable_depths, **kwargs)
         return info
 
 
+def cached_analysis(cache: Optional[EvalCache], board, depth: SearchLimit, start: float,
+                    stable_depths=None, **kwargs) -> Union[List[InfoDict], InfoDict, None]:
+    """ The cached analysis of the board, if there's one deep enough
+    """
+    # analyses limited by nodes or time aren't comparable by depth,
+    # so only depth-limited analyses are cached
+    if cache is None or isinstance(depth, Limit):
+        return None
+    info = cache.get(board, depth, stable_depths=stable_depths, **kwargs)
+    if info is not None:
+        Metrics.record_analysis(
+            _analysis_kind(kwargs), time.perf_counter() - start, info, cached=True
+        )
+    return info
+
+
+def record_analysis(cache: Optional[EvalCache], board, depth: SearchLimit,
+                    info: Union[List[InfoDict], InfoDict], start: float,
+                    stable_depths=None, **kwargs):
+    """ Records the metrics of an engine analysis and caches it
+
+        Analyses stopped early once they were stable are cached at the depth
+        requested, under their stable_depths, so they're only found again by
+        requests that would stop early the same way. The depth they reached
+        is kept in their InfoDicts
+    """
+    Metrics.record_analysis(_analysis_kind(kwargs), time.perf_counter() - start, info)
+    if cache is None or isinstance(depth, Limit):
+        return
+    cache.put(board, depth, info, stable_depths=stable_depths, **kwargs)
+
+
+def analyzed_move(board, info: InfoDict, depth: SearchLimit) -> AnalyzedMove:
+    """ The first move of an analysis' principal variation
+    """
+    score = info["score"].white()
+    depth_reached = info.get("depth", limit_depth(depth))
+    if not info.get("pv"):
+        return AnalyzedMove(None, None, score, depth_reached)
+    move = info["pv"][0]
+    return AnalyzedMove(move, board.san(move), score, depth_reached, info["pv"])
+
+
+class StableVerdict(object):
+    """ Follows the lines of a streamed multipv analysis, to tell when the
+        best move, and whether it's ambiguous, have been the same for
+        stable_depths depths (from min_depth on)
+    """
+    def __init__(self, board, multipv: int, stable_depths: int, min_depth=MIN_STABLE_DEPTH):
+        self.n_lines = min(multipv, board.legal_moves.count())
+        self.stable_depths = stable_depths
+        self.min_depth = min_depth
+        self._lines: Dict[int, InfoDict] = {}
+        self._verdict: Optional[Tuple[Move, bool]] = None
+        self._n_stable = 0
+
+    def update(self, info: InfoDict) -> bool:
+        """ Adds a streamed info. True if the analysis can stop
+        """
+        if "pv" not in info or "score" not in info or \
+                info.get("lowerbound") or info.get("upperbound"):
+            return False
+        lines = self._lines
+        lines[info.get("multipv", 1)] = info
+        if len(lines) < self.n_lines or info.get("multipv", 1) != self.n_lines or \
+                any(line.get("depth") != info.get("depth") for line in lines.values()):
+            return False
+        # every line has been searched to this depth
+        scores = [lines[i]["score"].white() for i in sorted(lines)]
+        verdict = (lines[1]["pv"][0], ambiguous_best_move(scores))
+        self._n_stable = self._n_stable + 1 if verdict == self._verdict else 1
+        self._verdict = verdict
+        return self._n_stable >= self.stable_depths and info.get("depth", 0) >= self.min_depth
+
+    def lines(self) -> List[InfoDict]:
+        return [self._lines[i] for i in sorted(self._lines)]
+
+
+def analyse_until_stable(engine: SimpleEngine, board, limit: Limit, stable_depths: int,
+                         multipv=1, min_depth=MIN_STABLE_DEPTH,
+                         **kwargs) -> List[InfoDict]:
+    """ Streams a multipv analysis and stops it once the best move, and
+        whether it's ambiguous, have been the same for stable_depths depths
+        (from min_depth on). The depth reached is in each line's InfoDict
+
+        Engines that can't stream analyses (e.g. replaying recorded
+        analyses) search to the full limit
+    """
+    if not hasattr(engine, "analysis"):
+        return engine.analyse(board, limit, multipv=multipv, **kwargs)
+    verdict = StableVerdict(board, multipv, stable_depths, min_depth)
+    with engine.analysis(board, limit, multipv=multipv, **kwargs) as analysis:
+        for info in analysis:
+            if verdict.update(info):
+                analysis.stop()
+                break
+    return verdict.lines()
+
+
+def run_analyses(steps: Generator[AnalysisRequest, Any, T]) -> T:
+    """ Runs the steps of a generator that requests analyses, e.g.
+        Puzzle.generate_steps(), with AnalysisEngine and returns its result
+
+        With more than one engine in the pool, speculative requests start
+        on another thread, and their results are used if the same analysis
+        is requested later. Speculations that aren't used are recorded as
+        wasted: the ones not started yet are cancelled, and the ones running
+        are waited for, so no search outlives the steps
+    """
+    speculations: Dict[tuple, Future] = {}
+    executor = None
+    result = None
+    try:
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration as e:
+                return e.value
+            if request.method == "speculate":
+                result = None
+                if AnalysisEngine.n_engines < 2:
+                    continue
+                if executor is None:
+                    executor = ThreadPoolExecutor(1, thread_name_prefix="speculate")
+                speculation, = request.args
+                # runs in this thread's context, so analyses are recorded
+                # under the current phase
+                speculations[_request_key(speculation)] = executor.submit(
+                    copy_context().run, getattr(AnalysisEngine, speculation.method),
+                    *speculation.args
+                )
+                continue
+            future = speculations.pop(_request_key(request), None)
+            if future is not None:
+                Metrics.record_speculation(used=True)
+                result = future.result()
+            else:
+                result = getattr(AnalysisEngine, request.method)(*request.args)
+    finally:
+        for _ in speculations:
+            Metrics.record_speculation(used=False)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _request_key(request: AnalysisRequest) -> tuple:
+    board, *args = request.args
+    return (request.method, board.fen(), repr(args))
+
+
+def search_limit(depth: int, nodes: Optional[int] = None,
+                 movetime: Optional[float] = None) -> SearchLimit:
+    """ The depth, or a Limit if the search is also limited by nodes or
+        time in seconds. The search stops when any of the limits is reached
+    """
+    if nodes is None and movetime is None:
+        return depth
+    return Limit(depth=depth or None, nodes=nodes, time=movetime)
+
+
+def limit_depth(depth: SearchLimit) -> Optional[int]:
+    """ The depth limit of a search, if it has one
+    """
+    if isinstance(depth, Limit):
+        return depth.depth
+    return depth
+
+
+def format_limit(depth: SearchLimit) -> str:
+    """ e.g. "depth 22" or "depth 22, nodes 1000000, movetime 0.5s"
+    """
+    if not isinstance(depth, Limit):
+        return "depth %d" % depth
+    limits = []
+    if depth.depth:
+        limits.append("depth %d" % depth.depth)
+    if depth.nodes:
+        limits.append("nodes %d" % depth.nodes)
+    if depth.time:
+        limits.append("movetime %gs" % depth.time)
+    return ", ".join(limits)
+
+
+def as_limit(depth: SearchLimit) -> Limit:
+    """ The chess.engine.Limit of a depth or Limit
+    """
+    if isinstance(depth, Limit):
+        return depth
+    return Limit(depth=depth)
+
+
+def _analysis_kind(kwargs) -> str:
+    if kwargs.get("root_moves"):
+        return "evaluate_move"
+    elif kwargs.get("multipv"):
+        return "best_moves"
+    return "best_move"
+
+
 def ambiguous_best_move(scores: List[Score]) -> bool:
     """
     Looks at a list of candidate scores (best move first) to determine
@@ -128,7 +450,11 @@ def ambiguous_best_move(scores: List[Score]) -> bool:
     return False
 
 
-def _stockfish_command() -> Optional[str]:
+def stockfish_engine() -> SimpleEngine:
+    return SimpleEngine.popen_uci(_stockfish_command())
+
+
+def _stockfish_command() -> str:
     cmd = stockfish_command()
     if shutil.which(cmd):
         return stockfish_command()
@@ -136,5 +462,10 @@ def _stockfish_command() -> Optional[str]:
     if local_stockfish_bins:
         # matches 'stockfish-x86_64' in local dir after running build-stockfish.sh
         return local_stockfish_bins[0]
-    else:
-        return shutil.which("stockfish")
+    cmd = shutil.which("stockfish")
+    if cmd is None:
+        raise FileNotFoundError(
+            "Stockfish not found in $PATH or the local directory. "
+            "Install it or run ./build-stockfish.sh"
+        )
+    return cmd
@@ -0,0 +1,209 @@
+from contextlib import asynccontextmanager
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Generator, List, Optional, TypeVar, Union
+)
+import asyncio
+import time
+
+import chess.engine
+from chess.engine import Limit, Score, EngineTerminatedError, InfoDict, UciProtocol
+
+from puzzlemaker.analysis import (
+    AnalysisRequest, AnalyzedMove, SearchLimit, StableVerdict, analyzed_move,
+    as_limit, cached_analysis, record_analysis, _stockfish_command,
+)
+from puzzlemaker.eval_cache import EvalCache
+from puzzlemaker.logger import log
+from puzzlemaker.colors import Color
+from puzzlemaker.constants import MIN_STABLE_DEPTH
+
+T = TypeVar("T")
+
+
+class AsyncAnalysisEngine(object):
+    """ asyncio counterpart of AnalysisEngine, built on the coroutines of
+        chess.engine.popen_uci
+
+        Analyses are coroutines, so one event loop can keep several engine
+        processes busy at once, e.g. by scanning games or generating
+        puzzles in concurrent tasks. Engine processes are started when
+        they're first needed, up to `engines` of them
+    """
+    cache: Optional[EvalCache] = None
+    engine_factory: Optional[Callable[[], Awaitable[UciProtocol]]] = None
+    n_engines = 1
+    stable_depths: Optional[int] = None
+    options: dict = {}
+    protocols: List[UciProtocol] = []
+    _idle: Optional[asyncio.LifoQueue] = None
+    _n_reserved = 0
+
+    @staticmethod
+    def configure(engines=1, threads=None, memory=None, cache=None, stable_depths=None,
+                  engine_factory=None):
+        """ Takes the same settings as AnalysisEngine.configure(), except
+            engine_factory is a coroutine function. Engines that were already
+            started keep running until quit()
+        """
+        AsyncAnalysisEngine.cache = cache
+        AsyncAnalysisEngine.engine_factory = engine_factory
+        AsyncAnalysisEngine.n_engines = engines
+        AsyncAnalysisEngine.stable_depths = stable_depths
+        AsyncAnalysisEngine.options = {}
+        if threads:
+            AsyncAnalysisEngine.options["Threads"] = threads
+        if memory:
+            AsyncAnalysisEngine.options["Hash"] = memory
+
+    @staticmethod
+    async def name() -> str:
+        async with AsyncAnalysisEngine.engine() as engine:
+            return engine.id["name"]
+
+    @staticmethod
+    async def quit():
+        if AsyncAnalysisEngine.cache is not None:
+            AsyncAnalysisEngine.cache.close()
+        protocols = AsyncAnalysisEngine.protocols
+        AsyncAnalysisEngine.protocols = []
+        AsyncAnalysisEngine._idle = None
+        AsyncAnalysisEngine._n_reserved = 0
+        for protocol in protocols:
+            try:
+                await protocol.quit()
+            except EngineTerminatedError:
+                pass
+
+    @staticmethod
+    @asynccontextmanager
+    async def engine() -> AsyncIterator[UciProtocol]:
+        """ Checks out an engine for the duration of a block. Engines that
+            crash within it are replaced by a new engine
+        """
+        protocol = await AsyncAnalysisEngine._checkout()
+        healthy = True
+        try:
+            yield protocol
+        except EngineTerminatedError:
+            healthy = False
+            raise
+        finally:
+            AsyncAnalysisEngine._checkin(protocol, healthy)
+
+    @staticmethod
+    async def _checkout() -> UciProtocol:
+        if AsyncAnalysisEngine._idle is None:
+            AsyncAnalysisEngine._idle = asyncio.LifoQueue()
+        idle = AsyncAnalysisEngine._idle
+        if idle.empty() and AsyncAnalysisEngine._n_reserved < AsyncAnalysisEngine.n_engines:
+            AsyncAnalysisEngine._n_reserved += 1
+            try:
+                factory = AsyncAnalysisEngine.engine_factory or stockfish_engine_async
+                protocol = await factory()
+                if AsyncAnalysisEngine.options:
+                    await protocol.configure(AsyncAnalysisEngine.options)
+            except:
+                AsyncAnalysisEngine._n_reserved -= 1
+                raise
+            AsyncAnalysisEngine.protocols.append(protocol)
+            return protocol
+        return await idle.get()
+
+    @staticmethod
+    def _checkin(protocol: UciProtocol, healthy=True):
+        idle = AsyncAnalysisEngine._idle
+        if healthy and idle is not None and protocol in AsyncAnalysisEngine.protocols:
+            idle.put_nowait(protocol)
+        elif protocol in AsyncAnalysisEngine.protocols:
+            # a new engine is started the next time one is needed
+            AsyncAnalysisEngine.protocols.remove(protocol)
+            AsyncAnalysisEngine._n_reserved -= 1
+
+    @staticmethod
+    async def best_move(board, depth: SearchLimit) -> AnalyzedMove:
+        info = await AsyncAnalysisEngine._analyze(board, depth)
+        assert not isinstance(info, list)
+        return analyzed_move(board, info, depth)
+
+    @staticmethod
+    async def best_moves(board, depth: SearchLimit, multipv=3) -> List[AnalyzedMove]:
+        infos = await AsyncAnalysisEngine._analyze(
+            board, depth, stable_depths=AsyncAnalysisEngine.stable_depths, multipv=multipv
+        )
+        assert isinstance(infos, list)
+        return [analyzed_move(board, info, depth) for info in infos]
+
+    @staticmethod
+    async def evaluate_move(board, move, depth: SearchLimit) -> AnalyzedMove:
+        info = await AsyncAnalysisEngine._analyze(board, depth, root_moves=[move])
+        assert not isinstance(info, list) and move == info["pv"][0]
+        return analyzed_move(board, info, depth)
+
+    @staticmethod
+    async def score(board, depth: SearchLimit) -> Score:
+        return (await AsyncAnalysisEngine.best_move(board, depth)).score
+
+    @staticmethod
+    async def _analyze(board, depth: SearchLimit, stable_depths=None,
+                       **kwargs) -> Union[List[InfoDict], InfoDict]:
+        start = time.perf_counter()
+        info = cached_analysis(
+            AsyncAnalysisEngine.cache, board, depth, start, stable_depths, **kwargs
+        )
+        if info is not None:
+            return info
+        try:
+            async with AsyncAnalysisEngine.engine() as engine:
+                if stable_depths:
+                    info = await analyse_until_stable_async(
+                        engine, board, as_limit(depth), stable_depths, **kwargs
+                    )
+                else:
+                    info = await engine.analyse(board, as_limit(depth), **kwargs)
+        except EngineTerminatedError:
+            log(Color.RED, "Analysis engine crashed... restarting")
+            return await AsyncAnalysisEngine._analyze(board, depth, stable_depths, **kwargs)
+        record_analysis(
+            AsyncAnalysisEngine.cache, board, depth, info, start, stable_depths, **kwargs
+        )
+        return info
+
+
+async def stockfish_engine_async() -> UciProtocol:
+    _, protocol = await chess.engine.popen_uci(_stockfish_command())
+    return protocol
+
+
+async def analyse_until_stable_async(engine: UciProtocol, board, limit: Limit,
+                                     stable_depths: int, multipv=1,
+                                     min_depth=MIN_STABLE_DEPTH, **kwargs) -> List[InfoDict]:
+    """ analyse_until_stable() with an engine's coroutines
+    """
+    if not hasattr(engine, "analysis"):
+        return await engine.analyse(board, limit, multipv=multipv, **kwargs)
+    verdict = StableVerdict(board, multipv, stable_depths, min_depth)
+    with await engine.analysis(board, limit, multipv=multipv, **kwargs) as analysis:
+        async for info in analysis:
+            if verdict.update(info):
+                analysis.stop()
+                break
+    return verdict.lines()
+
+
+async def run_analyses_async(steps: Generator[AnalysisRequest, Any, T]) -> T:
+    """ Runs the steps of a generator that requests analyses, e.g.
+        Puzzle.generate_steps(), with AsyncAnalysisEngine and returns its result
+
+        Speculative requests are ignored, since concurrent tasks can
+        already keep every engine busy
+    """
+    result = None
+    while True:
+        try:
+            request = steps.send(result)
+        except StopIteration as e:
+            return e.value
+        if request.method == "speculate":
+            result = None
+            continue
+        result = await getattr(AsyncAnalysisEngine, request.method)(*request.args)
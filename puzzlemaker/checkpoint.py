@@ -0,0 +1,107 @@
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+import json
+import os
+import time
+
+from puzzlemaker.constants import CHECKPOINT_INTERVAL
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint(object):
+    """ Progress of a run over the games in a PGN, saved to a file so the
+        run can be resumed where it stopped
+
+        next_game [int]:
+          every game before this index is done
+
+        completed [set(int)]:
+          games after next_game that are done. Workers can finish games
+          out of order
+
+        output_offset [int]:
+          size of the output file when the checkpoint was saved. Puzzles
+          written after it are from games that aren't done yet
+
+        totals [dict]:
+          counts of games, positions and puzzles for the run's summary
+    """
+    def __init__(self, path: str, pgn_path: str, next_game=0):
+        self.path = path
+        self.pgn_path = pgn_path
+        self.next_game = next_game
+        self.completed: Set[int] = set()
+        self.output_offset: Optional[int] = None
+        self.totals: Dict[str, int] = {}
+        self._pending: Set[int] = set()
+        self._last_dispatched = next_game - 1
+        self._last_save = time.monotonic()
+
+    @staticmethod
+    def load(path: str) -> "Checkpoint":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version in %s" % path)
+        checkpoint = Checkpoint(path, data["pgn"], data["next_game"])
+        checkpoint.completed = set(data["completed"])
+        checkpoint.output_offset = data["output_offset"]
+        checkpoint.totals = data["totals"]
+        return checkpoint
+
+    def track(self, games: Iterable[Tuple[int, object]]) -> Iterator[Tuple[int, object]]:
+        """ Passes through (game index, game) pairs that aren't done yet,
+            keeping track of the games that were handed out
+        """
+        for game_id, game in games:
+            if self.is_complete(game_id):
+                continue
+            self._pending.add(game_id)
+            self._last_dispatched = game_id
+            yield game_id, game
+
+    def is_complete(self, game_id: int) -> bool:
+        return game_id < self.next_game or game_id in self.completed
+
+    def complete(self, game_id: int):
+        """ Marks a game as done
+        """
+        self._pending.discard(game_id)
+        self.completed.add(game_id)
+        # games that were never handed out were skipped by the reader,
+        # so everything before the oldest pending game is done
+        if self._pending:
+            self.next_game = max(self.next_game, min(self._pending))
+        else:
+            self.next_game = max(self.next_game, self._last_dispatched + 1)
+        self.completed = {i for i in self.completed if i >= self.next_game}
+
+    def is_due(self) -> bool:
+        """ If CHECKPOINT_INTERVAL seconds have passed since the last save
+        """
+        return time.monotonic() - self._last_save >= CHECKPOINT_INTERVAL
+
+    def save(self, output_offset: Optional[int] = None, totals: Optional[Dict[str, int]] = None):
+        """ Atomically replaces the checkpoint file
+
+            output_offset - size of the output file, which must be flushed
+              so it has every puzzle of the completed games
+        """
+        self.output_offset = output_offset
+        if totals is not None:
+            self.totals = totals
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "pgn": self.pgn_path,
+            "next_game": self.next_game,
+            "completed": sorted(self.completed),
+            "output_offset": output_offset,
+            "totals": self.totals,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
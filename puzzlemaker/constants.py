@@ -1,11 +1,31 @@
 # default search depth used to scan for puzzles
 SCAN_DEPTH = 16
 
+# how far (in cp) the scores of a coarse scan may be from the thresholds
+# for investigating a position and still be searched at the scan depth
+COARSE_SCAN_MARGIN = 50
+
 # default search depth used to evaluate moves for each puzzle position
 SEARCH_DEPTH = 22
 
+# minimum depth at which a multipv analysis can stop early, once it's
+# clear whether there's a single best move (see --stable-depths)
+MIN_STABLE_DEPTH = 10
+
 # minimum number of player moves required for a puzzle to be considered complete
 MIN_PLAYER_MOVES = 2
 
 # number of candidate moves to analyze for each puzzle position
 NUM_CANDIDATE_MOVES = 3
+
+# maximum number of analyses to keep in the persistent evaluation cache
+EVAL_CACHE_SIZE = 1000000
+
+# size in bytes of the write buffer for puzzle output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# seconds between saves of the checkpoint file of a run
+CHECKPOINT_INTERVAL = 30
+
+# seconds between writes of the metrics file of a run
+METRICS_INTERVAL = 10
@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+import queue
+import threading
+
+from chess.engine import SimpleEngine, EngineError, EngineTerminatedError
+
+from puzzlemaker.logger import log
+from puzzlemaker.colors import Color
+
+
+class EnginePool(object):
+    """ A fixed-size pool of chess engine processes
+
+        Engines are started lazily up to `size` and handed out one at a time
+        with checkout() / checkin(), so independent analyses can run on
+        separate engine processes at the same time.
+
+        factory [Callable]:
+          starts a new engine process (e.g. SimpleEngine.popen_uci)
+
+        options [dict]:
+          UCI options applied to every engine after it starts (Threads, Hash)
+
+        Once quit(), no engines are started, and engines checked in by
+        analyses that were still running are quit instead of kept
+    """
+    def __init__(self, factory: Callable[[], SimpleEngine], size=1,
+                 options: Optional[Dict] = None):
+        if size < 1:
+            raise ValueError("Engine pool size must be at least 1")
+        self.factory = factory
+        self.size = size
+        self.options = options or {}
+        self.engines: List[SimpleEngine] = []
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._n_reserved = 0
+        self._closed = False
+        self._name: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _start_engine(self) -> SimpleEngine:
+        engine = self.factory()
+        if self._name is None:
+            self._name = engine.id.get("name", "")
+        if self.options:
+            engine.configure(self.options)
+        return engine
+
+    def checkout(self, timeout=None) -> SimpleEngine:
+        """ Takes an idle engine from the pool, starting a new one if the
+            pool isn't full yet. Blocks until an engine is available
+        """
+        if self._closed:
+            raise EngineTerminatedError("Engine pool was quit")
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            engine = None
+            with self._lock:
+                if self._closed:
+                    raise EngineTerminatedError("Engine pool was quit")
+                can_start = self._n_reserved < self.size
+                if can_start:
+                    self._n_reserved += 1
+            if can_start:
+                try:
+                    engine = self._start_engine()
+                except:
+                    with self._lock:
+                        self._n_reserved -= 1
+                    raise
+                if not self._add_engine(engine):
+                    raise EngineTerminatedError("Engine pool was quit")
+                return engine
+            engine = self._idle.get(timeout=timeout)
+        if engine is None:
+            if self._closed:
+                # wakes up the next checkout() waiting for an engine
+                self._idle.put(None)
+                raise EngineTerminatedError("Engine pool was quit")
+            # an engine that couldn't be replaced left room to start one
+            return self.checkout(timeout)
+        return engine
+
+    def checkin(self, engine: SimpleEngine, healthy=True):
+        """ Returns an engine to the pool. Unhealthy engines are replaced
+        """
+        if self._closed:
+            # the pool was quit while the engine was checked out
+            _quit_engine(engine)
+            return
+        if not healthy:
+            new_engine = self._replace(engine)
+            if new_engine is None:
+                return
+            engine = new_engine
+        self._idle.put(engine)
+
+    @contextmanager
+    def engine(self) -> Iterator[SimpleEngine]:
+        """ with pool.engine() as engine:
+                engine.analyse(...)
+        """
+        engine = self.checkout()
+        healthy = True
+        try:
+            yield engine
+        except EngineTerminatedError:
+            healthy = False
+            raise
+        finally:
+            self.checkin(engine, healthy)
+
+    def _replace(self, engine: SimpleEngine) -> Optional[SimpleEngine]:
+        """ Quits an engine and starts another in its place, or None if the
+            pool was quit
+        """
+        _quit_engine(engine)
+        with self._lock:
+            if engine in self.engines:
+                self.engines.remove(engine)
+            if self._closed:
+                return None
+        try:
+            new_engine = self._start_engine()
+        except:
+            # give up the dead engine's place in the pool, and wake up a
+            # checkout() that may be waiting for it
+            with self._lock:
+                self._n_reserved -= 1
+            self._idle.put(None)
+            raise
+        if not self._add_engine(new_engine):
+            return None
+        return new_engine
+
+    def _add_engine(self, engine: SimpleEngine) -> bool:
+        """ Adds a started engine to the pool, or quits it if the pool was
+            quit while it was starting. True if it was added
+        """
+        with self._lock:
+            if not self._closed:
+                self.engines.append(engine)
+                return True
+        _quit_engine(engine)
+        return False
+
+    def health_check(self) -> int:
+        """ Pings every idle engine and restarts the ones that stopped
+            responding. Returns the number of restarted engines
+        """
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        n_restarted = 0
+        for engine in idle:
+            if engine is None:
+                # room to start an engine, left by a failed replacement
+                self._idle.put(None)
+                continue
+            try:
+                engine.ping()
+                healthy = True
+            except (EngineError, EngineTerminatedError):
+                healthy = False
+            if not healthy:
+                log(Color.RED, "Analysis engine is not responding... restarting")
+                n_restarted += 1
+            self.checkin(engine, healthy)
+        return n_restarted
+
+    def name(self) -> str:
+        """ The name of the pool's engines, read when the first one started
+        """
+        if self._name is None:
+            # the first engine sets the name when it starts
+            with self.engine():
+                pass
+        assert self._name is not None
+        return self._name
+
+    def quit(self):
+        with self._lock:
+            self._closed = True
+            engines = self.engines
+            self.engines = []
+            self._n_reserved = 0
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        # wakes up any checkout() waiting for an engine
+        self._idle.put(None)
+        for engine in engines:
+            _quit_engine(engine)
+
+
+def _quit_engine(engine: SimpleEngine):
+    try:
+        engine.quit()
+    except:
+        pass
@@ -0,0 +1,147 @@
+from typing import Callable, Dict, List, Mapping, Optional, Union
+import json
+import os
+import threading
+
+from chess import Board
+from chess.engine import SimpleEngine, Limit, InfoDict
+
+from puzzlemaker.analysis import stockfish_engine
+from puzzlemaker.eval_cache import encode_info, decode_info
+
+
+def recording_key(board: Board, limit: Limit, multipv=None, root_moves=None) -> str:
+    """ Identifies an analysis by the position and search parameters
+    """
+    root_moves_str = " ".join(sorted(move.uci() for move in root_moves or []))
+    return "%s|%r|%d|%s" % (board.fen(), limit, multipv or 0, root_moves_str)
+
+
+# environment variables for recording or replaying the engine in tests
+RECORD_ENV = "PUZZLEMAKER_RECORD"
+REPLAY_ENV = "PUZZLEMAKER_REPLAY"
+
+
+class EngineRecording(object):
+    """ Engine analyses stored in a file with one JSON object per line
+
+        Lines are appended as analyses are recorded, so several worker
+        processes can record to the same file
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.engine_name: Optional[str] = None
+        self.analyses: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str) -> "EngineRecording":
+        recording = EngineRecording(path)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "engine" in record:
+                    recording.engine_name = record["engine"]
+                else:
+                    recording.analyses[record["key"]] = record["infos"]
+        return recording
+
+    def get(self, key: str, multipv=None) -> Union[List[InfoDict], InfoDict]:
+        if key not in self.analyses:
+            raise KeyError("No recorded analysis for %s in %s" % (key, self.path))
+        infos = [decode_info(info) for info in self.analyses[key]]
+        if multipv:
+            return infos
+        return infos[0]
+
+    def put(self, key: str, info: Union[List[InfoDict], InfoDict], multipv=None):
+        infos = [encode_info(i) for i in (info if isinstance(info, list) else [info])]
+        self.analyses[key] = infos
+        self._append({"key": key, "infos": infos})
+
+    def set_engine_name(self, name: str):
+        if name != self.engine_name:
+            self.engine_name = name
+            self._append({"engine": name})
+
+    def _append(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            # one write per line so appends from other processes don't interleave
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+
+
+class RecordingEngine(object):
+    """ Wraps an engine and records every analysis it returns
+    """
+    def __init__(self, engine: SimpleEngine, recording: EngineRecording):
+        self.engine = engine
+        self.recording = recording
+        self.recording.set_engine_name(engine.id.get("name", ""))
+
+    @property
+    def id(self) -> Mapping[str, str]:
+        return self.engine.id
+
+    def configure(self, options: dict):
+        self.engine.configure(options)
+
+    def ping(self):
+        self.engine.ping()
+
+    def analyse(self, board: Board, limit: Limit, multipv=None, root_moves=None, **kwargs):
+        info = self.engine.analyse(
+            board, limit, multipv=multipv, root_moves=root_moves, **kwargs
+        )
+        self.recording.put(recording_key(board, limit, multipv, root_moves), info, multipv)
+        return info
+
+    def quit(self):
+        self.engine.quit()
+
+
+class ReplayEngine(object):
+    """ Stands in for an engine by returning recorded analyses, so the
+        whole pipeline runs deterministically without an engine binary.
+        Analyses that weren't recorded raise a KeyError
+    """
+    def __init__(self, recording: EngineRecording):
+        self.recording = recording
+        self.id = {"name": recording.engine_name or "Replay"}
+
+    def configure(self, options: dict):
+        pass
+
+    def ping(self):
+        pass
+
+    def analyse(self, board: Board, limit: Limit, multipv=None, root_moves=None, **kwargs):
+        return self.recording.get(recording_key(board, limit, multipv, root_moves), multipv)
+
+    def quit(self):
+        pass
+
+
+def engine_factory(record: Optional[str] = None,
+                   replay: Optional[str] = None) -> Optional[Callable]:
+    """ An engine factory that replays the recording in the `replay` file
+        or records Stockfish to the `record` file. None if neither is set
+    """
+    if replay:
+        recording = EngineRecording.load(replay)
+        return lambda: ReplayEngine(recording)
+    elif record:
+        recording = EngineRecording(record)
+        return lambda: RecordingEngine(stockfish_engine(), recording)
+    return None
+
+
+def engine_factory_from_environment() -> Optional[Callable]:
+    """ engine_factory() for the files in $PUZZLEMAKER_RECORD or
+        $PUZZLEMAKER_REPLAY, e.g. to run the integration tests without Stockfish
+    """
+    return engine_factory(os.environ.get(RECORD_ENV), os.environ.get(REPLAY_ENV))
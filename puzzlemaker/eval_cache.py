@@ -0,0 +1,189 @@
+from typing import List, Optional, Union
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import chess
+from chess import Board, Move
+from chess.engine import Cp, Mate, PovScore, InfoDict, Score
+import chess.polyglot
+
+from puzzlemaker.constants import EVAL_CACHE_SIZE
+
+# analyses cached by an older schema are dropped when the cache is opened
+SCHEMA_VERSION = 1
+
+
+class EvalCache(object):
+    """ Persistent cache of engine analyses stored in a SQLite database
+
+        Analyses are keyed by position hash, multipv, root moves and the
+        stable_depths they were stopped early with, if any. Only the deepest
+        analysis of each key is kept, and it's reused for any request at the
+        same or a lower depth. The least recently used analyses are
+        evicted once the cache holds more than `max_entries`.
+    """
+    def __init__(self, path: str, max_entries=EVAL_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._n_entries = 0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # forked worker processes each open their own connection
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # before version 1, analyses stopped early were cached as if
+                # they had searched to the full depth
+                conn.execute("DROP TABLE IF EXISTS evals")
+                conn.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS evals (
+                    position INTEGER NOT NULL,
+                    multipv INTEGER NOT NULL,
+                    root_moves TEXT NOT NULL,
+                    stable_depths INTEGER NOT NULL,
+                    depth INTEGER NOT NULL,
+                    infos TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (position, multipv, root_moves, stable_depths)
+                )
+            """)
+            conn.execute("COMMIT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS evals_last_used ON evals (last_used)"
+            )
+            self._n_entries = conn.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, board: Board, depth: int, multipv=None, root_moves=None,
+            stable_depths=None) -> Optional[Union[List[InfoDict], InfoDict]]:
+        """ Returns a cached analysis of the board at `depth` or deeper
+        """
+        key = _key(board, multipv, root_moves, stable_depths)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT infos FROM evals WHERE position = ? AND multipv = ?"
+                " AND root_moves = ? AND stable_depths = ? AND depth >= ?",
+                key + (depth,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            conn.execute(
+                "UPDATE evals SET last_used = ? WHERE position = ? AND multipv = ?"
+                " AND root_moves = ? AND stable_depths = ?",
+                (time.time(),) + key
+            )
+        infos = [decode_info(info) for info in json.loads(row[0])]
+        if multipv:
+            return infos
+        return infos[0]
+
+    def put(self, board: Board, depth: int, info: Union[List[InfoDict], InfoDict],
+            multipv=None, root_moves=None, stable_depths=None):
+        """ Stores an analysis unless a deeper one is already cached
+        """
+        key = _key(board, multipv, root_moves, stable_depths)
+        infos = info if isinstance(info, list) else [info]
+        encoded = json.dumps([encode_info(info) for info in infos])
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO evals (position, multipv, root_moves, stable_depths, depth,"
+                " infos, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (position, multipv, root_moves, stable_depths) DO UPDATE SET"
+                " depth = excluded.depth, infos = excluded.infos,"
+                " last_used = excluded.last_used"
+                " WHERE excluded.depth >= evals.depth",
+                key + (depth, encoded, time.time())
+            )
+            self._n_entries += cursor.rowcount
+            if self._n_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """ Deletes the least recently used analyses, leaving some room
+            so eviction doesn't run on every insert
+        """
+        conn = self._conn
+        n_entries = conn.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+        n_keep = int(self.max_entries * 0.9)
+        if n_entries > n_keep:
+            conn.execute(
+                "DELETE FROM evals WHERE rowid IN"
+                " (SELECT rowid FROM evals ORDER BY last_used LIMIT ?)",
+                (n_entries - n_keep,)
+            )
+        self._n_entries = min(n_entries, n_keep)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def _key(board: Board, multipv, root_moves, stable_depths) -> tuple:
+    position = chess.polyglot.zobrist_hash(board)
+    # SQLite integers are signed 64-bit
+    if position >= 1 << 63:
+        position -= 1 << 64
+    root_moves_str = " ".join(sorted(move.uci() for move in root_moves or []))
+    return (position, multipv or 0, root_moves_str, stable_depths or 0)
+
+
+def encode_info(info: InfoDict) -> dict:
+    """ The score (from White's point of view), PV, depth and nodes of an
+        analysis as JSON-serializable values
+    """
+    score = info["score"].white()
+    encoded = {
+        "pv": [move.uci() for move in info.get("pv", [])],
+        "depth": info.get("depth"),
+    }
+    if info.get("nodes") is not None:
+        encoded["nodes"] = info["nodes"]
+    if score.is_mate():
+        encoded["mate"] = score.mate()
+    else:
+        encoded["cp"] = score.score()
+    return encoded
+
+
+def decode_info(encoded: dict) -> InfoDict:
+    score: Score
+    if "mate" in encoded:
+        score = Mate(encoded["mate"])
+    else:
+        score = Cp(encoded["cp"])
+    info: InfoDict = {
+        "score": PovScore(score, chess.WHITE),
+        "pv": [Move.from_uci(move) for move in encoded["pv"]],
+    }
+    if encoded.get("depth") is not None:
+        info["depth"] = encoded["depth"]
+    if encoded.get("nodes") is not None:
+        info["nodes"] = encoded["nodes"]
+    return info
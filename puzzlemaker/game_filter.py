@@ -0,0 +1,175 @@
+from typing import Callable, Mapping, Optional, Set
+import ast
+import operator
+
+# fields derived from other headers, and the headers they're derived from
+DERIVED_FIELDS = {
+    "Base": ["TimeControl"],
+    "Increment": ["TimeControl"],
+    "MinElo": ["WhiteElo", "BlackElo"],
+    "MaxElo": ["WhiteElo", "BlackElo"],
+    "Plies": ["PlyCount"],
+}
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+class GameFilter(object):
+    """ Selects games with a boolean expression over their PGN headers
+
+        WhiteElo >= 2000 and BlackElo >= 2000 and Base >= 900
+        Event == "Rated Classical game" and Termination != "Time forfeit"
+        MinElo > 1800 and Plies >= 40
+
+        Names are PGN header names, and numeric header values are compared
+        as numbers. A few fields are derived from headers:
+
+          Base, Increment - seconds in the TimeControl, e.g. 300+5
+          MinElo, MaxElo - lower and higher rating of the two players
+          Plies - the PlyCount header, or the number of moves in the game
+
+        Comparisons with a missing header are false.
+    """
+    def __init__(self, expression: str):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError("Invalid filter expression: %s" % e)
+        self.names: Set[str] = set()
+        self._validate(tree.body)
+        self._tree = tree.body
+
+    def _validate(self, node):
+        """ Checks that a node is a condition: a comparison, or conditions
+            combined with and, or and not
+        """
+        if isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._validate(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self._validate(node.operand)
+        elif isinstance(node, ast.Compare):
+            for op in node.ops:
+                if type(op) not in COMPARISONS:
+                    raise ValueError("Unsupported comparison in filter: %s" % type(op).__name__)
+            for operand in [node.left] + node.comparators:
+                self._validate_operand(operand)
+        else:
+            raise ValueError("Filter expression isn't a condition: %s" % self.expression)
+
+    def _validate_operand(self, node):
+        if isinstance(node, ast.Name):
+            self.names.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float)):
+            pass
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            for element in node.elts:
+                self._validate_operand(element)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) \
+                and isinstance(node.operand, ast.Constant):
+            pass
+        else:
+            raise ValueError("Unsupported expression in filter: %s" % ast.dump(node))
+
+    def header_names(self) -> Set[str]:
+        """ The PGN headers needed to evaluate this filter
+        """
+        names = set()
+        for name in self.names:
+            names.update(DERIVED_FIELDS.get(name, [name]))
+        return names
+
+    def matches(self, headers: Mapping[str, str], plies=None) -> Optional[bool]:
+        """ True or False if the game is selected or not.
+            None if it depends on the number of plies, which isn't known yet
+        """
+        return self._evaluate(self._tree, lambda name: _field(headers, name, plies))
+
+    def _evaluate(self, node, lookup: Callable):
+        if isinstance(node, ast.BoolOp):
+            results = [self._evaluate(value, lookup) for value in node.values]
+            if isinstance(node.op, ast.And):
+                if False in results:
+                    return False
+                return None if None in results else True
+            if True in results:
+                return True
+            return None if None in results else False
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            result = self._evaluate(node.operand, lookup)
+            return None if result is None else not result
+        if isinstance(node, ast.Compare):
+            left = self._value(node.left, lookup)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._value(comparator, lookup)
+                if left is _UNKNOWN or right is _UNKNOWN:
+                    return None
+                if left is None or right is None:
+                    return False
+                try:
+                    if not COMPARISONS[type(op)](left, right):
+                        return False
+                except TypeError:
+                    # e.g. a rating of "?" compared with a number
+                    return False
+                left = right
+            return True
+        raise ValueError("Filter expression isn't a condition: %s" % self.expression)
+
+    def _value(self, node, lookup: Callable):
+        if isinstance(node, ast.Name):
+            return lookup(node.id)
+        if isinstance(node, (ast.Tuple, ast.List)):
+            return [self._value(element, lookup) for element in node.elts]
+        if isinstance(node, ast.UnaryOp):
+            # a negative number, as checked by _validate()
+            assert isinstance(node.operand, ast.Constant)
+            return -node.operand.value
+        assert isinstance(node, ast.Constant)
+        return node.value
+
+
+# the value of Plies before the moves of a game are read
+_UNKNOWN = object()
+
+
+def _number(value: Optional[str]):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _field(headers: Mapping[str, str], name: str, plies=None):
+    if name in ("Base", "Increment"):
+        time_control = headers.get("TimeControl", "")
+        parts = time_control.split("+")
+        if len(parts) != 2:
+            return None
+        return _number(parts[0] if name == "Base" else parts[1])
+    if name in ("MinElo", "MaxElo"):
+        elos = [_number(headers.get(h)) for h in ("WhiteElo", "BlackElo")]
+        if not all(isinstance(elo, int) for elo in elos):
+            return None
+        return min(elos) if name == "MinElo" else max(elos)
+    if name == "Plies":
+        if "PlyCount" in headers:
+            return _number(headers["PlyCount"])
+        return _UNKNOWN if plies is None else plies
+    return _number(headers.get(name))
@@ -13,12 +13,27 @@ def configure_logging(level=logging.DEBUG):
     logging.basicConfig(format="%(message)s", level=level, stream=sys.stderr)
     logging.getLogger("chess").setLevel(logging.WARNING)
 
-def log(color: str, message: str):
+def log_enabled() -> bool:
+    """ If debug messages are logged. Check this before building
+        expensive log messages
+    """
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+def log(color: str, message: str, *args):
+    """ Logs a debug message. args are formatted into the message with %
+        only if it's logged
+    """
+    if not log_enabled():
+        return
+    if args:
+        message = message % args
     logging.debug(color + message + Color.ENDC)
 
 def log_board(board: Board, unicode_pieces=True):
     """ Logs the fen string and board representation
     """
+    if not log_enabled():
+        return
     log(Color.VIOLET, board.fen())
     w_color = Color.WHITE
     b_color = Color.DARK_GREY
@@ -43,6 +58,8 @@ def log_move(board: Board, move: Move, score: Score,
              show_uci=False, highlight=False):
     """ 23. Qe4     CP: 123
     """
+    if not log_enabled():
+        return
     move_str = "%s%s" % (fullmove_string(board), board.san(move))
     log_str = "  %s" % move_str
     if show_uci:
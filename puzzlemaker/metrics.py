@@ -0,0 +1,228 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+
+from chess.engine import InfoDict
+
+STAT_FIELDS = [
+    "calls", "seconds", "engine_seconds", "cache_hits", "depth", "nodes", "searches_saved"
+]
+
+# the kinds of engine analyses recorded by record_analysis()
+ANALYSIS_KINDS = ["best_move", "best_moves", "evaluate_move"]
+
+
+class Metrics(object):
+    """ Wall time and engine work per phase of puzzle generation
+
+        Phases are timed blocks (e.g. "scan"), and analyses are recorded
+        under the current phase by kind (e.g. "scan/best_move"). For each:
+
+          calls - number of blocks or analyses
+          seconds - wall time
+          engine_seconds - wall time of analyses that weren't cached
+          cache_hits - analyses found in the evaluation cache
+          depth - sum of depths reached
+          nodes - sum of nodes searched by the engine
+          searches_saved - analyses skipped by pruning puzzles that
+            couldn't be complete (e.g. "generate/pruned/short_mate"), or
+            by reusing another analysis (e.g. "generate/reused/played_move")
+
+        Speculative analyses are counted as "used" or "wasted" (e.g.
+        "generate/speculative/used")
+    """
+    stats: Dict[str, Dict[str, Union[int, float]]] = {}
+    _lock = threading.Lock()
+    # the phases of each thread or asyncio task
+    _phases: ContextVar[Tuple[str, ...]] = ContextVar("phases", default=())
+
+    @staticmethod
+    @contextmanager
+    def phase(name: str):
+        """ Times a block, and records analyses within it under this phase
+        """
+        token = Metrics._phases.set(Metrics._phases.get() + (name,))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics._phases.reset(token)
+            Metrics._add(name, calls=1, seconds=time.perf_counter() - start)
+
+    @staticmethod
+    def timed(name: str) -> Callable:
+        """ Decorator that records each call of a function or coroutine
+            function as a phase
+        """
+        def decorator(f):
+            if asyncio.iscoroutinefunction(f):
+                @functools.wraps(f)
+                async def async_wrapper(*args, **kwargs):
+                    with Metrics.phase(name):
+                        return await f(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                with Metrics.phase(name):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def current_phase() -> Optional[str]:
+        phases = Metrics._phases.get()
+        return phases[-1] if phases else None
+
+    @staticmethod
+    def record_analysis(kind: str, seconds: float,
+                        info: Union[List[InfoDict], InfoDict], cached=False):
+        """ Records an engine analysis. For multipv analyses, the depth
+            and nodes of the first line are counted
+        """
+        if isinstance(info, list):
+            info = info[0] if info else {}
+        phase = Metrics.current_phase()
+        key = "%s/%s" % (phase, kind) if phase else kind
+        Metrics._add(
+            key,
+            calls=1,
+            seconds=seconds,
+            engine_seconds=0 if cached else seconds,
+            cache_hits=1 if cached else 0,
+            depth=info.get("depth", 0),
+            nodes=0 if cached else info.get("nodes", 0),
+        )
+
+    @staticmethod
+    def record_pruned(reason: str, searches: int):
+        """ Records a puzzle abandoned early, and the number of analyses
+            that were skipped
+        """
+        phase = Metrics.current_phase()
+        key = "%s/pruned/%s" % (phase, reason) if phase else "pruned/" + reason
+        Metrics._add(key, calls=1, searches_saved=searches)
+
+    @staticmethod
+    def record_reused(kind: str):
+        """ Records an analysis that was skipped because another analysis
+            already had its result
+        """
+        phase = Metrics.current_phase()
+        key = "%s/reused/%s" % (phase, kind) if phase else "reused/" + kind
+        Metrics._add(key, calls=1, searches_saved=1)
+
+    @staticmethod
+    def record_speculation(used: bool):
+        """ Records whether a speculative analysis was used
+        """
+        phase = Metrics.current_phase()
+        outcome = "used" if used else "wasted"
+        key = "%s/speculative/%s" % (phase, outcome) if phase else "speculative/" + outcome
+        Metrics._add(key, calls=1)
+
+    @staticmethod
+    def analysis_totals(phase: str) -> Dict[str, Union[int, float]]:
+        """ Totals of the analyses recorded under a phase, without the
+            analyses saved by pruning or reusing other analyses, or the
+            outcomes of speculations
+        """
+        totals: Dict[str, Union[int, float]] = {field: 0 for field in STAT_FIELDS}
+        with Metrics._lock:
+            for kind in ANALYSIS_KINDS:
+                stats = Metrics.stats.get("%s/%s" % (phase, kind), {})
+                for field, value in stats.items():
+                    totals[field] += value
+        return totals
+
+    @staticmethod
+    def take() -> Dict[str, Dict[str, Union[int, float]]]:
+        """ Returns the metrics recorded so far and resets them, so worker
+            processes can send what they recorded to the main process
+        """
+        with Metrics._lock:
+            stats = Metrics.stats
+            Metrics.stats = {}
+        return stats
+
+    @staticmethod
+    def merge(stats: Dict[str, Dict[str, Union[int, float]]]):
+        for key, values in stats.items():
+            Metrics._add(key, **values)
+
+    @staticmethod
+    def reset():
+        with Metrics._lock:
+            Metrics.stats = {}
+
+    @staticmethod
+    def summary() -> str:
+        """ A table of the metrics of each phase and analysis
+        """
+        lines = ["%-28s %8s %10s %8s %6s %10s %8s %6s" % (
+            "phase", "calls", "seconds", "avg ms", "depth", "knodes", "knps", "cached"
+        )]
+        with Metrics._lock:
+            stats = sorted(Metrics.stats.items())
+        for key, s in stats:
+            calls = s["calls"] or 1
+            lines.append("%-28s %8d %10.2f %8.1f %6s %10s %8s %6s" % (
+                key,
+                s["calls"],
+                s["seconds"],
+                1000 * s["seconds"] / calls,
+                "%.1f" % (s["depth"] / calls) if s["depth"] else "",
+                "%d" % (s["nodes"] / 1000) if s["engine_seconds"] else "",
+                "%d" % (s["nodes"] / 1000 / s["engine_seconds"]) if s["engine_seconds"] else "",
+                s["cache_hits"] if s["cache_hits"] else "",
+            ))
+        for name, how in (("pruned", "pruning"), ("reused", "reusing other analyses")):
+            searches_saved = sum(
+                s["searches_saved"] for key, s in stats if "%s/" % name in key
+            )
+            if searches_saved:
+                lines.append("%d analyses saved by %s (~%.1f seconds)" % (
+                    searches_saved, how, searches_saved * _average_analysis_seconds(stats)
+                ))
+        return "\n".join(lines)
+
+    @staticmethod
+    def write(path: str, **extra):
+        """ Atomically writes the metrics to a JSON file
+
+            extra - other values to include, e.g. the number of games
+        """
+        with Metrics._lock:
+            stats = {key: dict(values) for key, values in Metrics.stats.items()}
+        data = dict(extra, time=time.time(), phases=stats)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _add(key: str, **values):
+        with Metrics._lock:
+            stats = Metrics.stats.get(key)
+            if stats is None:
+                stats = Metrics.stats[key] = {field: 0 for field in STAT_FIELDS}
+            for field, value in values.items():
+                stats[field] += value
+
+
+def _average_analysis_seconds(stats) -> float:
+    """ The average engine time of the analyses of puzzle positions
+    """
+    seconds = 0.0
+    calls = 0
+    for key, s in stats:
+        if key.startswith("generate/") and s["engine_seconds"]:
+            seconds += s["engine_seconds"]
+            calls += s["calls"] - s["cache_hits"]
+    return seconds / calls if calls else 0.0
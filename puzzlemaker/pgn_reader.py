@@ -0,0 +1,352 @@
+from typing import IO, Dict, Iterator, List, Optional, TextIO, Tuple, Union, cast
+import bz2
+import gzip
+import io
+import itertools
+import lzma
+import os
+import re
+import sys
+
+import chess.pgn
+from chess.pgn import Game, GameBuilder
+
+from puzzlemaker.game_filter import GameFilter
+
+try:
+    # zstd-compressed PGNs can be read if the zstandard module is available
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# headers kept in the index for each game
+INDEX_HEADERS = [
+    "Event", "WhiteElo", "BlackElo", "TimeControl", "Termination", "PlyCount",
+]
+
+INDEX_VERSION = 1
+
+HEADER_REGEX = re.compile(rb'^\[([A-Za-z0-9_]+)\s+"(.*)"\]\s*$')
+
+# reads PGNs from standard input
+STDIN = "-"
+
+# magic bytes at the start of compressed files
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class PgnIndex(object):
+    """ Index of the games in a PGN file, stored in a sidecar file next to it
+
+        offsets [list(int)]:
+          byte offset of the first line of each game
+
+        headers [list(dict)]:
+          the INDEX_HEADERS of each game that has them
+    """
+    def __init__(self, pgn_path: str, offsets: List[int],
+                 headers: List[Dict[str, str]]):
+        self.pgn_path = pgn_path
+        self.offsets = offsets
+        self.headers = headers
+
+    @staticmethod
+    def sidecar_path(pgn_path: str) -> str:
+        return pgn_path + ".idx"
+
+    @staticmethod
+    def build(pgn_path: str) -> "PgnIndex":
+        """ Finds the start of every game in one pass over the file
+            without parsing any moves
+        """
+        offsets: List[int] = []
+        headers: List[Dict[str, str]] = []
+        with open_pgn_binary(pgn_path) as f:
+            for offset, lines in split_games(f):
+                offsets.append(offset)
+                headers.append(_headers(lines, INDEX_HEADERS))
+        return PgnIndex(pgn_path, offsets, headers)
+
+    @staticmethod
+    def load(pgn_path: str) -> Optional["PgnIndex"]:
+        """ Loads the sidecar index if it's up to date with the PGN file
+        """
+        index_path = PgnIndex.sidecar_path(pgn_path)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            if f.readline().rstrip("\n") != _index_signature(pgn_path):
+                return None
+            columns = f.readline().rstrip("\n").split("\t")[1:]
+            offsets = []
+            headers = []
+            for line in f:
+                values = line.rstrip("\n").split("\t")
+                offsets.append(int(values[0]))
+                headers.append({
+                    name: value for name, value in zip(columns, values[1:]) if value
+                })
+        return PgnIndex(pgn_path, offsets, headers)
+
+    @staticmethod
+    def load_or_build(pgn_path: str) -> "PgnIndex":
+        index = PgnIndex.load(pgn_path)
+        if index is None:
+            index = PgnIndex.build(pgn_path)
+            index.save()
+        return index
+
+    def save(self):
+        with open(PgnIndex.sidecar_path(self.pgn_path), "w", encoding="utf-8") as f:
+            f.write(_index_signature(self.pgn_path) + "\n")
+            f.write("\t".join(["offset"] + INDEX_HEADERS) + "\n")
+            for offset, headers in zip(self.offsets, self.headers):
+                values = [headers.get(name, "").replace("\t", " ") for name in INDEX_HEADERS]
+                f.write("\t".join([str(offset)] + values) + "\n")
+
+    def shard(self, shard: int, n_shards: int) -> Tuple[int, int]:
+        """ The [start, end) game indexes of one of n_shards equal parts
+        """
+        if not 0 <= shard < n_shards:
+            raise ValueError("Shard must be between 0 and %d" % (n_shards - 1))
+        n_games = len(self.offsets)
+        return (n_games * shard // n_shards, n_games * (shard + 1) // n_shards)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+def split_games(f: io.BufferedIOBase) -> Iterator[Tuple[int, List[bytes]]]:
+    """ Yields (byte offset, lines) of each game in a PGN file. Games are
+        split where their headers start, without parsing any moves
+    """
+    offset = 0
+    start: Optional[int] = None
+    lines: List[bytes] = []
+    in_headers = False
+    for line in f:
+        if line.startswith(b"[") and not line.startswith(b"[%"):
+            if not in_headers:
+                in_headers = True
+                if start is not None:
+                    yield start, lines
+                start = offset
+                lines = []
+        elif line.strip():
+            if start is None:
+                # a game without any headers at the start of the file
+                start = offset
+            in_headers = False
+        if start is not None:
+            lines.append(line)
+        offset += len(line)
+    if start is not None:
+        yield start, lines
+
+
+def _headers(lines: List[bytes], names: Optional[List[str]] = None) -> Dict[str, str]:
+    """ The headers at the start of a game's lines, or only the named ones
+    """
+    headers = {}
+    for line in lines:
+        if not line.startswith(b"["):
+            if line.strip():
+                break
+            continue
+        match = HEADER_REGEX.match(line)
+        if match:
+            name = match.group(1).decode("ascii")
+            if names is None or name in names:
+                headers[name] = match.group(2).decode("utf-8", "replace")
+    return headers
+
+
+def _index_signature(pgn_path: str) -> str:
+    stat = os.stat(pgn_path)
+    return "# puzzlemaker pgn index v%d size=%d mtime=%d" % (
+        INDEX_VERSION, stat.st_size, stat.st_mtime_ns
+    )
+
+
+def open_pgn_binary(pgn_path: str) -> io.BufferedIOBase:
+    """ Opens a PGN file, or standard input if the path is "-", and
+        decompresses it on the fly if it's gzip, bz2, xz or zstd-compressed
+    """
+    if pgn_path == STDIN:
+        f = cast(io.BufferedReader, sys.stdin.buffer)
+    else:
+        f = open(pgn_path, "rb")
+    compression = _compression(f)
+    if compression in ("gzip", "bz2", "xz") and pgn_path != STDIN:
+        # reopened by path, so closing the decompressed file closes the file
+        f.close()
+        source: Union[str, io.BufferedReader] = pgn_path
+    else:
+        source = f
+    if compression == "gzip":
+        return gzip.open(source, "rb")
+    elif compression == "bz2":
+        return bz2.open(source, "rb")
+    elif compression == "xz":
+        return lzma.open(source, "rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            f.close()
+            raise ValueError("Install the zstandard module to read %s" % pgn_path)
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        return io.BufferedReader(reader)
+    return f
+
+
+def open_pgn(pgn_path: str, offset=0) -> io.TextIOWrapper:
+    """ Opens a PGN file for reading games, starting at a byte offset
+    """
+    f = open_pgn_binary(pgn_path)
+    if offset:
+        f.seek(offset)
+    return io.TextIOWrapper(cast(IO[bytes], f), encoding="utf-8", errors="replace")
+
+
+def is_seekable(pgn_path: str) -> bool:
+    """ If games can be read from a byte offset in the PGN without
+        reading everything before it
+    """
+    if pgn_path == STDIN:
+        return False
+    with open(pgn_path, "rb") as f:
+        return _compression(f) is None
+
+
+def _compression(f: io.BufferedReader) -> Optional[str]:
+    magic = f.peek(len(XZ_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    elif magic.startswith(BZ2_MAGIC):
+        return "bz2"
+    elif magic.startswith(XZ_MAGIC):
+        return "xz"
+    elif magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def read_game_at(pgn_path: str, offset: int) -> Optional[Game]:
+    with open_pgn(pgn_path, offset) as pgn:
+        return chess.pgn.read_game(pgn)
+
+
+class FilteringGameBuilder(GameBuilder):
+    """ Builds games that match a GameFilter. The moves of other games
+        are skipped without being parsed
+
+        result() is (game, True/False if the game matches the filter)
+    """
+    def __init__(self, game_filter: GameFilter):
+        super().__init__()
+        self.game_filter = game_filter
+        self.matches: Optional[bool] = None
+
+    def end_headers(self):
+        self.matches = self.game_filter.matches(self.game.headers)
+        if self.matches is False:
+            return chess.pgn.SKIP
+
+    def result(self) -> Tuple[Game, bool]:
+        game = super().result()
+        if self.matches is None:
+            plies = sum(1 for _ in game.mainline_moves())
+            self.matches = self.game_filter.matches(game.headers, plies) is True
+        return game, self.matches
+
+
+def read_games(pgn_path: str, start_index=0, end_index=None,
+               index: Optional[PgnIndex] = None,
+               game_filter: Optional[GameFilter] = None) -> Iterator[Tuple[int, Game]]:
+    """ Yields (game index, game) for games in [start_index, end_index)
+        that match the filter, if there is one
+
+        With an index, seeks straight to the first game. Otherwise the games
+        before start_index are skipped by reading only their headers
+    """
+    game_id = start_index
+    if index:
+        if start_index >= len(index):
+            return
+        pgn = open_pgn(pgn_path, index.offsets[start_index])
+    else:
+        pgn = open_pgn(pgn_path)
+        for _ in range(start_index):
+            if chess.pgn.read_headers(pgn) is None:
+                pgn.close()
+                return
+    with pgn:
+        while end_index is None or game_id < end_index:
+            if game_filter:
+                result = read_filtered_game(pgn, game_filter)
+            else:
+                game = chess.pgn.read_game(pgn)
+                result = None if game is None else (game, True)
+            if result is None:
+                return
+            game, matches = result
+            if matches:
+                yield game_id, game
+            game_id += 1
+
+
+def read_game_texts(pgn_path: str, start_index=0, end_index=None,
+                    index: Optional[PgnIndex] = None,
+                    game_filter: Optional[GameFilter] = None) -> Iterator[Tuple[int, str]]:
+    """ Yields (game index, PGN text) for games in [start_index, end_index),
+        so games can be handed to other processes without parsing them here
+
+        game_filter - skip games whose headers don't match it. Games are
+          only skipped if the filter rejects them based on the headers alone
+    """
+    game_id = start_index
+    with open_pgn_binary(pgn_path) as f:
+        if index:
+            if start_index >= len(index):
+                return
+            f.seek(index.offsets[start_index])
+            games = split_games(f)
+        else:
+            games = itertools.islice(split_games(f), start_index, None)
+        for _, lines in games:
+            if end_index is not None and game_id >= end_index:
+                return
+            if not game_filter or game_filter.matches(_headers(lines)) is not False:
+                yield game_id, b"".join(lines).decode("utf-8", "replace")
+            game_id += 1
+
+
+def read_filtered_game(pgn: TextIO, game_filter: GameFilter) -> Optional[Tuple[Game, bool]]:
+    """ Reads the next game and whether it matches the filter, or None at
+        the end of the file
+    """
+    return chess.pgn.read_game(pgn, Visitor=lambda: FilteringGameBuilder(game_filter))
+
+
+def game_offsets(index: PgnIndex, start_index=0, end_index=None,
+                 game_filter: Optional[GameFilter] = None) -> Iterator[Tuple[int, int]]:
+    """ Yields (game index, byte offset) for games in [start_index, end_index)
+
+        game_filter - skip games whose indexed headers don't match it.
+          Games are only skipped if the filter rejects them based on the
+          indexed headers alone
+    """
+    if end_index is None or end_index > len(index):
+        end_index = len(index)
+    for game_id in range(start_index, end_index):
+        if game_filter and game_filter.matches(index.headers[game_id]) is False:
+            continue
+        yield game_id, index.offsets[game_id]
+
+
+def can_filter_with_index(game_filter: GameFilter) -> bool:
+    """ If the index has every header needed to fully evaluate the filter
+    """
+    return game_filter.header_names() <= set(INDEX_HEADERS)
@@ -1,14 +1,18 @@
 from collections import namedtuple
-from typing import Optional
+from typing import Generator, Optional
 
-from chess import Move
+from chess import WHITE, Board, Move
 import chess.pgn
 
 from puzzlemaker.puzzle_position import PuzzlePosition
 from puzzlemaker.puzzle_exporter import PuzzleExporter
-from puzzlemaker.logger import log, log_board, log_move
+from puzzlemaker.logger import log, log_board, log_move, log_enabled
 from puzzlemaker.colors import Color
-from puzzlemaker.analysis import AnalysisEngine, AnalyzedMove
+from puzzlemaker.analysis import (
+    AnalysisRequest, AnalyzedMove, format_limit, limit_depth, run_analyses
+)
+from puzzlemaker.async_analysis import run_analyses_async
+from puzzlemaker.metrics import Metrics
 from puzzlemaker.utils import material_difference
 from puzzlemaker.constants import MIN_PLAYER_MOVES
 
@@ -36,8 +40,21 @@ class Puzzle(object):
 
         check_ambiguity [Boolean]:
           if true, don't generate new positions when the best move is ambiguous
+
+        initial_analysis [AnalyzedMove]:
+          optional earlier analysis of the initial board (e.g. from scanning a game)
+          reused instead of searching again if it's deep enough
+
+        initial_move_analysis [AnalyzedMove]:
+          optional earlier analysis of the board after the initial move
+          reused to score the initial move if it's deep enough
+
+        pruned [str]:
+          why generating the puzzle was abandoned early, once it was clear
+          it couldn't be complete
     """
-    def __init__(self, initial_board, initial_move=None):
+    def __init__(self, initial_board, initial_move=None,
+                 initial_analysis=None, initial_move_analysis=None):
         self.initial_score = None
         self.initial_board = initial_board.copy()
         self.initial_move = initial_move
@@ -45,10 +62,22 @@ class Puzzle(object):
         self.final_score = None
         self.positions = []
         self.analyzed_moves = []
+        self.initial_analysis: Optional[AnalyzedMove] = initial_analysis
+        self.initial_move_analysis: Optional[AnalyzedMove] = initial_move_analysis
+        self.player_moves_first = None
+        self.pruned: Optional[str] = None
 
-    def _analyze_best_initial_move(self, depth) -> Move:
-        log(Color.BLACK, "Evaluating best initial move (depth %d)..." % depth)
-        best_move = AnalysisEngine.best_move(self.initial_board, depth)
+    def _analyze_best_initial_move(
+        self, depth
+    ) -> Generator[AnalysisRequest, AnalyzedMove, Optional[Move]]:
+        best_move: AnalyzedMove
+        earlier = self.initial_analysis
+        if earlier is not None and _is_deep_enough(earlier, depth) and earlier.move:
+            log(Color.BLACK, "Using earlier analysis of best initial move (depth %d)", earlier.depth)
+            best_move = earlier
+        else:
+            log(Color.BLACK, "Evaluating best initial move (%s)...", format_limit(depth))
+            best_move = yield AnalysisRequest("best_move", (self.initial_board, depth))
         if best_move.move:
             self.analyzed_moves.append(best_move)
             log_move(self.initial_board, best_move.move, best_move.score, show_uci=True)
@@ -57,18 +86,62 @@ class Puzzle(object):
 
     def _analyze_initial_moves(self, depth):
         """ get the score of the position before the initial move
-            also get the score of the position after the initial move
+            also get the score of the position after the initial move, if
+            it's known yet. True if it has to be scored after the search of
+            the initial position
         """
-        best_move = self._analyze_best_initial_move(depth)
+        best_move = yield from self._analyze_best_initial_move(depth)
         if not self.initial_move:
-            return
+            return False
         elif self.initial_move == best_move:
             log(Color.BLACK, "The move played was the best move")
-        else:
-            log(Color.BLACK, "Evaluating played initial move (depth %d)..." % depth)
-            analyzed_move = AnalysisEngine.evaluate_move(self.initial_board, self.initial_move, depth)
+        elif self.initial_move_analysis is not None and \
+                _is_deep_enough(self.initial_move_analysis, depth):
+            earlier = self.initial_move_analysis
+            log(
+                Color.BLACK,
+                "Using earlier analysis of played initial move (depth %d)",
+                earlier.depth,
+            )
+            analyzed_move = AnalyzedMove(
+                self.initial_move,
+                self.initial_board.san(self.initial_move),
+                earlier.score,
+                earlier.depth,
+                [self.initial_move] + (earlier.pv or []),
+            )
             self.analyzed_moves.append(analyzed_move)
             log_move(self.initial_board, self.initial_move, analyzed_move.score, show_uci=True)
+        else:
+            return True
+        return False
+
+    def _analyze_played_initial_move(self, depth):
+        """ score the played initial move with the search of the position
+            after it, or search the move on its own if that has no score
+        """
+        position = self.initial_position
+        if position.score is not None and position.candidate_moves:
+            log(
+                Color.BLACK,
+                "Using analysis of the position after the played initial move (depth %s)",
+                position.depth,
+            )
+            analyzed_move = AnalyzedMove(
+                self.initial_move,
+                self.initial_board.san(self.initial_move),
+                position.score,
+                position.depth,
+                [self.initial_move] + (position.candidate_moves[0].pv or []),
+            )
+            Metrics.record_reused("played_move")
+        else:
+            log(Color.BLACK, "Evaluating played initial move (%s)...", format_limit(depth))
+            analyzed_move = yield AnalysisRequest(
+                "evaluate_move", (self.initial_board, self.initial_move, depth)
+            )
+        self.analyzed_moves.append(analyzed_move)
+        log_move(self.initial_board, self.initial_move, analyzed_move.score, show_uci=True)
 
     def _set_initial_position(self):
         initial_move = self.initial_move
@@ -102,6 +175,37 @@ class Puzzle(object):
         else:
             return True
 
+    def _n_player_moves(self, n_positions=None) -> int:
+        """ The number of player moves in a puzzle with n_positions positions
+        """
+        if n_positions is None:
+            n_positions = len(self.positions)
+        n_player_moves = 1 if self.player_moves_first else 0
+        return n_player_moves + int((n_positions - 1) / 2)
+
+    def _max_positions(self, position: PuzzlePosition) -> Optional[int]:
+        """ The most positions the puzzle can have if the position is a
+            forced mate, assuming the engine doesn't find a longer mate later
+        """
+        if not position.is_mate():
+            return None
+        score = position.score if position.board.turn == WHITE else -position.score
+        mate = score.mate()
+        assert mate is not None
+        if mate > 0:
+            # the side to move mates on its last move
+            n_plies = 2 * mate - 1
+        else:
+            n_plies = -2 * mate
+        return len(self.positions) + n_plies
+
+    def _prune(self, reason: str, searches: int):
+        """ Abandons the puzzle and records the searches that were skipped
+        """
+        log(Color.YELLOW, "Not going deeper: %s", reason.replace("_", " "))
+        self.pruned = reason
+        Metrics.record_pruned(reason, searches)
+
     def _calculate_final_score(self, depth):
         """ Get the score of the final board position in the puzzle
             after the last move is made
@@ -110,29 +214,87 @@ class Puzzle(object):
         if final_score:
             self.final_score = final_score
         else:
-            self.final_score = AnalysisEngine.score(self.positions[-1].board, depth)
+            self.final_score = yield AnalysisRequest("score", (self.positions[-1].board, depth))
 
-    def generate(self, depth):
+    def _speculate(self, position: PuzzlePosition, depth, verify_multipv=False):
+        """ While a position is searched, start searching the position after
+            its expected best move: the second move of the principal
+            variation that led to it
+        """
+        if position is self.initial_position:
+            lines = [m.pv for m in self.analyzed_moves if m.move == position.initial_move]
+            if not lines and self.initial_move_analysis and self.initial_move_analysis.pv:
+                lines = [[self.initial_move] + self.initial_move_analysis.pv]
+        else:
+            lines = [m.pv for m in self.positions[-1].candidate_moves[:1]]
+        pv = lines[0] if lines else None
+        if not pv or len(pv) < 2 or pv[0] != position.initial_move or \
+                not position.board.is_legal(pv[1]):
+            return
+        next_position = PuzzlePosition(position.board, pv[1])
+        if next_position.board.is_game_over():
+            return
+        yield AnalysisRequest("speculate", (next_position.first_analysis(depth, verify_multipv),))
+
+    def _evaluate_position(self, position: PuzzlePosition, depth, verify_multipv=False,
+                           speculate=False):
+        if speculate:
+            yield from self._speculate(position, depth, verify_multipv)
+        yield from position.evaluate_steps(depth, verify_multipv)
+
+    @Metrics.timed("generate")
+    def generate(self, depth, verify_multipv=False, speculate=False):
         """ Generate new positions for the puzzle until a final position is reached
+
+            verify_multipv - search each position with multipv 1 as well, and
+              report when it disagrees with the multipv search
+            speculate - search the expected next position on another engine
+              while the current position is searched
+        """
+        run_analyses(self.generate_steps(depth, verify_multipv, speculate))
+
+    @Metrics.timed("generate")
+    async def generate_async(self, depth, verify_multipv=False):
+        """ generate() with the analyses of AsyncAnalysisEngine
+        """
+        await run_analyses_async(self.generate_steps(depth, verify_multipv))
+
+    def generate_steps(self, depth, verify_multipv=False, speculate=False):
+        """ generate() as a generator of the AnalysisRequests it needs
         """
         log_board(self.initial_board)
-        self._analyze_initial_moves(depth)
+        if self.initial_move and _is_game_over(self.initial_board, self.initial_move):
+            # the puzzle has no player moves, so the initial moves and
+            # final position aren't searched
+            searches = 1 + (not _is_deep_enough(self.initial_analysis, depth)) + \
+                (not _is_deep_enough(self.initial_move_analysis, depth))
+            self._prune("game_over", searches)
+            log(Color.RED, "Puzzle incomplete")
+            return
+        score_played_move = yield from self._analyze_initial_moves(depth)
         self._set_initial_position()
         position = self.initial_position
-        position.evaluate(depth)
+        yield from self._evaluate_position(position, depth, verify_multipv, speculate)
+        if score_played_move:
+            yield from self._analyze_played_initial_move(depth)
         self.player_moves_first = self._player_moves_first()
         is_player_move = not self.player_moves_first
         while True:
             self.positions.append(position)
             if position.is_final(is_player_move):
-                log_str = "Not going deeper: "
-                if position.is_ambiguous():
-                    log_str += "ambiguous"
-                elif position.board.is_game_over():
-                    log_str += "game over"
-                log(Color.YELLOW, log_str)
+                if log_enabled():
+                    log_str = "Not going deeper: "
+                    if position.is_ambiguous():
+                        log_str += "ambiguous"
+                    elif position.board.is_game_over():
+                        log_str += "game over"
+                    log(Color.YELLOW, log_str)
+                break
+            max_positions = self._max_positions(position)
+            if max_positions and self._n_player_moves(max_positions) < MIN_PLAYER_MOVES:
+                self._prune("short_mate", max_positions - len(self.positions))
                 break
-            else:
+            if log_enabled():
                 log_str = "Going deeper..."
                 if is_player_move is not None:
                     if is_player_move:
@@ -144,9 +306,14 @@ class Puzzle(object):
                         log_str += " not player move"
                 log(Color.DIM, log_str)
             position = PuzzlePosition(position.board, position.best_move)
-            position.evaluate(depth)
+            yield from self._evaluate_position(position, depth, verify_multipv, speculate)
             is_player_move = not is_player_move
-        self._calculate_final_score(depth)
+        if self._n_player_moves() >= MIN_PLAYER_MOVES or self.positions[-1].score:
+            yield from self._calculate_final_score(depth)
+        elif not self.pruned:
+            # the puzzle is incomplete whatever its final score is,
+            # so the final position isn't searched
+            Metrics.record_pruned("few_player_moves", 1)
         if self.is_complete():
             log(Color.GREEN, "Puzzle is complete")
         else:
@@ -215,10 +382,25 @@ class Puzzle(object):
         """ Verify that this sequence of moves represents a complete puzzle
             Incomplete if too short or if the puzzle could not be categorized
         """
-        n_player_moves = 1 if self.player_moves_first else 0
-        n_player_moves += int((len(self.positions) - 1) / 2)
-        if n_player_moves < MIN_PLAYER_MOVES:
+        if self.pruned or self._n_player_moves() < MIN_PLAYER_MOVES:
             return False
         if self.category():
             return True
         return False
+
+
+def _is_game_over(board: Board, move: Move) -> bool:
+    board.push(move)
+    try:
+        return board.is_game_over()
+    finally:
+        board.pop()
+
+
+def _is_deep_enough(analyzed_move: Optional[AnalyzedMove], depth) -> bool:
+    """ If an earlier analysis can be used instead of searching at this depth.
+        Searches without a depth limit always run
+    """
+    if not analyzed_move or analyzed_move.depth is None or limit_depth(depth) is None:
+        return False
+    return analyzed_move.depth >= limit_depth(depth)
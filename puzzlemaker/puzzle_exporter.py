@@ -1,3 +1,8 @@
+from typing import Dict, List
+import csv
+import io
+import json
+
 import chess
 from chess.pgn import Game
 
@@ -11,8 +16,31 @@ def _score_to_str(score) -> str:
     else:
         return score.cp
 
+def _score_to_dict(score) -> Dict[str, int]:
+    if score.is_mate():
+        return {"mate": score.mate()}
+    return {"cp": score.score()}
+
+
+def _score_to_csv(score) -> str:
+    if score.is_mate():
+        return "#%d" % score.mate()
+    return str(score.score())
+
+
+# headers of the source game that are exported as CSV columns
+CSV_SOURCE_HEADERS = [
+    "Event", "Site", "Date", "White", "Black", "WhiteElo", "BlackElo", "TimeControl",
+]
+
+CSV_COLUMNS = [
+    "FEN", "Moves", "Category", "Winner", "InitialScore", "FinalScore",
+    "Engine", "Version",
+] + CSV_SOURCE_HEADERS
+
+
 class PuzzleExporter(object):
-    """ Exports a puzzle to a PGN file
+    """ Exports a puzzle to a PGN, JSON or CSV record
     """
     def __init__(self, puzzle):
         self.puzzle = puzzle
@@ -60,3 +88,49 @@ class PuzzleExporter(object):
 
     def to_pgn(self, pgn_headers=None) -> str:
         return str(self.export(pgn_headers)).replace("}", "}\n")
+
+    def moves(self) -> List[str]:
+        """ The UCI moves of the puzzle from its initial position
+        """
+        return [position.initial_move.uci() for position in self.puzzle.positions]
+
+    def to_dict(self, pgn_headers=None) -> dict:
+        """ pgn_headers - headers of the source game to include
+        """
+        headers = {}
+        if pgn_headers:
+            headers = {h: v for h, v in pgn_headers.items() if h not in ("FEN", "SetUp")}
+        return {
+            "fen": self.puzzle.initial_board.fen(),
+            "moves": self.moves(),
+            "category": self.puzzle.category(),
+            "winner": self.puzzle.winner(),
+            "initial_score": _score_to_dict(self.puzzle.initial_score),
+            "final_score": _score_to_dict(self.puzzle.final_score),
+            "engine": AnalysisEngine.name(),
+            "version": __version__,
+            "headers": headers,
+        }
+
+    def to_json(self, pgn_headers=None) -> str:
+        """ The puzzle as one line of JSON
+        """
+        return json.dumps(self.to_dict(pgn_headers), separators=(",", ":"))
+
+    def to_csv_row(self, pgn_headers=None) -> str:
+        """ The puzzle as a CSV row with CSV_COLUMNS
+        """
+        pgn_headers = pgn_headers or {}
+        row = [
+            self.puzzle.initial_board.fen(),
+            " ".join(self.moves()),
+            self.puzzle.category(),
+            self.puzzle.winner() or "",
+            _score_to_csv(self.puzzle.initial_score),
+            _score_to_csv(self.puzzle.final_score),
+            AnalysisEngine.name(),
+            __version__,
+        ] + [pgn_headers.get(h, "") for h in CSV_SOURCE_HEADERS]
+        f = io.StringIO()
+        csv.writer(f, lineterminator="\n").writerow(row)
+        return f.getvalue()
@@ -1,44 +1,148 @@
-from typing import List
+from typing import Generator, List, Optional
 
-from chess import Board
-from chess.pgn import Game
+from chess import Board, Move
+from chess.pgn import Game, ChildNode
 from chess.engine import Score, Cp
 
 from puzzlemaker.logger import log, log_move
 from puzzlemaker.colors import Color
-from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.analysis import (
+    AnalysisRequest, AnalyzedMove, SearchLimit, format_limit, run_analyses
+)
+from puzzlemaker.async_analysis import run_analyses_async
+from puzzlemaker.metrics import Metrics
 from puzzlemaker.puzzle import Puzzle
 from puzzlemaker.utils import sign, material_total, material_count
-from puzzlemaker.constants import SCAN_DEPTH
+from puzzlemaker.constants import SCAN_DEPTH, COARSE_SCAN_MARGIN
 
 
-def find_puzzle_candidates(game: Game, scan_depth=SCAN_DEPTH) -> List[Puzzle]:
-    """ finds puzzle candidates from a chess game 
+@Metrics.timed("scan")
+def find_puzzle_candidates(game: Game, scan_depth: SearchLimit = SCAN_DEPTH,
+                           use_pgn_evals=False, coarse_depth=None,
+                           margin=COARSE_SCAN_MARGIN) -> List[Puzzle]:
+    """ finds puzzle candidates from a chess game
+
+        each candidate keeps the scan analyses of its position before and
+        after the move, so they can be reused when generating the puzzle
+
+        scan_depth - a depth, or a Limit by nodes or movetime
+        use_pgn_evals - use [%eval ...] annotations in move comments instead
+          of the engine for moves that have them
+        coarse_depth - scan every move at this depth first, and only search
+          moves at scan_depth if the scores are within `margin` cp of
+          making the position worth investigating
+    """
+    return run_analyses(find_puzzle_candidates_steps(
+        game, scan_depth, use_pgn_evals, coarse_depth, margin
+    ))
+
+@Metrics.timed("scan")
+async def find_puzzle_candidates_async(game: Game, scan_depth: SearchLimit = SCAN_DEPTH,
+                                       use_pgn_evals=False, coarse_depth=None,
+                                       margin=COARSE_SCAN_MARGIN) -> List[Puzzle]:
+    """ find_puzzle_candidates() with the analyses of AsyncAnalysisEngine
     """
-    log(Color.DIM, "Scanning game for puzzles (depth: %d)..." % scan_depth)
+    return await run_analyses_async(find_puzzle_candidates_steps(
+        game, scan_depth, use_pgn_evals, coarse_depth, margin
+    ))
+
+def find_puzzle_candidates_steps(game: Game, scan_depth: SearchLimit = SCAN_DEPTH,
+                                 use_pgn_evals=False, coarse_depth=None,
+                                 margin=COARSE_SCAN_MARGIN):
+    """ find_puzzle_candidates() as a generator of the AnalysisRequests it needs
+    """
+    if use_pgn_evals:
+        log(Color.DIM, "Scanning game for puzzles (PGN evals, %s)...", format_limit(scan_depth))
+    else:
+        log(Color.DIM, "Scanning game for puzzles (%s)...", format_limit(scan_depth))
     prev_score = Cp(0)
+    prev_analysis = None
+    prev_refined = True
     puzzles = []
-    i = 0
-    node = game
-    while not node.is_end():
-        next_node = node.variation(0)
-        next_board = next_node.board()
-        cur_score = AnalysisEngine.best_move(next_board, scan_depth).score
-        board = node.board()
+    # walk one board through the game instead of calling node.board(),
+    # which replays the game from the start for every move
+    board = game.board()
+    for node in game.mainline():
+        move = node.move
+        cur_analysis = None
+        refined = True
+        if use_pgn_evals:
+            cur_analysis = _pgn_eval_analysis(node)
+        if not cur_analysis:
+            refined = not coarse_depth
+            cur_analysis = yield from _scan_move(board, move, coarse_depth or scan_depth)
+        cur_score = cur_analysis.score
+        if not (refined and prev_refined) and \
+                might_investigate(prev_score, cur_score, board, margin):
+            # the coarse scores are close to the thresholds, so search
+            # both positions as deep as a full scan would
+            if not prev_refined:
+                prev_analysis = yield AnalysisRequest("best_move", (board, scan_depth))
+                prev_score = prev_analysis.score
+            if not refined:
+                cur_analysis = yield from _scan_move(board, move, scan_depth)
+                cur_score = cur_analysis.score
+            refined = True
         highlight_move = False
         if should_investigate(prev_score, cur_score, board):
             highlight_move = True
             puzzle = Puzzle(
                 board,
-                next_node.move,
+                move,
+                initial_analysis=prev_analysis,
+                initial_move_analysis=cur_analysis,
             )
             puzzles.append(puzzle)
-        log_move(board, next_node.move, cur_score, highlight=highlight_move)
+        log_move(board, move, cur_score, highlight=highlight_move)
         prev_score = cur_score
-        node = next_node
-        i += 1
+        prev_analysis = cur_analysis
+        prev_refined = refined
+        board.push(move)
     return puzzles
 
+def _scan_move(board: Board, move: Move,
+               depth: SearchLimit) -> Generator[AnalysisRequest, AnalyzedMove, AnalyzedMove]:
+    """ The analysis of the position after a move
+    """
+    board.push(move)
+    try:
+        return (yield AnalysisRequest("best_move", (board, depth)))
+    finally:
+        board.pop()
+
+def _pgn_eval_analysis(node: ChildNode) -> Optional[AnalyzedMove]:
+    """ The [%eval ...] annotation of the position after a move, if there is one
+    """
+    score = node.eval()
+    if score is None:
+        return None
+    return AnalyzedMove(None, None, score.white(), node.eval_depth())
+
+def might_investigate(a: Score, b: Score, board: Board,
+                      margin=COARSE_SCAN_MARGIN) -> bool:
+    """ determine if deeper searches might make the position worth
+        investigating, if their scores and the difference between them are
+        within `margin` cp of the scores A and B of shallow searches.
+
+        this is looser than should_investigate, so positions it rules out
+        wouldn't have been investigated at the shallow scores either
+    """
+    a_cp = a.score()
+    b_cp = b.score()
+    if a_cp is None or b_cp is None:
+        # mates found by shallow searches are almost always found by
+        # deeper searches, so only mates for the same side are ruled out
+        return not (a.is_mate() and b.is_mate() and sign(a) == sign(b))
+    if material_total(board) <= 3:
+        return False
+    # from an even position, the position changed by more than 1.1 cp
+    if abs(a_cp) < 110 + margin and abs(b_cp - a_cp) >= 110 - margin:
+        return True
+    # from a winning position, the position is now even or losing
+    if abs(a_cp) > 200 - margin and (abs(b_cp) < 110 + margin or sign(b) != sign(a)):
+        return True
+    return False
+
 def should_investigate(a: Score, b: Score, board: Board) -> bool:
     """ determine if the difference between scores A and B
         makes the position worth investigating for a puzzle.
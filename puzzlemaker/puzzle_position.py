@@ -1,12 +1,14 @@
-from typing import List
+from typing import List, Optional
 from collections import namedtuple
 
 from chess import Board, Move
 from chess.engine import Score
 
-from puzzlemaker.logger import log, log_board, log_move
+from puzzlemaker.logger import log, log_board, log_move, log_enabled
 from puzzlemaker.colors import Color
-from puzzlemaker.analysis import AnalysisEngine, AnalyzedMove, ambiguous_best_move
+from puzzlemaker.analysis import (
+    AnalysisRequest, AnalyzedMove, ambiguous_best_move, format_limit, limit_depth, run_analyses,
+)
 from puzzlemaker.utils import material_difference, material_count, fullmove_string
 from puzzlemaker.constants import NUM_CANDIDATE_MOVES
 
@@ -19,6 +21,7 @@ class PuzzlePosition(object):
             best_move [Move] - the best move from the board position (after initial_move)
             score [Score] - the score for the board position (after initial_move)
             candidate_moves [List<AnalyzedMove>] - best candidate moves from this position
+            depth [int] - the depth reached by the search of this position
         """
         self.initial_board: Board = initial_board.copy()
         self.initial_move: Move = initial_move
@@ -28,17 +31,20 @@ class PuzzlePosition(object):
         self.best_move: Move = None
         self.score: Score = None
         self.candidate_moves: List[AnalyzedMove] = []
+        self.depth: Optional[int] = None
 
     def _log_position(self):
+        if not log_enabled():
+            return
         if self.initial_move:
             move_san = self.initial_board.san(self.initial_move)
             log(
                 Color.VIOLET,
-                "\nAfter %s %s" % (fullmove_string(self.initial_board).strip(), move_san)
+                "\nAfter %s %s", fullmove_string(self.initial_board).strip(), move_san
             )
         log_board(self.board)
-        log(Color.DARK_BLUE, "Material difference:  %d" % material_difference(self.board))
-        log(Color.DARK_BLUE, "# legal moves:        %d" % self._num_legal_moves())
+        log(Color.DARK_BLUE, "Material difference:  %d", material_difference(self.board))
+        log(Color.DARK_BLUE, "# legal moves:        %d", self._num_legal_moves())
 
     def _log_move(self, move, score):
         log_move(self.board, move, score, show_uci=True)
@@ -49,10 +55,11 @@ class PuzzlePosition(object):
     def _calculate_best_move(self, depth):
         """ Find the best move from board position using multipv 1
         """
-        log(Color.BLACK, "Evaluating best move (depth %d)..." % depth)
-        best_move = AnalysisEngine.best_move(self.board, depth)
+        log(Color.BLACK, "Evaluating best move (%s)...", format_limit(depth))
+        best_move = yield AnalysisRequest("best_move", (self.board, depth))
         self.best_move = best_move.move
         self.score = best_move.score
+        self.depth = best_move.depth
         if self._num_legal_moves() == 1:
             self.candidate_moves = [best_move]
         self._log_move(self.best_move, self.score)
@@ -61,20 +68,68 @@ class PuzzlePosition(object):
         """ Find the best move from board position using multipv 3
         """
         multipv = NUM_CANDIDATE_MOVES
-        log(Color.BLACK, "Evaluating best %d moves (depth %d)..." % (multipv, depth))
-        self.candidate_moves = AnalysisEngine.best_moves(self.board, depth, multipv)
+        log(Color.BLACK, "Evaluating best %d moves (%s)...", multipv, format_limit(depth))
+        self.candidate_moves = yield AnalysisRequest("best_moves", (self.board, depth, multipv))
+        if self.candidate_moves:
+            self.depth = self.candidate_moves[0].depth
+            if self.depth and limit_depth(depth) and self.depth < limit_depth(depth):
+                log(Color.BLACK, "Stopped at depth %d", self.depth)
         for analyzed_move in self.candidate_moves:
             self._log_move(analyzed_move.move, analyzed_move.score)
 
-    def evaluate(self, depth):
+    def _use_best_candidate_move(self):
+        """ Take the best move and score from the multipv search
+        """
+        if len(self.candidate_moves) == 0:
+            return
+        best_move = self.candidate_moves[0]
+        self.best_move = best_move.move
+        self.score = best_move.score
+
+    def _verify_candidate_moves(self):
+        """ Report when the multipv search disagrees with the multipv 1 search
+        """
+        if len(self.candidate_moves) == 0:
+            return
+        multipv_best_move = self.candidate_moves[0].move
+        if multipv_best_move != self.best_move:
+            log(
+                Color.RED,
+                "Best move differs between multipv %d (%s) and multipv 1 (%s)",
+                len(self.candidate_moves), multipv_best_move.uci(), self.best_move.uci()
+            )
+
+    def first_analysis(self, depth, verify_multipv=False) -> AnalysisRequest:
+        """ The first analysis evaluate() requests, so it can be started early
+        """
+        if verify_multipv:
+            return AnalysisRequest("best_move", (self.board, depth))
+        return AnalysisRequest("best_moves", (self.board, depth, NUM_CANDIDATE_MOVES))
+
+    def evaluate(self, depth, verify_multipv=False):
+        """ Derives the best move, score and candidate moves from one multipv search
+
+            verify_multipv - also search with multipv 1 and report if the best
+              move differs. The multipv 1 best move and score are used
+        """
+        run_analyses(self.evaluate_steps(depth, verify_multipv))
+
+    def evaluate_steps(self, depth, verify_multipv=False):
+        """ evaluate() as a generator of the AnalysisRequests it needs
+        """
         self._log_position()
         if self._num_legal_moves() == 0:
             return
-        self._calculate_best_move(depth)
+        if not verify_multipv:
+            yield from self._calculate_candidate_moves(depth)
+            self._use_best_candidate_move()
+            return
+        yield from self._calculate_best_move(depth)
         if not self.best_move:
             return
         if self._num_legal_moves() > 1:
-            self._calculate_candidate_moves(depth)
+            yield from self._calculate_candidate_moves(depth)
+            self._verify_candidate_moves()
 
     def is_mate(self) -> bool:
         return self.score and self.score.is_mate()
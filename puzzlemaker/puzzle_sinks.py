@@ -0,0 +1,76 @@
+from typing import Optional, TextIO
+import sys
+
+from puzzlemaker.puzzle_exporter import PuzzleExporter, CSV_COLUMNS
+from puzzlemaker.constants import OUTPUT_BUFFER_SIZE
+
+OUTPUT_FORMATS = ["pgn", "jsonl", "csv"]
+
+
+def export_puzzle(puzzle, output_format: str, pgn_headers=None) -> str:
+    """ Renders a puzzle as a record of an output format, ready to be
+        written to a PuzzleSink. Worker processes export puzzles themselves
+        so the main process only writes them
+    """
+    exporter = PuzzleExporter(puzzle)
+    if output_format == "pgn":
+        return exporter.to_pgn(pgn_headers)
+    elif output_format == "jsonl":
+        return exporter.to_json(pgn_headers) + "\n"
+    elif output_format == "csv":
+        return exporter.to_csv_row(pgn_headers)
+    raise ValueError("Unknown output format: %s" % output_format)
+
+
+class PuzzleSink(object):
+    """ Writes exported puzzles to a file, or standard output if there's no path
+
+        offset - continue writing to an existing file, truncated to this size
+    """
+    def __init__(self, output_format: str, path: Optional[str] = None,
+                 offset: Optional[int] = None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: %s" % output_format)
+        self.output_format = output_format
+        self.path = path
+        self.n_puzzles = 0
+        if path:
+            self.f: TextIO = open(
+                path, "w" if offset is None else "a",
+                encoding="utf-8", newline="", buffering=OUTPUT_BUFFER_SIZE
+            )
+            if offset is not None:
+                self.f.truncate(offset)
+                self.f.seek(offset)
+        else:
+            self.f = sys.stdout
+        if output_format == "csv" and not offset:
+            self.f.write(",".join(CSV_COLUMNS) + "\n")
+
+    def write(self, record: str):
+        """ record - a puzzle rendered by export_puzzle
+        """
+        if self.output_format == "pgn":
+            record += "\n\n"
+        self.f.write(record)
+        self.n_puzzles += 1
+
+    def flush(self) -> Optional[int]:
+        """ Flushes buffered puzzles. Returns the size of the output file
+        """
+        self.f.flush()
+        if self.path:
+            return self.f.tell()
+        return None
+
+    def close(self):
+        if self.path:
+            self.f.close()
+        else:
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,279 @@
+from argparse import Namespace
+from collections import deque, namedtuple
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+)
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple, Union
+import io
+import logging
+import multiprocessing
+import multiprocessing.util
+
+import chess.pgn
+from chess.pgn import Game
+
+from puzzlemaker.logger import configure_logging, log
+from puzzlemaker.colors import Color
+from puzzlemaker.analysis import AnalysisEngine, SearchLimit, search_limit
+from puzzlemaker.eval_cache import EvalCache
+from puzzlemaker.engine_replay import engine_factory
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from puzzlemaker.puzzle_finder import find_puzzle_candidates
+from puzzlemaker.pgn_reader import read_game_at
+from puzzlemaker.puzzle_sinks import export_puzzle
+from puzzlemaker.game_filter import GameFilter
+
+# puzzles are exported in the process that generated them, so results
+# can be merged without another engine in the parent process
+# skipped - the game didn't match the game filter
+# metrics - Metrics recorded by a worker process while processing the game
+GameResult = namedtuple(
+    "GameResult", ["game_id", "n_positions", "puzzles", "skipped", "metrics"],
+    defaults=(False, None)
+)
+
+# the settings and game filter of a worker process
+_settings = Namespace()
+_game_filter: Optional[GameFilter] = None
+
+
+def configure_analysis_engine(settings, engines):
+    """ Configures AnalysisEngine from command-line settings
+    """
+    cache = None
+    if settings.cache:
+        cache = EvalCache(settings.cache, max_entries=settings.cache_size)
+    AnalysisEngine.configure(
+        engines=engines,
+        threads=settings.threads,
+        memory=settings.memory,
+        cache=cache,
+        engine_factory=engine_factory(settings.record, settings.replay),
+        stable_depths=settings.stable_depths,
+        scan_engines=settings.scan_engines if getattr(settings, "pipeline", False) else None,
+    )
+
+
+def scan_limit(settings) -> SearchLimit:
+    """ How far to search each move of a game when scanning it
+    """
+    return search_limit(settings.scan_depth, settings.scan_nodes, settings.scan_movetime)
+
+
+def puzzle_search_limit(settings) -> SearchLimit:
+    """ How far to search each position of a puzzle
+    """
+    return search_limit(settings.search_depth, settings.search_nodes, settings.search_movetime)
+
+
+def process_game(game_id: int, game: Game, settings) -> GameResult:
+    """ Scans a game for puzzle candidates and generates puzzles from them
+    """
+    log(Color.MAGENTA, "\nGame index: %d", game_id)
+    log(Color.DARK_BLUE, "%s", game)
+    puzzles = find_puzzle_candidates(
+        game,
+        scan_depth=scan_limit(settings),
+        coarse_depth=settings.coarse_scan_depth,
+        use_pgn_evals=settings.pgn_evals,
+    )
+    n = len(puzzles)
+    log(Color.YELLOW, "# positions to consider: %d", n)
+    puzzles_out = []
+    if not settings.scan_only:
+        generate_puzzles(
+            puzzles, puzzle_search_limit(settings), settings.verify_multipv,
+            getattr(settings, "speculate", False),
+        )
+        for puzzle in puzzles:
+            if puzzle.is_complete():
+                puzzles_out.append(export_puzzle(puzzle, settings.format, game.headers))
+    AnalysisEngine.health_check()
+    return GameResult(game_id, n, puzzles_out)
+
+
+def generate_puzzles(puzzles: List[Puzzle], depth: SearchLimit, verify_multipv=False,
+                     speculate=False):
+    """ Generates puzzles from the candidates of a game. With a pool of
+        several engines, candidates are generated at the same time on
+        separate threads, so a game takes about as long as its slowest
+        candidate
+    """
+    n = len(puzzles)
+
+    def generate(i: int):
+        log(Color.MAGENTA, "\nConsidering position %d of %d...", i+1, n)
+        puzzles[i].generate(depth, verify_multipv, speculate)
+
+    n_threads = min(AnalysisEngine.n_engines, n)
+    if n_threads <= 1:
+        for i in range(n):
+            generate(i)
+        return
+    with ThreadPoolExecutor(n_threads) as executor:
+        # raises the first exception from any of the threads
+        list(executor.map(generate, range(n)))
+
+
+def process_games(games: Iterable[Tuple[int, Game]], settings) -> Iterator[GameResult]:
+    """ Processes games one at a time in this process
+    """
+    for game_id, game in games:
+        yield process_game(game_id, game, settings)
+
+
+def process_games_pipelined(games: Iterable[Tuple[int, Game]], settings) -> Iterator[GameResult]:
+    """ Processes games in stages, so later games are scanned while the
+        candidates of earlier games are generated:
+
+          reader -> scanner -> generator -> exporter
+
+        Games are read (and results exported) by the caller. Scanning runs
+        on settings.scan_engines threads with their own engine pool, and
+        generating on one thread per engine of the main pool. Up to
+        2 * (scan engines + engines) games are in flight, and results are
+        yielded in input order
+    """
+    n_scan_engines = AnalysisEngine.n_scan_engines or 1
+    max_pending = 2 * (n_scan_engines + AnalysisEngine.n_engines)
+    with ThreadPoolExecutor(n_scan_engines, thread_name_prefix="scan") as scanner, \
+            ThreadPoolExecutor(AnalysisEngine.n_engines, thread_name_prefix="generate") as generator:
+        pending: Deque[Tuple[int, Game, Future]] = deque()
+        for game_id, game in games:
+            pending.append((game_id, game, scanner.submit(_scan_stage, game, generator, settings)))
+            while len(pending) >= max_pending:
+                yield _export_stage(*pending.popleft(), settings)
+        while pending:
+            yield _export_stage(*pending.popleft(), settings)
+
+
+def _scan_stage(game: Game, generator: ThreadPoolExecutor,
+                settings) -> List[Tuple[Puzzle, Optional[Future]]]:
+    """ Scans a game on the scan pool and queues the generation of its
+        candidates. Returns each candidate with the future of its generation,
+        or None if only scanning
+    """
+    with AnalysisEngine.scanning():
+        puzzles = find_puzzle_candidates(
+            game,
+            scan_depth=scan_limit(settings),
+            coarse_depth=settings.coarse_scan_depth,
+            use_pgn_evals=settings.pgn_evals,
+        )
+    if settings.scan_only:
+        return [(puzzle, None) for puzzle in puzzles]
+    depth = puzzle_search_limit(settings)
+    speculate = getattr(settings, "speculate", False)
+    return [
+        (puzzle, generator.submit(puzzle.generate, depth, settings.verify_multipv, speculate))
+        for puzzle in puzzles
+    ]
+
+
+def _export_stage(game_id: int, game: Game, scan: Future, settings) -> GameResult:
+    """ Waits for a game's candidates to be generated and exports its puzzles
+    """
+    candidates = scan.result()
+    n = len(candidates)
+    log(Color.MAGENTA, "\nGame index: %d", game_id)
+    log(Color.YELLOW, "# positions considered: %d", n)
+    puzzles_out = []
+    for puzzle, generation in candidates:
+        if generation is None:
+            continue
+        generation.result()
+        if puzzle.is_complete():
+            puzzles_out.append(export_puzzle(puzzle, settings.format, game.headers))
+    AnalysisEngine.health_check()
+    return GameResult(game_id, n, puzzles_out)
+
+
+def process_games_in_parallel(games: Iterable[Tuple[int, Union[Game, str, int]]],
+                              settings, ordered=True) -> Iterator[GameResult]:
+    """ Fans games out to settings.workers processes, each owning its own
+        engine. Results are yielded in input order if `ordered`,
+        otherwise as soon as they finish
+
+        games - (game index, game), (game index, PGN text of the game) or
+          (game index, byte offset of the game in settings.pgn), in which
+          case workers read the game themselves
+    """
+    n_workers = settings.workers
+    max_pending = 2 * n_workers
+    with ProcessPoolExecutor(n_workers, mp_context=_mp_context(),
+                             initializer=_init_worker,
+                             initargs=(settings,)) as executor:
+        pending: Deque[Future] = deque()
+        for game_id, game in games:
+            if isinstance(game, int):
+                future = executor.submit(_process_game_at, game_id, game)
+            elif isinstance(game, str):
+                future = executor.submit(_process_pgn, game_id, game)
+            else:
+                future = executor.submit(_process_pgn, game_id, str(game))
+            pending.append(future)
+            while len(pending) >= max_pending:
+                yield from _finished_results(pending, ordered)
+        while pending:
+            yield from _finished_results(pending, ordered)
+
+
+def _finished_results(pending: deque, ordered: bool) -> Iterator[GameResult]:
+    if ordered:
+        yield _merge_metrics(pending.popleft().result())
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+        yield _merge_metrics(future.result())
+
+
+def _merge_metrics(result: GameResult) -> GameResult:
+    if result.metrics:
+        Metrics.merge(result.metrics)
+    return result
+
+
+def _mp_context():
+    # make_puzzles.py isn't import-safe, so avoid start methods that
+    # re-import the main module in each worker
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def _init_worker(settings):
+    global _settings, _game_filter
+    _settings = settings
+    if getattr(settings, "filter", None):
+        _game_filter = GameFilter(settings.filter)
+    if settings.quiet:
+        configure_logging(level=logging.INFO)
+    else:
+        configure_logging(level=logging.DEBUG)
+    configure_analysis_engine(settings, engines=1)
+    # the engine's background thread would otherwise keep the worker
+    # process alive when the pool shuts down
+    multiprocessing.util.Finalize(None, AnalysisEngine.quit, exitpriority=10)
+
+
+def _process_pgn(game_id: int, pgn: str) -> GameResult:
+    return _process_worker_game(game_id, chess.pgn.read_game(io.StringIO(pgn)))
+
+
+def _process_game_at(game_id: int, offset: int) -> GameResult:
+    return _process_worker_game(game_id, read_game_at(_settings.pgn, offset))
+
+
+def _process_worker_game(game_id: int, game: Optional[Game]) -> GameResult:
+    if game is None:
+        return GameResult(game_id, 0, [], skipped=True)
+    if _game_filter:
+        # games may have been sent by their headers alone, without
+        # deciding on filters that need the moves
+        plies = len(list(game.mainline_moves()))
+        if not _game_filter.matches(game.headers, plies):
+            return GameResult(game_id, 0, [], skipped=True)
+    result = process_game(game_id, game, _settings)
+    return result._replace(metrics=Metrics.take())
@@ -14,6 +14,33 @@ def test(c, unit=False, integration=False):
     c.run(cmd, pty=True)
 
 
+@task
+def bench(c, scan_depth=10, search_depth=12, scan_nodes=0, search_nodes=0,
+          scan_movetime=0.0, search_movetime=0.0, replay='', record='', output='', compare=''):
+    """ Benchmark the scan, generate and export stages on a fixed corpus
+    """
+    cmd = "PYTHONPATH=. python3 benchmarks/bench_pipeline.py"
+    cmd += " --scan-depth %d --search-depth %d" % (scan_depth, search_depth)
+    if scan_nodes:
+        cmd += " --scan-nodes %d" % scan_nodes
+    if search_nodes:
+        cmd += " --search-nodes %d" % search_nodes
+    if scan_movetime:
+        cmd += " --scan-movetime %g" % scan_movetime
+    if search_movetime:
+        cmd += " --search-movetime %g" % search_movetime
+    if replay:
+        cmd += " --replay %s" % replay
+    if record:
+        cmd += " --record %s" % record
+    if not output:
+        output = "bench-%s.json" % c.run("git rev-parse --short HEAD", hide=True).stdout.strip()
+    cmd += " --output %s" % output
+    if compare:
+        cmd += " --compare %s" % compare
+    c.run(cmd, pty=True)
+
+
 @task
 def type_check(c):
     """ Check types
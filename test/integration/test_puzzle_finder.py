@@ -6,6 +6,7 @@ import chess.pgn
 
 from puzzlemaker.puzzle_finder import find_puzzle_candidates
 from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.engine_replay import engine_factory_from_environment
 
 
 def pgn_file_path(pgn_filename) -> io.TextIOWrapper:
@@ -17,6 +18,7 @@ class TestPuzzleFinder(unittest.TestCase):
 
     @classmethod
     def setUpClass(self):
+        AnalysisEngine.configure(engine_factory=engine_factory_from_environment())
         AnalysisEngine.instance()
 
     @classmethod
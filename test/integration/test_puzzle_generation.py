@@ -7,6 +7,7 @@ import chess.pgn
 
 from puzzlemaker.puzzle import Puzzle
 from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.engine_replay import engine_factory_from_environment
 
 # from puzzlemaker.logger import configure_logging
 # configure_logging()
@@ -24,6 +25,7 @@ class TestPuzzleIsComplete(unittest.TestCase):
 
     @classmethod
     def setUpClass(self):
+        AnalysisEngine.configure(engine_factory=engine_factory_from_environment())
         AnalysisEngine.instance()
 
     @classmethod
@@ -0,0 +1,179 @@
+""" Fake chess engines for unit tests, which analyse positions instantly
+    and deterministically instead of searching them
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from chess.engine import Cp, Mate, PovScore
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.utils import material_difference
+
+
+def by_uci(board, moves):
+    return sorted(moves, key=lambda m: m.uci())
+
+
+def legal_moves_score(board, move, i):
+    """ Mate in 1 for the best move in check, otherwise the number of
+        legal moves minus the rank of the move
+    """
+    if i == 0 and board.is_check():
+        return Mate(1)
+    return Cp(board.legal_moves.count() - i)
+
+
+def mate_score(board, move, i):
+    """ Mate in 1 with the best move, and getting mated in 1 otherwise
+    """
+    return Mate(1) if i == 0 else Mate(-1)
+
+
+def material_after(board, move) -> float:
+    """ The material difference after a move, for the side that moves
+    """
+    board.push(move)
+    difference = material_difference(board)
+    board.pop()
+    return difference if board.turn else -difference
+
+
+def by_material(board, moves):
+    """ The moves that win the most material right away first
+    """
+    return sorted(by_uci(board, moves), key=lambda m: -material_after(board, m))
+
+
+def material_score(board, move, i):
+    return Cp(int(100 * material_after(board, move)))
+
+
+def clear_best_move_until(ply: int):
+    """ A clearly best move until the game reaches a ply, and
+        legal_moves_score() from then on
+    """
+    def score(board, move, i):
+        if board.ply() < ply:
+            return Cp(400 if i == 0 else 0)
+        return legal_moves_score(board, move, i)
+    return score
+
+
+class FakeAnalysisEngine(object):
+    """ Stands in for a chess engine
+
+        rank(board, moves) - orders moves from best to worst
+        score(board, move, i) - the score of the i-th best move, for the
+          side to move
+        pv_length - number of moves of each principal variation, which
+          continues with the best ranked replies
+        delay - seconds each analysis takes, so concurrent analyses need
+          more than one engine
+
+        Keeps track of the analyses, the limits they were run with, the
+        analyses restricted to root moves and the threads they ran on
+    """
+    def __init__(self, rank=by_uci, score=legal_moves_score, pv_length=1, delay=0.0):
+        self.id = {"name": "Fake Engine"}
+        self.rank = rank
+        self.score = score
+        self.pv_length = pv_length
+        self.delay = delay
+        self.options = {}
+        self.n_analyses = 0
+        self.n_root_moves_analyses = 0
+        self.limits = []
+        self.threads = set()
+
+    def configure(self, options):
+        self.options.update(options)
+
+    def analyse(self, board, limit, multipv=None, root_moves=None):
+        self.n_analyses += 1
+        if root_moves:
+            self.n_root_moves_analyses += 1
+        self.limits.append(limit)
+        self.threads.add(threading.current_thread().name)
+        if self.delay:
+            time.sleep(self.delay)
+        moves = self.rank(board, list(root_moves or board.legal_moves))
+        infos = []
+        for i, move in enumerate(moves[:multipv or 1]):
+            infos.append({
+                "score": PovScore(self.score(board, move, i), board.turn),
+                "pv": self._pv(board, move),
+                "depth": limit.depth or 1,
+                "nodes": 1000,
+            })
+        return infos if multipv else infos[0]
+
+    def _pv(self, board, move):
+        board = board.copy()
+        pv = [move]
+        board.push(move)
+        while len(pv) < self.pv_length:
+            replies = self.rank(board, list(board.legal_moves))
+            if not replies:
+                break
+            pv.append(replies[0])
+            board.push(replies[0])
+        return pv
+
+    def ping(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+class AsyncFakeAnalysisEngine(object):
+    """ FakeAnalysisEngine with coroutines, which tracks how many analyses
+        run at once on all engines
+    """
+    running = 0
+    max_running = 0
+
+    def __init__(self, **kwargs):
+        self.engine = FakeAnalysisEngine(**kwargs)
+        self.id = self.engine.id
+
+    async def analyse(self, board, limit, **kwargs):
+        AsyncFakeAnalysisEngine.running += 1
+        AsyncFakeAnalysisEngine.max_running = max(
+            AsyncFakeAnalysisEngine.max_running, AsyncFakeAnalysisEngine.running
+        )
+        await asyncio.sleep(0.01)
+        AsyncFakeAnalysisEngine.running -= 1
+        return self.engine.analyse(board, limit, **kwargs)
+
+    async def quit(self):
+        pass
+
+
+class FakeEngineTestCase(unittest.TestCase):
+    """ Runs AnalysisEngine on fake engines, and resets it and the metrics
+        after each test. The engines started are in self.engines
+    """
+    def setUp(self):
+        self.engines = []
+        Metrics.reset()
+
+    def tearDown(self):
+        AnalysisEngine.quit()
+        AnalysisEngine.configure()
+        Metrics.reset()
+
+    def configure_engines(self, engines=1, scan_engines=None, **kwargs):
+        """ kwargs - the settings of each FakeAnalysisEngine
+        """
+        def new_engine():
+            engine = FakeAnalysisEngine(**kwargs)
+            self.engines.append(engine)
+            return engine
+        AnalysisEngine.configure(
+            engines=engines, scan_engines=scan_engines, engine_factory=new_engine
+        )
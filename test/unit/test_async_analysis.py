@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import chess
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.async_analysis import AsyncAnalysisEngine, stockfish_engine_async
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from test.unit.fakes import AsyncFakeAnalysisEngine, FakeAnalysisEngine
+
+
+async def start_fake_engine():
+    return AsyncFakeAnalysisEngine()
+
+
+class TestAsyncAnalysisEngine(unittest.TestCase):
+
+    def setUp(self):
+        AsyncFakeAnalysisEngine.max_running = 0
+        AsyncAnalysisEngine.configure(engines=2, engine_factory=start_fake_engine)
+        Metrics.reset()
+
+    def tearDown(self):
+        AnalysisEngine.configure()
+        AsyncAnalysisEngine.configure()
+        Metrics.reset()
+
+    def run_with_engines(self, *coroutines):
+        async def run():
+            try:
+                return await asyncio.gather(*coroutines)
+            finally:
+                await AsyncAnalysisEngine.quit()
+        return asyncio.run(run())
+
+    def test_analyses_run_concurrently_on_the_engines(self):
+        board = chess.Board()
+        boards = []
+        for move in list(board.legal_moves)[:6]:
+            boards.append(board.copy())
+            boards[-1].push(move)
+        analyzed_moves = self.run_with_engines(
+            *[AsyncAnalysisEngine.best_move(b, 10) for b in boards]
+        )
+        self.assertEqual(len(analyzed_moves), 6)
+        self.assertEqual(AsyncFakeAnalysisEngine.max_running, 2)
+        self.assertEqual(Metrics.stats["best_move"]["calls"], 6)
+
+    def test_generating_puzzles_concurrently(self):
+        fens = [
+            "6k1/R4p2/1r3npp/2N5/P1b2P2/6P1/3r2BP/4R1K1 w - - 0 34",
+            "6rr/1k3p2/1pb1p1np/p1p1P2R/2P3R1/2P1B3/P1BK1PP1/8 b - - 5 26",
+        ]
+        async_puzzles = [Puzzle(chess.Board(fen)) for fen in fens]
+        self.run_with_engines(*[puzzle.generate_async(10) for puzzle in async_puzzles])
+        self.assertEqual(Metrics.stats["generate"]["calls"], 2)
+        self.assertIn("generate/best_moves", Metrics.stats)
+
+        AnalysisEngine.configure(engine_factory=FakeAnalysisEngine)
+        for fen, async_puzzle in zip(fens, async_puzzles):
+            puzzle = Puzzle(chess.Board(fen))
+            puzzle.generate(10)
+            self.assertEqual(
+                [position.initial_move for position in async_puzzle.positions],
+                [position.initial_move for position in puzzle.positions],
+            )
+
+    def test_starting_stockfish_when_it_isnt_found(self):
+        with mock.patch("shutil.which", return_value=None), \
+                mock.patch("glob.glob", return_value=[]):
+            with self.assertRaisesRegex(FileNotFoundError, "Stockfish not found"):
+                asyncio.run(stockfish_engine_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
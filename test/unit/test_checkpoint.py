@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from puzzlemaker.checkpoint import Checkpoint
+from puzzlemaker.puzzle_sinks import PuzzleSink
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "run.checkpoint")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_games_finished_out_of_order(self):
+        checkpoint = Checkpoint(self.path, "games.pgn")
+        games = checkpoint.track((i, None) for i in range(5))
+        for _ in range(4):
+            next(games)
+        checkpoint.complete(2)
+        checkpoint.complete(0)
+        self.assertEqual(checkpoint.next_game, 1)
+        self.assertEqual(checkpoint.completed, {2})
+        checkpoint.complete(1)
+        self.assertEqual(checkpoint.next_game, 3)
+        self.assertEqual(checkpoint.completed, set())
+        self.assertTrue(checkpoint.is_complete(2))
+        self.assertFalse(checkpoint.is_complete(3))
+
+    def test_games_skipped_by_the_reader(self):
+        checkpoint = Checkpoint(self.path, "games.pgn", 10)
+        games = checkpoint.track((i, None) for i in [12, 15])
+        next(games)
+        checkpoint.complete(12)
+        self.assertEqual(checkpoint.next_game, 13)
+        next(games)
+        checkpoint.complete(15)
+        self.assertEqual(checkpoint.next_game, 16)
+
+    def test_resuming_skips_completed_games(self):
+        checkpoint = Checkpoint(self.path, "games.pgn")
+        games = checkpoint.track((i, None) for i in range(5))
+        for _ in range(4):
+            next(games)
+        checkpoint.complete(0)
+        checkpoint.complete(3)
+        checkpoint.save(output_offset=123, totals={"n_games": 2})
+
+        loaded = Checkpoint.load(self.path)
+        self.assertEqual(loaded.pgn_path, "games.pgn")
+        self.assertEqual(loaded.output_offset, 123)
+        self.assertEqual(loaded.totals, {"n_games": 2})
+        resumed = loaded.track((i, None) for i in range(loaded.next_game, 5))
+        self.assertEqual([game_id for game_id, _ in resumed], [1, 2, 4])
+
+    def test_output_is_truncated_to_the_checkpoint(self):
+        output_path = os.path.join(self.tmp_dir, "puzzles.csv")
+        with PuzzleSink("csv", output_path) as sink:
+            sink.write("a\n")
+            offset = sink.flush()
+            sink.write("b\n")
+        with PuzzleSink("csv", output_path, offset) as sink:
+            sink.write("c\n")
+        with open(output_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1:], ["a", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
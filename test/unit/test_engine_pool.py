@@ -0,0 +1,178 @@
+import queue
+import threading
+import unittest
+
+from chess.engine import EngineTerminatedError
+
+from puzzlemaker.engine_pool import EnginePool
+
+
+class FakeEngine(object):
+
+    def __init__(self):
+        self.id = {"name": "Fake Engine"}
+        self.options = {}
+        self.alive = True
+        self.quit_called = False
+
+    def configure(self, options):
+        self.options.update(options)
+
+    def ping(self):
+        if not self.alive:
+            raise EngineTerminatedError("engine process died")
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestEnginePool(unittest.TestCase):
+
+    def test_engines_are_started_lazily_up_to_pool_size(self):
+        pool = EnginePool(FakeEngine, size=2)
+        self.assertEqual(len(pool.engines), 0)
+        a = pool.checkout()
+        b = pool.checkout()
+        self.assertIsNot(a, b)
+        self.assertEqual(len(pool.engines), 2)
+        with self.assertRaises(queue.Empty):
+            pool.checkout(timeout=0.01)
+        pool.checkin(a)
+        self.assertIs(pool.checkout(), a)
+
+    def test_engines_are_configured_with_options(self):
+        pool = EnginePool(FakeEngine, options={"Threads": 2, "Hash": 64})
+        engine = pool.checkout()
+        self.assertEqual(engine.options, {"Threads": 2, "Hash": 64})
+
+    def test_crashed_engine_is_replaced(self):
+        pool = EnginePool(FakeEngine, size=1)
+        with self.assertRaises(EngineTerminatedError):
+            with pool.engine() as engine:
+                crashed = engine
+                raise EngineTerminatedError("engine process died")
+        self.assertTrue(crashed.quit_called)
+        self.assertEqual(len(pool.engines), 1)
+        self.assertIsNot(pool.checkout(), crashed)
+
+    def test_health_check_restarts_unresponsive_engines(self):
+        pool = EnginePool(FakeEngine, size=2)
+        a = pool.checkout()
+        b = pool.checkout()
+        a.alive = False
+        pool.checkin(a)
+        pool.checkin(b)
+        self.assertEqual(pool.health_check(), 1)
+        self.assertEqual(len(pool.engines), 2)
+        self.assertNotIn(a, pool.engines)
+        self.assertIn(b, pool.engines)
+
+    def test_failed_replacement_frees_its_place_in_the_pool(self):
+        starts = []
+
+        def factory():
+            starts.append(True)
+            if len(starts) == 2:
+                raise RuntimeError("engine failed to start")
+            return FakeEngine()
+
+        pool = EnginePool(factory, size=1)
+        engine = pool.checkout()
+        waiting = []
+        thread = threading.Thread(target=lambda: waiting.append(pool.checkout(timeout=5)))
+        thread.start()
+        with self.assertRaises(RuntimeError):
+            pool.checkin(engine, healthy=False)
+        thread.join(5)
+        self.assertEqual(len(waiting), 1)
+        self.assertIsNot(waiting[0], engine)
+        self.assertEqual(pool.engines, waiting)
+
+    def test_health_check_after_a_failed_replacement(self):
+        starts = []
+
+        def factory():
+            starts.append(True)
+            if len(starts) == 2:
+                raise RuntimeError("engine failed to start")
+            return FakeEngine()
+
+        pool = EnginePool(factory, size=1)
+        engine = pool.checkout()
+        with self.assertRaises(RuntimeError):
+            pool.checkin(engine, healthy=False)
+        self.assertEqual(pool.health_check(), 0)
+        self.assertIsInstance(pool.checkout(timeout=5), FakeEngine)
+
+    def test_quitting_while_an_engine_is_checked_out(self):
+        starts = []
+
+        def factory():
+            starts.append(True)
+            return FakeEngine()
+
+        pool = EnginePool(factory, size=1)
+        analysing = threading.Event()
+        crashed = threading.Event()
+        errors = []
+
+        def analyse():
+            try:
+                with pool.engine():
+                    analysing.set()
+                    crashed.wait(5)
+                    raise EngineTerminatedError("engine process died")
+            except EngineTerminatedError as e:
+                errors.append(e)
+        thread = threading.Thread(target=analyse)
+        thread.start()
+        analysing.wait(5)
+        pool.quit()
+        crashed.set()
+        thread.join(5)
+        self.assertEqual(len(errors), 1)
+        # the crashed engine isn't replaced once the pool was quit
+        self.assertEqual(len(starts), 1)
+        self.assertEqual(pool.engines, [])
+        with self.assertRaises(EngineTerminatedError):
+            pool.checkout()
+
+    def test_engines_checked_in_after_quitting_are_quit(self):
+        pool = EnginePool(FakeEngine, size=1)
+        engine = pool.checkout()
+        waiting = []
+
+        def checkout():
+            try:
+                pool.checkout(timeout=5)
+            except EngineTerminatedError as e:
+                waiting.append(e)
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        pool.quit()
+        thread.join(5)
+        self.assertEqual(len(waiting), 1)
+        engine.quit_called = False
+        pool.checkin(engine)
+        self.assertTrue(engine.quit_called)
+        self.assertEqual(pool.engines, [])
+
+    def test_name_is_read_once(self):
+        pool = EnginePool(FakeEngine, size=1)
+        self.assertEqual(pool.name(), "Fake Engine")
+        # doesn't wait for the engine to be checked in
+        engine = pool.checkout(timeout=0.01)
+        self.assertEqual(pool.name(), "Fake Engine")
+        pool.checkin(engine)
+
+    def test_quit(self):
+        pool = EnginePool(FakeEngine, size=1)
+        engine = pool.checkout()
+        pool.checkin(engine)
+        pool.quit()
+        self.assertTrue(engine.quit_called)
+        self.assertEqual(len(pool.engines), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import chess
+from chess.engine import Limit
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.engine_replay import EngineRecording, RecordingEngine, ReplayEngine
+from test.unit.fakes import FakeAnalysisEngine
+
+
+class TestEngineReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "analyses.jsonl")
+
+    def tearDown(self):
+        AnalysisEngine.configure()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replaying_recorded_analyses(self):
+        board = chess.Board()
+        board.push_san("e4")
+        e5 = chess.Move.from_uci("e7e5")
+        engine = RecordingEngine(FakeAnalysisEngine(), EngineRecording(self.path))
+        recorded = [
+            engine.analyse(board, Limit(depth=12)),
+            engine.analyse(board, Limit(depth=12), multipv=3),
+            engine.analyse(board, Limit(depth=12), root_moves=[e5]),
+        ]
+
+        replay = ReplayEngine(EngineRecording.load(self.path))
+        self.assertEqual(replay.id["name"], "Fake Engine")
+        replayed = [
+            replay.analyse(board, Limit(depth=12)),
+            replay.analyse(board, Limit(depth=12), multipv=3),
+            replay.analyse(board, Limit(depth=12), root_moves=[e5]),
+        ]
+        self.assertEqual(replayed, recorded)
+        with self.assertRaises(KeyError):
+            replay.analyse(board, Limit(depth=14))
+
+    def test_analysis_engine_with_replayed_analyses(self):
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        fake = FakeAnalysisEngine()
+        recording = EngineRecording(self.path)
+        AnalysisEngine.configure(engine_factory=lambda: RecordingEngine(fake, recording))
+        recorded = AnalysisEngine.best_moves(board, 10, multipv=3)
+
+        recording = EngineRecording.load(self.path)
+        AnalysisEngine.configure(engine_factory=lambda: ReplayEngine(recording))
+        self.assertEqual(AnalysisEngine.best_moves(board, 10, multipv=3), recorded)
+        self.assertEqual(AnalysisEngine.name(), "Fake Engine")
+        self.assertEqual(fake.n_analyses, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
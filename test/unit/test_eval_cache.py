@@ -0,0 +1,117 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import chess
+from chess import Board, Move
+from chess.engine import Cp, Mate, PovScore
+
+from puzzlemaker.eval_cache import EvalCache
+
+
+def info(score, pv, depth):
+    return {
+        "score": PovScore(score, chess.WHITE),
+        "pv": [Move.from_uci(move) for move in pv],
+        "depth": depth,
+    }
+
+
+class TestEvalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = EvalCache(os.path.join(self.tmp_dir, "evals.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cached_analysis_is_reused_at_same_or_lower_depth(self):
+        board = Board()
+        self.cache.put(board, 16, info(Cp(31), ["e2e4", "e7e5"], 16))
+        cached = self.cache.get(board, 16)
+        self.assertEqual(cached["score"].white(), Cp(31))
+        self.assertEqual(cached["pv"], [Move.from_uci("e2e4"), Move.from_uci("e7e5")])
+        self.assertEqual(cached["depth"], 16)
+        self.assertIsNotNone(self.cache.get(board, 12))
+        self.assertIsNone(self.cache.get(board, 22))
+
+    def test_deeper_analysis_replaces_shallower_analysis(self):
+        board = Board()
+        self.cache.put(board, 12, info(Cp(10), ["d2d4"], 12))
+        self.cache.put(board, 20, info(Cp(25), ["e2e4"], 20))
+        self.cache.put(board, 16, info(Cp(40), ["c2c4"], 16))
+        self.assertEqual(self.cache.get(board, 12)["score"].white(), Cp(25))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_stable_depths_are_part_of_the_key(self):
+        board = Board()
+        self.cache.put(board, 20, info(Cp(30), ["e2e4"], 10), stable_depths=2)
+        self.assertIsNone(self.cache.get(board, 20))
+        self.assertEqual(self.cache.get(board, 20, stable_depths=2)["depth"], 10)
+        self.cache.put(board, 20, info(Cp(25), ["d2d4"], 20))
+        self.assertEqual(self.cache.get(board, 20)["depth"], 20)
+
+    def test_analyses_of_an_older_schema_are_dropped(self):
+        path = os.path.join(self.tmp_dir, "old.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE evals (position INTEGER, multipv INTEGER, root_moves TEXT,"
+            " depth INTEGER, infos TEXT, last_used REAL)"
+        )
+        conn.execute("INSERT INTO evals VALUES (0, 0, '', 20, '[]', 0)")
+        conn.commit()
+        conn.close()
+        cache = EvalCache(path)
+        self.assertEqual(len(cache), 0)
+        cache.put(Board(), 16, info(Cp(31), ["e2e4"], 16))
+        self.assertIsNotNone(cache.get(Board(), 16))
+        cache.close()
+
+    def test_multipv_and_root_moves_are_part_of_the_key(self):
+        board = Board()
+        move = Move.from_uci("g2g4")
+        infos = [
+            info(Cp(30), ["e2e4"], 16),
+            info(Cp(25), ["d2d4"], 16),
+            info(Cp(20), ["g1f3"], 16),
+        ]
+        self.cache.put(board, 16, infos, multipv=3)
+        self.cache.put(board, 16, info(Cp(-90), ["g2g4"], 16), root_moves=[move])
+        self.assertIsNone(self.cache.get(board, 16))
+        self.assertEqual(
+            [i["score"].white() for i in self.cache.get(board, 16, multipv=3)],
+            [Cp(30), Cp(25), Cp(20)]
+        )
+        cached = self.cache.get(board, 16, root_moves=[move])
+        self.assertEqual(cached["score"].white(), Cp(-90))
+
+    def test_mate_scores(self):
+        board = Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        self.cache.put(board, 10, info(Mate(1), ["a1a8"], 10))
+        self.assertEqual(self.cache.get(board, 10)["score"].white(), Mate(1))
+
+    def test_least_recently_used_analyses_are_evicted(self):
+        self.cache.max_entries = 10
+        boards = []
+        board = Board()
+        for move in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"]:
+            board.push_uci(move)
+            boards.append(board.copy())
+        for i in range(3):
+            for b in boards:
+                self.cache.put(b.copy(), 10 + i, info(Cp(i), [], 10 + i))
+        for b in boards[:3]:
+            self.cache.get(b, 10)
+        self.cache.max_entries = 5
+        self.cache.put(Board(), 10, info(Cp(0), [], 10))
+        self.assertLessEqual(len(self.cache), 5)
+        for b in boards[:3]:
+            self.assertIsNotNone(self.cache.get(b, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from puzzlemaker.game_filter import GameFilter
+from puzzlemaker.pgn_reader import PgnIndex, read_games, game_offsets, can_filter_with_index
+
+HEADERS = {
+    "Event": "Rated Blitz game",
+    "WhiteElo": "1876",
+    "BlackElo": "2012",
+    "TimeControl": "300+5",
+}
+
+FIXTURES = ["5-22-duskbreaker.pgn", "carlsen-anand-blunder.wc2014.pgn", "wtharvey.pgn"]
+
+
+def fixture_path(pgn_filename) -> str:
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(cur_dir, '..', 'fixtures', pgn_filename)
+
+
+class TestGameFilter(unittest.TestCase):
+
+    def test_comparing_headers(self):
+        self.assertTrue(GameFilter('WhiteElo > 1800 and BlackElo >= 2012').matches(HEADERS))
+        self.assertFalse(GameFilter('WhiteElo >= 2000').matches(HEADERS))
+        self.assertTrue(GameFilter('Event == "Rated Blitz game"').matches(HEADERS))
+        self.assertTrue(GameFilter('Event in ("Rated Blitz game", "Rated Rapid game")').matches(HEADERS))
+        self.assertTrue(GameFilter('not Event != "Rated Blitz game"').matches(HEADERS))
+        self.assertTrue(GameFilter('1800 < WhiteElo < 1900 or Site == "x"').matches(HEADERS))
+
+    def test_derived_fields(self):
+        self.assertTrue(GameFilter('Base == 300 and Increment == 5').matches(HEADERS))
+        self.assertTrue(GameFilter('MinElo == 1876 and MaxElo == 2012').matches(HEADERS))
+        self.assertFalse(GameFilter('MinElo > 0').matches({"WhiteElo": "?", "BlackElo": "1500"}))
+        self.assertFalse(GameFilter('Base >= 0').matches({"TimeControl": "-"}))
+
+    def test_missing_headers_dont_match(self):
+        self.assertFalse(GameFilter('Termination != "Time forfeit"').matches(HEADERS))
+        self.assertFalse(GameFilter('WhiteElo > 1800').matches({"WhiteElo": "?"}))
+
+    def test_plies_are_counted_when_not_in_the_headers(self):
+        game_filter = GameFilter('Plies >= 40 and WhiteElo > 1800')
+        self.assertIsNone(game_filter.matches(HEADERS))
+        self.assertTrue(game_filter.matches(HEADERS, plies=40))
+        self.assertFalse(game_filter.matches(HEADERS, plies=39))
+        self.assertFalse(game_filter.matches(dict(HEADERS, PlyCount="20")))
+        self.assertFalse(GameFilter('Plies >= 40 and WhiteElo > 1900').matches(HEADERS))
+
+    def test_invalid_expressions(self):
+        for expression in ['WhiteElo >', '__import__("os")', 'WhiteElo + 1', 'x is None']:
+            with self.assertRaises(ValueError):
+                GameFilter(expression)
+
+    def test_expressions_that_arent_conditions(self):
+        for expression in ['WhiteElo', '1', '"a" and WhiteElo > 1', 'not BlackElo',
+                           'WhiteElo > 1 or Event', 'Event in (WhiteElo > 1, 2)']:
+            with self.assertRaises(ValueError):
+                GameFilter(expression)
+
+    def test_header_names(self):
+        game_filter = GameFilter('MinElo > 1800 and Base >= 600 and Site == "x"')
+        self.assertEqual(game_filter.header_names(), {"WhiteElo", "BlackElo", "TimeControl", "Site"})
+        self.assertFalse(can_filter_with_index(game_filter))
+        self.assertTrue(can_filter_with_index(GameFilter('MinElo > 1800 and Plies > 10')))
+
+    def test_reading_filtered_games(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        pgn_path = os.path.join(tmp_dir, "games.pgn")
+        with open(pgn_path, "w") as f:
+            for filename in FIXTURES:
+                with open(fixture_path(filename)) as fixture:
+                    f.write(fixture.read().strip() + "\n\n")
+        all_games = [game for _, game in read_games(pgn_path)]
+        white = all_games[1].headers["White"]
+        games = list(read_games(pgn_path, game_filter=GameFilter('White == "%s"' % white)))
+        self.assertIn(1, [game_id for game_id, _ in games])
+        for game_id, game in games:
+            self.assertEqual(game.headers["White"], white)
+            self.assertEqual(str(game), str(all_games[game_id]))
+        n_plies = [len(list(game.mainline_moves())) for game in all_games]
+        games = list(read_games(pgn_path, game_filter=GameFilter('Plies > %d' % min(n_plies))))
+        self.assertEqual(len(games), len([n for n in n_plies if n > min(n_plies)]))
+
+    def test_filtering_game_offsets(self):
+        index = PgnIndex.build(fixture_path("5-22-duskbreaker.pgn"))
+        self.assertEqual(len(list(game_offsets(index, game_filter=GameFilter('Base == 300')))), 1)
+        self.assertEqual(list(game_offsets(index, game_filter=GameFilter('Base == 60'))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import threading
+import unittest
+
+import chess
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.puzzle import Puzzle
+from puzzlemaker.workers import generate_puzzles
+from test.unit.fakes import FakeEngineTestCase
+
+
+class TestGeneratePuzzles(FakeEngineTestCase):
+
+    def configure(self, engines):
+        # analyses take a little while, so concurrent ones need more engines
+        self.configure_engines(engines=engines, delay=0.005)
+
+    def candidates(self):
+        puzzles = []
+        board = chess.Board()
+        for san in ["e4", "e5", "Nf3", "Nc6", "Bc4", "Nf6"]:
+            puzzles.append(Puzzle(board.copy(), board.parse_san(san)))
+            board.push_san(san)
+        return puzzles
+
+    def results(self, puzzles):
+        return [([position.board.fen() for position in puzzle.positions],
+                 puzzle.final_score, puzzle.is_complete())
+                for puzzle in puzzles]
+
+    def test_generating_candidates_in_parallel(self):
+        self.configure(engines=1)
+        sequential = self.candidates()
+        generate_puzzles(sequential, 2)
+        AnalysisEngine.quit()
+        self.engines = []
+
+        self.configure(engines=3)
+        parallel = self.candidates()
+        generate_puzzles(parallel, 2)
+        self.assertEqual(self.results(parallel), self.results(sequential))
+        self.assertGreater(len(self.engines), 1)
+        threads = set.union(*(engine.threads for engine in self.engines))
+        self.assertGreater(len(threads), 1)
+
+    def test_generating_candidates_sequentially_with_one_engine(self):
+        self.configure(engines=1)
+        generate_puzzles(self.candidates(), 2)
+        self.assertEqual(len(self.engines), 1)
+        self.assertEqual(self.engines[0].threads, {threading.current_thread().name})
+
+
+if __name__ == "__main__":
+    unittest.main()
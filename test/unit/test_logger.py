@@ -0,0 +1,46 @@
+import logging
+import unittest
+from unittest import mock
+
+from chess import Board, Move
+from chess.engine import Cp
+
+from puzzlemaker.colors import Color
+from puzzlemaker.logger import log, log_board, log_move
+
+
+class TestLogger(unittest.TestCase):
+
+    def setUp(self):
+        root = logging.getLogger()
+        level = root.level
+        self.addCleanup(root.setLevel, level)
+        self.root = root
+
+    def test_messages_are_not_formatted_when_debug_is_disabled(self):
+        self.root.setLevel(logging.INFO)
+        arg = mock.MagicMock()
+        board = mock.Mock()
+        with mock.patch("logging.debug") as debug:
+            log(Color.DIM, "%s", arg)
+            log_board(board)
+            log_move(board, Move.from_uci("e2e4"), Cp(10))
+        debug.assert_not_called()
+        arg.__str__.assert_not_called()
+        board.fen.assert_not_called()
+        board.san.assert_not_called()
+
+    def test_messages_are_formatted_when_debug_is_enabled(self):
+        self.root.setLevel(logging.DEBUG)
+        with mock.patch("logging.debug") as debug:
+            log(Color.DIM, "depth %d", 12)
+            log(Color.DIM, "100% literal")
+            log_move(Board(), Move.from_uci("e2e4"), Cp(10))
+        messages = [call.args[0] for call in debug.call_args_list]
+        self.assertEqual(messages[0], Color.DIM + "depth 12" + Color.ENDC)
+        self.assertEqual(messages[1], Color.DIM + "100% literal" + Color.ENDC)
+        self.assertIn("e4", messages[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
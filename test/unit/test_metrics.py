@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from puzzlemaker.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        Metrics.reset()
+        self.addCleanup(Metrics.reset)
+
+    def test_analyses_are_recorded_by_phase(self):
+        with Metrics.phase("scan"):
+            Metrics.record_analysis("best_move", 0.5, {"depth": 16, "nodes": 1000})
+            Metrics.record_analysis("best_move", 0.1, {"depth": 18}, cached=True)
+        Metrics.record_analysis("best_moves", 1.0, [{"depth": 22, "nodes": 5000}, {"depth": 22}])
+        self.assertEqual(Metrics.stats["scan"]["calls"], 1)
+        scan = Metrics.stats["scan/best_move"]
+        self.assertEqual(scan["calls"], 2)
+        self.assertEqual(scan["cache_hits"], 1)
+        self.assertEqual(scan["depth"], 34)
+        self.assertEqual(scan["nodes"], 1000)
+        self.assertAlmostEqual(scan["seconds"], 0.6)
+        self.assertAlmostEqual(scan["engine_seconds"], 0.5)
+        self.assertEqual(Metrics.stats["best_moves"]["nodes"], 5000)
+        self.assertIn("scan/best_move", Metrics.summary())
+
+    def test_analysis_totals_of_a_phase(self):
+        with Metrics.phase("generate"):
+            Metrics.record_analysis("best_moves", 1.0, {"depth": 20, "nodes": 5000})
+            Metrics.record_analysis("evaluate_move", 0.5, {"depth": 20, "nodes": 2000})
+            Metrics.record_pruned("short_mate", 3)
+        with Metrics.phase("scan"):
+            Metrics.record_analysis("best_move", 0.1, {"depth": 10, "nodes": 100})
+        totals = Metrics.analysis_totals("generate")
+        self.assertEqual(totals["calls"], 2)
+        self.assertEqual(totals["nodes"], 7000)
+        self.assertAlmostEqual(totals["seconds"], 1.5)
+        self.assertEqual(totals["searches_saved"], 0)
+
+    def test_analysis_totals_without_reused_analyses_or_speculations(self):
+        with Metrics.phase("generate"):
+            Metrics.record_analysis("best_move", 0.5, {"depth": 20})
+            Metrics.record_reused("played_move")
+            Metrics.record_speculation(used=True)
+            Metrics.record_speculation(used=False)
+        self.assertEqual(Metrics.analysis_totals("generate")["calls"], 1)
+
+    def test_timed_functions(self):
+        @Metrics.timed("generate")
+        def generate():
+            self.assertEqual(Metrics.current_phase(), "generate")
+            return 1
+        self.assertEqual(generate(), 1)
+        self.assertEqual(generate(), 1)
+        self.assertIsNone(Metrics.current_phase())
+        self.assertEqual(Metrics.stats["generate"]["calls"], 2)
+
+    def test_phases_of_concurrent_tasks(self):
+        @Metrics.timed("scan")
+        async def scan():
+            await asyncio.sleep(0.01)
+            Metrics.record_analysis("best_move", 0.1, {"depth": 10})
+
+        @Metrics.timed("generate")
+        async def generate():
+            await asyncio.sleep(0.005)
+            Metrics.record_analysis("best_moves", 0.1, {"depth": 12})
+
+        async def run():
+            await asyncio.gather(scan(), generate(), scan())
+        asyncio.run(run())
+        self.assertEqual(Metrics.stats["scan/best_move"]["calls"], 2)
+        self.assertEqual(Metrics.stats["generate/best_moves"]["calls"], 1)
+        self.assertIsNone(Metrics.current_phase())
+
+    def test_merging_metrics_from_workers(self):
+        Metrics.record_analysis("best_move", 1.0, {"depth": 10, "nodes": 100})
+        taken = Metrics.take()
+        self.assertEqual(Metrics.stats, {})
+        Metrics.merge(taken)
+        Metrics.merge(taken)
+        self.assertEqual(Metrics.stats["best_move"]["calls"], 2)
+        self.assertEqual(Metrics.stats["best_move"]["nodes"], 200)
+
+    def test_writing_a_metrics_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "metrics.json")
+        Metrics.record_analysis("best_move", 1.0, {"depth": 10, "nodes": 100})
+        Metrics.write(path, n_games=3)
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data["n_games"], 3)
+        self.assertEqual(data["phases"]["best_move"]["nodes"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
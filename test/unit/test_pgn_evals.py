@@ -0,0 +1,38 @@
+import io
+import unittest
+
+import chess
+import chess.pgn
+from chess.engine import Cp
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.puzzle_finder import find_puzzle_candidates
+
+ANNOTATED_PGN = """
+[Event "Rated Blitz game"]
+[Result "0-1"]
+
+1. e4 { [%eval 0.2] } 1... e5 { [%eval 0.2] } 2. Nf3 { [%eval 0.2] }
+2... Nc6 { [%eval 0.3] } 3. Bc4 { [%eval 0.2] } 3... Nd4 { [%eval 0.5] }
+4. Nxe5 { [%eval 0.3] } 4... Qg5 { [%eval -0.1,20] } 5. Nxf7 { [%eval -6.0,18] }
+5... Qxg2 { [%eval -6.2] } 0-1
+"""
+
+
+class TestPgnEvals(unittest.TestCase):
+
+    def test_scanning_with_pgn_evals(self):
+        game = chess.pgn.read_game(io.StringIO(ANNOTATED_PGN))
+        puzzles = find_puzzle_candidates(game, use_pgn_evals=True)
+        self.assertIsNone(AnalysisEngine.pool)
+        self.assertEqual(len(puzzles), 1)
+        puzzle = puzzles[0]
+        self.assertEqual(puzzle.initial_move, chess.Move.from_uci("e5f7"))
+        self.assertEqual(puzzle.initial_analysis.score, Cp(-10))
+        self.assertEqual(puzzle.initial_analysis.depth, 20)
+        self.assertEqual(puzzle.initial_move_analysis.score, Cp(-600))
+        self.assertEqual(puzzle.initial_move_analysis.depth, 18)
+
+
+if __name__ == '__main__':
+    unittest.main()
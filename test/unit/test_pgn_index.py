@@ -0,0 +1,127 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import chess.pgn
+
+from puzzlemaker.game_filter import GameFilter
+from puzzlemaker.pgn_reader import (
+    PgnIndex, read_games, read_game_at, read_game_texts, is_seekable, STDIN
+)
+
+FIXTURES = ["5-22-duskbreaker.pgn", "carlsen-anand-blunder.wc2014.pgn", "wtharvey.pgn"]
+
+
+def fixture_path(pgn_filename) -> str:
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(cur_dir, '..', 'fixtures', pgn_filename)
+
+
+class TestPgnIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pgn_path = os.path.join(self.tmp_dir, "games.pgn")
+        with open(self.pgn_path, "w") as f:
+            for filename in FIXTURES:
+                with open(fixture_path(filename)) as fixture:
+                    f.write(fixture.read().strip() + "\n\n")
+        with open(self.pgn_path) as f:
+            self.games = []
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                self.games.append(game)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_offsets_point_to_each_game(self):
+        index = PgnIndex.build(self.pgn_path)
+        self.assertEqual(len(index), len(self.games))
+        for offset, game in zip(index.offsets, self.games):
+            self.assertEqual(str(read_game_at(self.pgn_path, offset)), str(game))
+        self.assertEqual(index.headers[0]["WhiteElo"], "1876")
+        self.assertEqual(index.headers[0]["TimeControl"], "300+5")
+        self.assertNotIn("White", index.headers[0])
+
+    def test_sidecar_index_is_reused_until_the_pgn_changes(self):
+        index = PgnIndex.load_or_build(self.pgn_path)
+        self.assertTrue(os.path.exists(PgnIndex.sidecar_path(self.pgn_path)))
+        loaded = PgnIndex.load(self.pgn_path)
+        self.assertEqual(loaded.offsets, index.offsets)
+        self.assertEqual(loaded.headers, index.headers)
+        with open(self.pgn_path, "a") as f:
+            f.write(str(self.games[0]) + "\n\n")
+        self.assertIsNone(PgnIndex.load(self.pgn_path))
+        self.assertEqual(len(PgnIndex.load_or_build(self.pgn_path)), len(self.games) + 1)
+
+    def test_reading_a_range_of_games(self):
+        index = PgnIndex.build(self.pgn_path)
+        for i in [None, index]:
+            games = list(read_games(self.pgn_path, 1, 3, index=i))
+            self.assertEqual([game_id for game_id, _ in games], [1, 2])
+            self.assertEqual(
+                [str(game) for _, game in games],
+                [str(game) for game in self.games[1:3]]
+            )
+
+    def test_reading_the_text_of_games(self):
+        index = PgnIndex.build(self.pgn_path)
+        for i in [None, index]:
+            texts = list(read_game_texts(self.pgn_path, 1, 3, index=i))
+            self.assertEqual([game_id for game_id, _ in texts], [1, 2])
+            self.assertEqual(
+                [str(chess.pgn.read_game(io.StringIO(text))) for _, text in texts],
+                [str(game) for game in self.games[1:3]]
+            )
+        white = GameFilter('White == "%s"' % self.games[1].headers["White"])
+        texts = list(read_game_texts(self.pgn_path, game_filter=white))
+        self.assertEqual([game_id for game_id, _ in texts], [1])
+        # games without a PlyCount header are left to whoever parses them
+        texts = list(read_game_texts(self.pgn_path, game_filter=GameFilter("Plies > 1000")))
+        self.assertEqual([game_id for game_id, _ in texts], [0, 2])
+
+    def test_reading_compressed_pgns(self):
+        with open(self.pgn_path, "rb") as f:
+            pgn = f.read()
+        for extension, compress in [(".gz", gzip.compress), (".bz2", bz2.compress),
+                                    (".xz", lzma.compress)]:
+            path = self.pgn_path + extension
+            with open(path, "wb") as f:
+                f.write(compress(pgn))
+            self.assertFalse(is_seekable(path))
+            self.assertEqual(
+                [str(game) for _, game in read_games(path, 1)],
+                [str(game) for game in self.games[1:]]
+            )
+        self.assertTrue(is_seekable(self.pgn_path))
+
+    def test_reading_from_stdin(self):
+        with open(self.pgn_path, "rb") as f:
+            stdin = mock.Mock(buffer=io.BufferedReader(io.BytesIO(gzip.compress(f.read()))))
+        with mock.patch("sys.stdin", stdin):
+            self.assertFalse(is_seekable(STDIN))
+            games = list(read_games(STDIN))
+        self.assertEqual([str(game) for _, game in games], [str(game) for game in self.games])
+
+    def test_shards_cover_all_games(self):
+        index = PgnIndex.build(self.pgn_path)
+        shards = [index.shard(i, 3) for i in range(3)]
+        self.assertEqual(shards[0][0], 0)
+        self.assertEqual(shards[-1][1], len(index))
+        for (_, end), (start, _) in zip(shards, shards[1:]):
+            self.assertEqual(end, start)
+        with self.assertRaises(ValueError):
+            index.shard(3, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+from argparse import Namespace
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import chess.pgn
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.engine_replay import EngineRecording, RecordingEngine
+from puzzlemaker.pgn_reader import read_game_texts
+from puzzlemaker.workers import process_games, process_games_in_parallel, process_games_pipelined
+from test.unit.fakes import (
+    FakeAnalysisEngine, FakeEngineTestCase, by_material, material_score
+)
+
+GAMES = [
+    "1. e4 e5 2. Qh5 Nc6 3. Qxe5+ Nxe5 4. d4 Ng6 5. Bd3 d5 *",
+    "1. d4 d5 2. c4 e6 3. Nc3 Nf6 4. Bg5 Be7 *",
+    "1. e4 c5 2. Nf3 d6 3. d4 cxd4 4. Nxd4 Nf6 5. Nc3 a6 *",
+]
+
+
+def read_games():
+    return [(i, chess.pgn.read_game(io.StringIO(pgn))) for i, pgn in enumerate(GAMES)]
+
+
+def settings(**kwargs):
+    values = dict(
+        scan_depth=2, scan_nodes=None, scan_movetime=None, coarse_scan_depth=None,
+        search_depth=2, search_nodes=None, search_movetime=None,
+        pgn_evals=False, verify_multipv=False, scan_only=False, format="json",
+        workers=2, filter=None, quiet=True, cache=None, cache_size=None, threads=None,
+        memory=None, record=None, replay=None, stable_depths=None, scan_engines=None,
+    )
+    values.update(kwargs)
+    return Namespace(**values)
+
+
+class TestPipeline(FakeEngineTestCase):
+
+    def configure(self, engines, scan_engines=None):
+        # plays the move that wins the most material right away
+        self.configure_engines(
+            engines=engines, scan_engines=scan_engines, rank=by_material, score=material_score
+        )
+
+    def test_scanning_on_a_separate_pool(self):
+        self.configure(engines=1, scan_engines=1)
+        with AnalysisEngine.scanning():
+            scan_engine = AnalysisEngine.instance().checkout()
+        search_engine = AnalysisEngine.instance().checkout()
+        self.assertIsNot(scan_engine, search_engine)
+        self.assertEqual(len(self.engines), 2)
+
+    def test_scanner_threads_start_one_scan_pool(self):
+        self.configure(engines=1, scan_engines=2)
+        barrier = threading.Barrier(8)
+        pools = []
+
+        def scan():
+            barrier.wait()
+            with AnalysisEngine.scanning():
+                pools.append(AnalysisEngine.instance())
+        threads = [threading.Thread(target=scan) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(pools), 8)
+        self.assertTrue(all(pool is AnalysisEngine.scan_pool for pool in pools))
+
+    def test_scanning_shares_the_pool_without_scan_engines(self):
+        self.configure(engines=1)
+        with AnalysisEngine.scanning():
+            self.assertIs(AnalysisEngine.instance(), AnalysisEngine.pool)
+
+    def test_pipelined_results_match_processing_games_one_at_a_time(self):
+        self.configure(engines=1)
+        expected = list(process_games(read_games(), settings()))
+        AnalysisEngine.quit()
+
+        self.configure(engines=2, scan_engines=2)
+        results = list(process_games_pipelined(read_games(), settings()))
+        self.assertEqual(results, expected)
+        self.assertTrue(any(result.n_positions for result in results))
+        self.assertEqual([result.game_id for result in results], [0, 1, 2])
+        threads = set.union(*(engine.threads for engine in self.engines))
+        self.assertTrue(any(name.startswith("scan") for name in threads))
+        self.assertTrue(any(name.startswith("generate") for name in threads))
+
+    def test_pipeline_scan_only(self):
+        self.configure(engines=1, scan_engines=1)
+        results = list(process_games_pipelined(read_games(), settings(scan_only=True)))
+        self.assertEqual([result.puzzles for result in results], [[], [], []])
+        self.assertEqual(len(self.engines), 1)
+
+    def test_parallel_results_are_in_the_order_of_the_games(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        pgn_path = os.path.join(tmp_dir, "games.pgn")
+        with open(pgn_path, "w") as f:
+            for i, pgn in enumerate(GAMES):
+                f.write('[Event "Game %d"]\n\n%s\n\n' % (i, pgn))
+        # the worker processes replay what the fake engine found here
+        recording_path = os.path.join(tmp_dir, "analyses.jsonl")
+        recording = EngineRecording(recording_path)
+        AnalysisEngine.configure(engine_factory=lambda: RecordingEngine(
+            FakeAnalysisEngine(rank=by_material, score=material_score), recording
+        ))
+        games = [
+            (i, chess.pgn.read_game(io.StringIO(text))) for i, text in read_game_texts(pgn_path)
+        ]
+        expected = list(process_games(games, settings()))
+        AnalysisEngine.quit()
+
+        results = list(process_games_in_parallel(
+            read_game_texts(pgn_path), settings(pgn=pgn_path, replay=recording_path)
+        ))
+        self.assertEqual(
+            [(result.game_id, result.n_positions, result.puzzles) for result in results],
+            [(result.game_id, result.n_positions, result.puzzles) for result in expected],
+        )
+        self.assertTrue(any(result.n_positions for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import chess
+
+from puzzlemaker.analysis import run_analyses
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from puzzlemaker.puzzle_position import PuzzlePosition
+from test.unit.fakes import FakeEngineTestCase
+
+
+class TestPlayedMove(FakeEngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.configure_engines()
+        board = chess.Board()
+        board.push_san("e4")
+        # not the fake engine's best move, which is the first in UCI order
+        self.puzzle = Puzzle(board, board.parse_san("e5"))
+
+    def test_scoring_the_played_move_from_the_next_position(self):
+        self.puzzle.generate(2)
+        self.assertEqual(self.engines[0].n_root_moves_analyses, 0)
+        played_move = self.puzzle.analyzed_moves[1]
+        self.assertEqual(played_move.move, self.puzzle.initial_move)
+        self.assertEqual(played_move.score, self.puzzle.initial_position.score)
+        self.assertEqual(played_move.pv[0], self.puzzle.initial_move)
+        self.assertEqual(Metrics.stats["generate/reused/played_move"]["searches_saved"], 1)
+        self.assertIn("analyses saved by reusing other analyses", Metrics.summary())
+
+    def test_searching_the_played_move_without_a_score_for_the_next_position(self):
+        puzzle = self.puzzle
+        puzzle.initial_position = PuzzlePosition(puzzle.initial_board, puzzle.initial_move)
+        run_analyses(puzzle._analyze_played_initial_move(2))
+        self.assertEqual(self.engines[0].n_root_moves_analyses, 1)
+        self.assertEqual(puzzle.analyzed_moves[0].move, puzzle.initial_move)
+        self.assertNotIn("reused/played_move", Metrics.stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
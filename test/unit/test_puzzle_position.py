@@ -0,0 +1,62 @@
+import unittest
+
+import chess
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.constants import NUM_CANDIDATE_MOVES
+from puzzlemaker.puzzle_position import PuzzlePosition
+from test.unit.fakes import FakeAnalysisEngine, FakeEngineTestCase
+
+
+class DisagreeingEngine(FakeAnalysisEngine):
+    """ Finds the second best move of a multipv search as the best move
+        of a multipv 1 search
+    """
+    def analyse(self, board, limit, multipv=None, root_moves=None):
+        if multipv:
+            return super().analyse(board, limit, multipv, root_moves)
+        return super().analyse(board, limit, 2, root_moves)[1]
+
+
+class TestPuzzlePosition(FakeEngineTestCase):
+
+    def position(self):
+        board = chess.Board()
+        board.push_san("e4")
+        return PuzzlePosition(board, board.parse_san("e5"))
+
+    def evaluate(self, verify_multipv):
+        position = self.position()
+        position.evaluate(12, verify_multipv)
+        return position
+
+    def test_evaluating_with_a_single_multipv_search(self):
+        self.configure_engines()
+        position = self.evaluate(verify_multipv=False)
+        self.assertEqual(self.engines[0].n_analyses, 1)
+        self.assertEqual(len(position.candidate_moves), NUM_CANDIDATE_MOVES)
+        self.assertEqual(position.best_move, position.candidate_moves[0].move)
+        self.assertEqual(position.score, position.candidate_moves[0].score)
+        self.assertEqual(position.depth, 12)
+
+        # the same as searching with multipv 1 before the multipv search
+        verified = self.evaluate(verify_multipv=True)
+        self.assertEqual(self.engines[0].n_analyses, 3)
+        self.assertEqual(verified.best_move, position.best_move)
+        self.assertEqual(verified.score, position.score)
+        self.assertEqual(verified.candidate_moves, position.candidate_moves)
+
+    def test_verifying_with_a_multipv_1_search(self):
+        AnalysisEngine.configure(engine_factory=DisagreeingEngine)
+        position = self.evaluate(verify_multipv=True)
+        self.assertEqual(AnalysisEngine.instance().engines[0].n_analyses, 2)
+        # the best move and score of the multipv 1 search are used
+        self.assertEqual(position.best_move, position.candidate_moves[1].move)
+        self.assertEqual(position.score, position.candidate_moves[1].score)
+
+        position = self.evaluate(verify_multipv=False)
+        self.assertEqual(position.best_move, position.candidate_moves[0].move)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import chess
+
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from test.unit.fakes import FakeEngineTestCase, mate_score
+
+
+class TestPuzzlePruning(FakeEngineTestCase):
+    """ The fake engine finds a mate in 1 for the side to move in every
+        position
+    """
+    def setUp(self):
+        super().setUp()
+        self.configure_engines(score=mate_score)
+
+    def test_pruning_an_initial_move_that_ends_the_game(self):
+        board = chess.Board()
+        for move in ["f3", "e5", "g4"]:
+            board.push_san(move)
+        puzzle = Puzzle(board, board.parse_san("Qh4#"))
+        puzzle.generate(12)
+        self.assertEqual(puzzle.pruned, "game_over")
+        self.assertFalse(puzzle.is_complete())
+        self.assertEqual(self.engines, [])
+        self.assertEqual(Metrics.stats["generate/pruned/game_over"]["searches_saved"], 3)
+
+    def test_pruning_a_mate_too_short_for_a_puzzle(self):
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        puzzle = Puzzle(board)
+        puzzle.generate(12)
+        self.assertEqual(puzzle.pruned, "short_mate")
+        self.assertFalse(puzzle.is_complete())
+        self.assertEqual(len(puzzle.positions), 1)
+        self.assertEqual(Metrics.stats["generate/pruned/short_mate"]["searches_saved"], 1)
+        self.assertIn("analyses saved by pruning", Metrics.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import chess
+from chess.engine import Cp, Mate
+
+from puzzlemaker.analysis import AnalysisEngine
+from puzzlemaker.puzzle_exporter import CSV_COLUMNS
+from puzzlemaker.puzzle_sinks import PuzzleSink, export_puzzle
+
+HEADERS = {
+    "Event": "Rated Blitz game",
+    "Site": "https://lichess.org/abcdefgh",
+    "White": "alice, jr",
+    "WhiteElo": "1876",
+}
+
+
+def mock_puzzle() -> mock.Mock:
+    board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+    moves = ["d1d8"]
+    return mock.Mock(
+        initial_board=board,
+        positions=[mock.Mock(initial_move=chess.Move.from_uci(m)) for m in moves],
+        initial_score=Cp(300),
+        final_score=Mate(1),
+        **{"category.return_value": "Mate", "winner.return_value": "White"}
+    )
+
+
+class TestPuzzleSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(AnalysisEngine, "name", return_value="Stockfish 16")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_jsonl_output(self):
+        path = os.path.join(self.tmp_dir, "puzzles.jsonl")
+        with PuzzleSink("jsonl", path) as sink:
+            for _ in range(2):
+                sink.write(export_puzzle(mock_puzzle(), "jsonl", HEADERS))
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["fen"], "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        self.assertEqual(records[0]["moves"], ["d1d8"])
+        self.assertEqual(records[0]["category"], "Mate")
+        self.assertEqual(records[0]["winner"], "White")
+        self.assertEqual(records[0]["initial_score"], {"cp": 300})
+        self.assertEqual(records[0]["final_score"], {"mate": 1})
+        self.assertEqual(records[0]["engine"], "Stockfish 16")
+        self.assertEqual(records[0]["headers"], HEADERS)
+
+    def test_csv_output(self):
+        path = os.path.join(self.tmp_dir, "puzzles.csv")
+        with PuzzleSink("csv", path) as sink:
+            sink.write(export_puzzle(mock_puzzle(), "csv", HEADERS))
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(list(rows[0].keys()), CSV_COLUMNS)
+        self.assertEqual(rows[0]["Moves"], "d1d8")
+        self.assertEqual(rows[0]["InitialScore"], "300")
+        self.assertEqual(rows[0]["FinalScore"], "#1")
+        self.assertEqual(rows[0]["White"], "alice, jr")
+        self.assertEqual(rows[0]["BlackElo"], "")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            PuzzleSink("xml", os.path.join(self.tmp_dir, "puzzles.xml"))
+
+
+if __name__ == '__main__':
+    unittest.main()
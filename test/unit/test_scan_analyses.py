@@ -0,0 +1,70 @@
+import unittest
+
+import chess
+from chess.engine import Cp
+
+from puzzlemaker.analysis import AnalyzedMove, run_analyses
+from puzzlemaker.puzzle import Puzzle
+from test.unit.fakes import FakeEngineTestCase
+
+
+class TestScanAnalyses(FakeEngineTestCase):
+    """ Puzzles reuse the analyses made while scanning a game, instead of
+        searching the initial position and the played move again
+    """
+    def setUp(self):
+        super().setUp()
+        self.configure_engines()
+        self.board = chess.Board()
+        self.board.push_san("e4")
+        self.e5 = self.board.parse_san("e5")
+        self.c5 = self.board.parse_san("c5")
+        after_e5 = self.board.copy()
+        after_e5.push(self.e5)
+        self.nf3 = after_e5.parse_san("Nf3")
+
+    def puzzle(self, initial_move, depth):
+        """ A puzzle with scan analyses of this depth: c5 is the best move,
+            and Nf3 is the best reply to e5
+        """
+        return Puzzle(
+            self.board,
+            initial_move,
+            initial_analysis=AnalyzedMove(self.c5, "c5", Cp(-30), depth, [self.c5]),
+            initial_move_analysis=AnalyzedMove(self.nf3, "Nf3", Cp(40), depth, [self.nf3]),
+        )
+
+    def n_analyses(self):
+        return sum(engine.n_analyses for engine in self.engines)
+
+    def test_analyses_deep_enough_are_reused(self):
+        puzzle = self.puzzle(self.e5, 16)
+        score_played_move = run_analyses(puzzle._analyze_initial_moves(12))
+        self.assertFalse(score_played_move)
+        self.assertEqual(self.n_analyses(), 0)
+        self.assertEqual(puzzle.initial_score, Cp(-30))
+        best_move, played_move = puzzle.analyzed_moves
+        self.assertEqual(best_move.move, self.c5)
+        self.assertEqual(played_move.move, self.e5)
+        self.assertEqual(played_move.score, Cp(40))
+        self.assertEqual(played_move.pv, [self.e5, self.nf3])
+
+    def test_analyses_too_shallow_are_searched_again(self):
+        puzzle = self.puzzle(self.e5, 8)
+        score_played_move = run_analyses(puzzle._analyze_initial_moves(12))
+        # the played move is scored after the search of the next position
+        self.assertTrue(score_played_move)
+        self.assertEqual(self.n_analyses(), 1)
+        self.assertEqual(len(puzzle.analyzed_moves), 1)
+        self.assertEqual(puzzle.analyzed_moves[0].depth, 12)
+
+    def test_played_move_that_was_the_best_move(self):
+        puzzle = self.puzzle(self.c5, 16)
+        score_played_move = run_analyses(puzzle._analyze_initial_moves(12))
+        self.assertFalse(score_played_move)
+        self.assertEqual(self.n_analyses(), 0)
+        self.assertEqual([move.move for move in puzzle.analyzed_moves], [self.c5])
+
+
+if __name__ == "__main__":
+    unittest.main()
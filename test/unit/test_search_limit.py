@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import chess
+from chess.engine import Cp, Limit
+
+from puzzlemaker.analysis import (
+    AnalysisEngine, AnalyzedMove, search_limit, limit_depth, format_limit
+)
+from puzzlemaker.eval_cache import EvalCache
+from puzzlemaker.puzzle import _is_deep_enough
+from test.unit.fakes import FakeAnalysisEngine
+
+
+class TestSearchLimit(unittest.TestCase):
+
+    def test_depth_only_limits_are_depths(self):
+        self.assertEqual(search_limit(16), 16)
+        self.assertEqual(search_limit(16, None, None), 16)
+
+    def test_nodes_and_movetime_limits(self):
+        self.assertEqual(search_limit(16, nodes=100000), Limit(depth=16, nodes=100000))
+        self.assertEqual(search_limit(0, movetime=0.5), Limit(time=0.5))
+        self.assertEqual(limit_depth(16), 16)
+        self.assertEqual(limit_depth(Limit(depth=16, nodes=100000)), 16)
+        self.assertIsNone(limit_depth(Limit(nodes=100000)))
+
+    def test_format_limit(self):
+        self.assertEqual(format_limit(22), "depth 22")
+        self.assertEqual(format_limit(Limit(nodes=100000)), "nodes 100000")
+        self.assertEqual(
+            format_limit(Limit(depth=22, nodes=100000, time=0.5)),
+            "depth 22, nodes 100000, movetime 0.5s"
+        )
+
+    def test_earlier_analyses_are_only_reused_for_depth_limits(self):
+        analyzed_move = AnalyzedMove(None, None, Cp(0), 18)
+        self.assertTrue(_is_deep_enough(analyzed_move, 16))
+        self.assertTrue(_is_deep_enough(analyzed_move, Limit(depth=16, nodes=100000)))
+        self.assertFalse(_is_deep_enough(analyzed_move, 20))
+        self.assertFalse(_is_deep_enough(analyzed_move, Limit(nodes=100000)))
+
+
+class TestAnalysisEngineLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.engine = FakeAnalysisEngine()
+        AnalysisEngine.configure(
+            cache=EvalCache(os.path.join(self.tmp_dir, "evals.sqlite")),
+            engine_factory=lambda: self.engine,
+        )
+
+    def tearDown(self):
+        AnalysisEngine.configure()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_limits_are_passed_to_the_engine(self):
+        board = chess.Board()
+        AnalysisEngine.best_move(board, 12)
+        AnalysisEngine.best_move(board, Limit(nodes=5000))
+        self.assertEqual(self.engine.limits, [Limit(depth=12), Limit(nodes=5000)])
+
+    def test_only_depth_limited_analyses_are_cached(self):
+        board = chess.Board()
+        AnalysisEngine.best_move(board, 12)
+        AnalysisEngine.best_move(board, 12)
+        self.assertEqual(self.engine.n_analyses, 1)
+        AnalysisEngine.best_move(board, Limit(depth=12, nodes=5000))
+        AnalysisEngine.best_move(board, Limit(depth=12, nodes=5000))
+        self.assertEqual(self.engine.n_analyses, 3)
+        self.assertEqual(len(AnalysisEngine.cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
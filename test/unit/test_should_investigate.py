@@ -3,7 +3,7 @@ import unittest
 from chess import Board
 from chess.engine import Cp, Mate
 
-from puzzlemaker.puzzle_finder import should_investigate
+from puzzlemaker.puzzle_finder import should_investigate, might_investigate
 
 board = Board()
 
@@ -142,5 +142,31 @@ class TestShouldInvestigate(unittest.TestCase):
         self.assertFalse(should_investigate(a, b, board))
 
 
+class TestMightInvestigate(unittest.TestCase):
+
+    def test_might_investigate_scores_near_thresholds(self):
+        margin = 50
+        errors = [-50, -25, 0, 25, 50]
+        for a in range(-600, 601, 20):
+            for b in range(-600, 601, 20):
+                if might_investigate(Cp(a), Cp(b), board, margin):
+                    continue
+                for da in errors:
+                    for db in errors:
+                        if abs(db - da) > margin:
+                            continue
+                        self.assertFalse(
+                            should_investigate(Cp(a + da), Cp(b + db), board),
+                            "%d, %d" % (a + da, b + db)
+                        )
+
+    def test_not_investigating_scores_far_from_thresholds(self):
+        self.assertFalse(might_investigate(Cp(20), Cp(40), board))
+        self.assertFalse(might_investigate(Cp(400), Cp(350), board))
+        self.assertFalse(might_investigate(Mate(3), Mate(2), board))
+        self.assertTrue(might_investigate(Cp(20), Cp(120), board))
+        self.assertTrue(might_investigate(Cp(400), Mate(-3), board))
+
+
 if __name__ == '__main__':
     unittest.main()
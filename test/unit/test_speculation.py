@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+
+import chess
+from chess.engine import EngineTerminatedError
+
+from puzzlemaker.analysis import AnalysisEngine, AnalysisRequest, run_analyses
+from puzzlemaker.metrics import Metrics
+from puzzlemaker.puzzle import Puzzle
+from test.unit.fakes import FakeEngineTestCase, clear_best_move_until
+
+
+class TestSpeculation(FakeEngineTestCase):
+
+    def configure(self, engines):
+        # principal variations continue with the reply the engine finds
+        # best, so the next position can be predicted
+        self.configure_engines(
+            engines=engines, score=clear_best_move_until(10), pv_length=2
+        )
+
+    def generate(self, speculate):
+        board = chess.Board()
+        for san in ["e4", "e5", "Nf3"]:
+            board.push_san(san)
+        puzzle = Puzzle(board, board.parse_san("Nc6"))
+        puzzle.generate(2, speculate=speculate)
+        return [position.board.fen() for position in puzzle.positions], puzzle.final_score
+
+    def test_speculative_searches_are_used(self):
+        self.configure(engines=2)
+        expected = self.generate(speculate=False)
+        self.assertEqual(self.generate(speculate=True), expected)
+        self.assertGreater(Metrics.stats["generate/speculative/used"]["calls"], 0)
+
+    def test_no_speculation_with_one_engine(self):
+        self.configure(engines=1)
+        self.generate(speculate=True)
+        self.assertFalse(any("speculative" in key for key in Metrics.stats))
+
+    def test_unused_speculations_are_wasted(self):
+        self.configure(engines=2)
+        board = chess.Board()
+        other = chess.Board()
+        other.push_san("e4")
+
+        def steps():
+            yield AnalysisRequest("speculate", (AnalysisRequest("best_move", (other, 2)),))
+            best_move = yield AnalysisRequest("best_move", (board, 2))
+            return best_move.move
+
+        self.assertEqual(run_analyses(steps()), chess.Move.from_uci("a2a3"))
+        self.assertEqual(Metrics.stats["speculative/wasted"]["calls"], 1)
+        self.assertNotIn("speculative/used", Metrics.stats)
+
+    def test_unused_speculations_finish_with_the_steps(self):
+        self.configure_engines(engines=2, delay=0.05)
+        board = chess.Board()
+        other = chess.Board()
+        other.push_san("e4")
+
+        def steps():
+            yield AnalysisRequest("speculate", (AnalysisRequest("best_move", (other, 2)),))
+            yield AnalysisRequest("speculate", (AnalysisRequest("best_move", (other, 3)),))
+            return None
+
+        run_analyses(steps())
+        # the speculation running was waited for, and the other cancelled
+        n_analyses = sum(engine.n_analyses for engine in self.engines)
+        self.assertLessEqual(n_analyses, 1)
+        time.sleep(0.1)
+        self.assertEqual(sum(engine.n_analyses for engine in self.engines), n_analyses)
+        self.assertFalse(any(
+            thread.name.startswith("speculate") for thread in threading.enumerate()
+        ))
+        self.assertEqual(Metrics.stats["speculative/wasted"]["calls"], 2)
+
+    def test_no_engines_are_started_after_quitting(self):
+        self.configure_engines(engines=2)
+        AnalysisEngine.quit()
+        with self.assertRaises(EngineTerminatedError):
+            AnalysisEngine.best_move(chess.Board(), 2)
+        self.assertIsNone(AnalysisEngine.pool)
+        self.assertEqual(self.engines, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import chess
+from chess.engine import Cp, Limit, PovScore
+
+from puzzlemaker.analysis import AnalysisEngine, analyse_until_stable
+from puzzlemaker.eval_cache import EvalCache
+
+
+class StreamingAnalysis(object):
+
+    def __init__(self, infos):
+        self.infos = infos
+        self.stopped = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        for info in self.infos:
+            if self.stopped:
+                return
+            yield info
+
+    def stop(self):
+        self.stopped = True
+
+
+class StreamingEngine(object):
+    """ Streams multipv lines for each depth with scores from `scores`,
+        e.g. {1: [50, 40], 2: [300, 40]} for the scores at depths 1 and 2
+    """
+    def __init__(self, board, scores):
+        self.id = {"name": "Streaming Engine"}
+        self.board = board
+        self.scores = scores
+        self.analysis_result = None
+        self.n_analyses = 0
+
+    def analysis(self, board, limit, multipv=1):
+        self.n_analyses += 1
+        moves = sorted(board.legal_moves, key=lambda m: m.uci())
+        infos = []
+        for depth in range(1, limit.depth + 1):
+            scores = self.scores.get(depth, self.scores[max(self.scores)])
+            for i, score in enumerate(scores[:multipv]):
+                infos.append({
+                    "multipv": i + 1,
+                    "depth": depth,
+                    "score": PovScore(Cp(score), board.turn),
+                    "pv": [moves[i]],
+                })
+        self.analysis_result = StreamingAnalysis(infos)
+        return self.analysis_result
+
+    def analyse(self, board, limit, multipv=None):
+        lines = list(self.analysis(board, limit, multipv or 1))[-(multipv or 1):]
+        return lines if multipv else lines[0]
+
+
+class TestAnalyseUntilStable(unittest.TestCase):
+
+    def setUp(self):
+        self.board = chess.Board()
+
+    def test_stopping_once_the_verdict_is_stable(self):
+        # unclear until depth 4, then a clear best move
+        engine = StreamingEngine(self.board, {
+            1: [50, 40, 30], 2: [400, 40, 30], 3: [50, 40, 30], 4: [400, 40, 30]
+        })
+        infos = analyse_until_stable(
+            engine, self.board, Limit(depth=20), 3, multipv=3, min_depth=2
+        )
+        self.assertTrue(engine.analysis_result.stopped)
+        self.assertEqual(len(infos), 3)
+        self.assertEqual([info["depth"] for info in infos], [6, 6, 6])
+        self.assertEqual(infos[0]["score"].white(), Cp(400))
+
+    def test_not_stopping_before_min_depth(self):
+        engine = StreamingEngine(self.board, {1: [400, 40, 30]})
+        infos = analyse_until_stable(
+            engine, self.board, Limit(depth=20), 2, multipv=3, min_depth=10
+        )
+        self.assertEqual(infos[0]["depth"], 10)
+
+    def test_searching_to_the_limit_if_never_stable(self):
+        scores = {depth: [400, 40, 30] if depth % 2 else [50, 40, 30] for depth in range(1, 13)}
+        engine = StreamingEngine(self.board, scores)
+        infos = analyse_until_stable(
+            engine, self.board, Limit(depth=12), 2, multipv=3, min_depth=1
+        )
+        self.assertFalse(engine.analysis_result.stopped)
+        self.assertEqual(infos[0]["depth"], 12)
+
+    def test_engines_that_cant_stream_search_to_the_limit(self):
+        class Engine(object):
+            def analyse(self, board, limit, multipv=None):
+                return [{"depth": limit.depth}] * multipv
+        infos = analyse_until_stable(Engine(), self.board, Limit(depth=12), 2, multipv=3)
+        self.assertEqual(infos, [{"depth": 12}] * 3)
+
+
+class TestStableAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.board = chess.Board()
+        self.engine = StreamingEngine(self.board, {1: [400, 40]})
+        AnalysisEngine.configure(
+            cache=EvalCache(os.path.join(self.tmp_dir, "evals.sqlite")),
+            engine_factory=lambda: self.engine,
+            stable_depths=2,
+        )
+
+    def tearDown(self):
+        AnalysisEngine.configure()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stable_analyses_are_found_in_the_cache(self):
+        first = AnalysisEngine.best_moves(self.board, 20, multipv=2)
+        self.assertTrue(self.engine.analysis_result.stopped)
+        self.assertLess(first[0].depth, 20)
+        second = AnalysisEngine.best_moves(self.board, 20, multipv=2)
+        self.assertEqual(self.engine.n_analyses, 1)
+        self.assertEqual(second, first)
+
+    def test_stable_analyses_arent_found_by_full_searches(self):
+        stable = AnalysisEngine.best_moves(self.board, 20, multipv=2)
+        self.assertLess(stable[0].depth, 20)
+        AnalysisEngine.configure(cache=AnalysisEngine.cache, engine_factory=lambda: self.engine)
+        full = AnalysisEngine.best_moves(self.board, 20, multipv=2)
+        self.assertEqual(self.engine.n_analyses, 2)
+        self.assertEqual([analyzed_move.depth for analyzed_move in full], [20, 20])
+
+
+if __name__ == "__main__":
+    unittest.main()